@@ -0,0 +1,137 @@
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing work that cannot be served in time.
+
+    `status` is 429 when the wait queue is full and 503 when the request's
+    deadline would pass (or has passed) before a worker is free.
+    `retry_after` is the estimated seconds until there is room again.
+    """
+
+    def __init__(self, reason: str, status: int, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, int(math.ceil(self.retry_after))))
+
+
+class AdmissionController:
+    """Bounded executor for blocking model calls from async handlers.
+
+    At most `max_concurrency` calls run at once on a private thread pool and at
+    most `max_queue` more wait for a slot. A request is rejected immediately if
+    the queue is full (429) or if the expected wait, from a moving average of
+    call durations, already exceeds `deadline_s` (503); a queued request that
+    is still waiting when its deadline passes is rejected as well (503).
+    Rejected work is never started, so admitted requests keep their latency.
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 32, deadline_s: float = 1.0):
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency must be >= 1')
+        self.max_concurrency = int(max_concurrency)
+        self.max_queue = max(0, int(max_queue))
+        self.deadline = float(deadline_s)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='moodcam-infer')
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self._avg_s = 0.0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_deadline = 0
+
+    def _estimated_wait(self, pending: int) -> float:
+        # Calls ahead of us beyond the free slots drain max_concurrency per average call
+        ahead = pending - self.max_concurrency + 1
+        if ahead <= 0:
+            return 0.0
+        return self._avg_s * math.ceil(ahead / self.max_concurrency)
+
+    def _record(self, seconds: float) -> None:
+        with self._lock:
+            self._avg_s = seconds if self._avg_s == 0.0 else 0.9 * self._avg_s + 0.1 * seconds
+
+    def _abandon(self, acquire: 'asyncio.Future[bool]') -> None:
+        """Give up on a queued acquire, handing back the permit if it was granted meanwhile."""
+        if not acquire.done():
+            # Semaphore.acquire returns a permit it is granted while being cancelled
+            acquire.cancel()
+        elif not acquire.cancelled() and acquire.exception() is None:
+            self._semaphore.release()
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run `fn(*args)` on the pool, or raise Overloaded without running it."""
+        if self._semaphore is None:
+            # Created on first use so it binds to the server's event loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        with self._lock:
+            pending = self._running + self._waiting
+            if pending >= self.max_concurrency + self.max_queue:
+                self.rejected_full += 1
+                raise Overloaded('queue full', 429, self._estimated_wait(pending))
+            expected = self._estimated_wait(pending)
+            if expected > self.deadline:
+                self.rejected_deadline += 1
+                raise Overloaded('deadline', 503, expected)
+            self._waiting += 1
+        # Not wait_for: before Python 3.12 it can time out or be cancelled after the
+        # acquire succeeded, and that permit would never be released
+        acquire = asyncio.ensure_future(self._semaphore.acquire())
+        try:
+            done, _ = await asyncio.wait((acquire,), timeout=self.deadline)
+        except BaseException:
+            # Client went away while queued
+            self._abandon(acquire)
+            with self._lock:
+                self._waiting -= 1
+            raise
+        if not done:
+            self._abandon(acquire)
+            with self._lock:
+                self._waiting -= 1
+                self.rejected_deadline += 1
+                expected = self._estimated_wait(self._running + self._waiting)
+            raise Overloaded('deadline', 503, expected)
+        with self._lock:
+            self._waiting -= 1
+            self._running += 1
+            self.admitted += 1
+        t0 = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._record(time.perf_counter() - t0)
+            with self._lock:
+                self._running -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'max_queue': self.max_queue,
+                'deadline_s': self.deadline,
+                'running': self._running,
+                'waiting': self._waiting,
+                'avg_call_ms': self._avg_s * 1000.0,
+                'admitted': self.admitted,
+                'rejected_full': self.rejected_full,
+                'rejected_deadline': self.rejected_deadline,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
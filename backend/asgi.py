@@ -0,0 +1,444 @@
+"""Async (ASGI) entry point with the same routes as link.py plus load shedding.
+
+The model registry, batching engines, prediction cache and request helpers
+come from service.py, shared with link.py; Flask is not needed. Handlers never
+block the event loop: decoding and inference run on a bounded executor
+(admission.AdmissionController). When more requests arrive than it can serve
+within the deadline they are rejected right away with 429 (queue full) or 503
+(deadline) and a Retry-After header, instead of queueing and slowing down
+every admitted request.
+
+Usage (from backend/):
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+
+Environment:
+    MOODCAM_MAX_CONCURRENCY     model calls running at once (default: MOODCAM_MAX_BATCH_SIZE)
+    MOODCAM_MAX_QUEUE           requests waiting for a slot before 429 (default 32)
+    MOODCAM_QUEUE_DEADLINE_MS   longest wait for a slot before 503 (default 1000)
+
+/predict/bulk streams its results and is bounded by service.bulk_pool
+(MOODCAM_BULK_WORKERS) rather than by admission control.
+"""
+import asyncio
+import base64
+import contextlib
+import functools
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.datastructures import UploadFile
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+import metrics
+import service
+from admission import AdmissionController, Overloaded
+from coalescing import Superseded
+from model_registry import ModelNotFound
+from service import (
+    ImageDecodeError, coalescer, decode_base64, keyframe_gate, logger, model_error_message, parse_roi,
+    predict_image_bytes, prediction_response, registry, roi_bbox, stream_response,
+)
+from streaming import StreamSession
+
+admission = AdmissionController(
+    max_concurrency=int(os.environ.get('MOODCAM_MAX_CONCURRENCY', str(service.MAX_BATCH_SIZE))),
+    max_queue=int(os.environ.get('MOODCAM_MAX_QUEUE', '32')),
+    deadline_s=float(os.environ.get('MOODCAM_QUEUE_DEADLINE_MS', '1000')) / 1000.0,
+)
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+def _error(message: str, status: int) -> JSONResponse:
+    return JSONResponse({'error': message}, status_code=status)
+
+
+def _serialize(payload: dict) -> JSONResponse:
+    with metrics.STAGE_SECONDS.time(stage='serialize'):
+        return JSONResponse(payload)
+
+
+def _endpoint(name: str) -> Callable[[Handler], Handler]:
+    """Record request metrics under the same endpoint names as link.py and shed overload."""
+    def decorate(handler: Handler) -> Handler:
+        @functools.wraps(handler)
+        async def wrapper(request: Request) -> Response:
+            metrics.IN_FLIGHT.inc(endpoint=name)
+            t0 = time.perf_counter()
+
+            def finish() -> None:
+                metrics.IN_FLIGHT.dec(endpoint=name)
+                metrics.REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint=name)
+
+            try:
+                response = await handler(request)
+            except Overloaded as e:
+                metrics.LOAD_SHED.inc(endpoint=name, reason=e.reason)
+                response = JSONResponse(
+                    {'error': 'Server overloaded, retry later', 'reason': e.reason},
+                    status_code=e.status, headers={'Retry-After': e.retry_after_header},
+                )
+            except BaseException:
+                finish()
+                raise
+            if isinstance(response, StreamingResponse) and response.background is None:
+                # The body is still being produced; count the request until it has been sent
+                response.background = BackgroundTask(finish)
+            else:
+                finish()
+            metrics.REQUESTS.inc(endpoint=name, status=str(response.status_code))
+            if response.status_code >= 400:
+                metrics.ERRORS.inc(endpoint=name)
+            return response
+        return wrapper
+    return decorate
+
+
+def _superseded(endpoint: str) -> JSONResponse:
+    metrics.SUPERSEDED.inc(endpoint=endpoint)
+    return JSONResponse({'superseded': True})
+
+
+def _model_name(request: Request) -> Optional[str]:
+    return request.query_params.get('model') or request.headers.get('x-model') or None
+
+
+def _uses_model(handler: Handler) -> Handler:
+    """Lease the requested model for the duration of the handler as `request.state.model`."""
+    @functools.wraps(handler)
+    async def wrapper(request: Request) -> Response:
+        try:
+            resident = registry.acquire(_model_name(request))
+        except ModelNotFound as e:
+            return _error(model_error_message(e), service.model_error_status())
+        request.state.model = resident
+        try:
+            return await handler(request)
+        finally:
+            registry.release(resident)
+    return wrapper
+
+
+async def _json(request: Request) -> Optional[Any]:
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+
+async def _request_image_bytes(request: Request) -> Optional[bytes]:
+    """Raw image bytes of a binary or multipart request (file field `image`, else the first file)."""
+    content_type = request.headers.get('content-type', '')
+    if content_type.startswith('multipart/form-data'):
+        form = await request.form()
+        f = form.get('image')
+        if not isinstance(f, UploadFile):
+            f = next((v for v in form.values() if isinstance(v, UploadFile)), None)
+        if f is None:
+            return None
+        return await f.read()
+    return await request.body()
+
+
+async def _predict(image_bytes: bytes, request: Request, endpoint: str, roi=None) -> JSONResponse:
+    """Classify with the request's model; frames are coalesced per X-Client-Id as in link.py."""
+    try:
+        with coalescer.frame(request.headers.get('x-client-id')) as should_run:
+            label, prob, bbox = await admission.run(predict_image_bytes, image_bytes, request.state.model, should_run)
+        return _serialize(prediction_response(label, prob, roi_bbox(bbox, roi)))
+    except Superseded:
+        return _superseded(endpoint)
+    except (Overloaded, ImageDecodeError):
+        raise
+    except Exception as e:
+        logger.exception("Prediction error: %s", e)
+        return _error(f'Error during model prediction: {str(e)}', 500)
+
+
+@_endpoint('healthz')
+async def healthz(request: Request) -> Response:
+    status = 'ok' if registry.default_name is not None else 'model-not-loaded'
+    return JSONResponse({
+        'status': status,
+        'startup': service.startup,
+        'cache': service.prediction_cache.stats(),
+        'models': registry.stats(),
+        'coalescing': {'active_clients': coalescer.active_clients()},
+        'admission': admission.stats(),
+        'capabilities': service.default_capabilities(),
+    })
+
+
+@_endpoint('capabilities')
+@_uses_model
+async def capabilities(request: Request) -> Response:
+    return JSONResponse(service.capabilities(request.state.model))
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(metrics.REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+
+@_endpoint('predict_base64')
+@_uses_model
+async def predict_base64(request: Request) -> Response:
+    data = await _json(request)
+    if not data or 'image_base64' not in data:
+        return _error('Missing image_base64', 400)
+    try:
+        image_bytes = decode_base64(data['image_base64'])
+    except Exception as e:
+        return _error(f'Error decoding image: {str(e)}', 400)
+    try:
+        roi = parse_roi(data.get('roi_offset'), data.get('roi_scale'))
+    except (TypeError, ValueError) as e:
+        return _error(f'Invalid ROI: {str(e)}', 400)
+    try:
+        return await _predict(image_bytes, request, 'predict_base64', roi)
+    except ImageDecodeError as e:
+        return _error(str(e), 400)
+
+
+@_endpoint('predict_binary')
+@_uses_model
+async def predict_binary(request: Request) -> Response:
+    try:
+        buf = await _request_image_bytes(request)
+    except Exception as e:
+        return _error(f'Error decoding image: {str(e)}', 400)
+    if not buf:
+        return _error('Missing image data', 400)
+    try:
+        roi = parse_roi(request.query_params.get('roi_offset'), request.query_params.get('roi_scale'))
+    except (TypeError, ValueError) as e:
+        return _error(f'Invalid ROI: {str(e)}', 400)
+    try:
+        return await _predict(buf, request, 'predict_binary', roi)
+    except ImageDecodeError as e:
+        return _error(str(e), 400)
+
+
+@_endpoint('predict_faces')
+@_uses_model
+async def predict_faces(request: Request) -> Response:
+    try:
+        if request.headers.get('content-type', '').startswith('application/json'):
+            data = await _json(request)
+            if not data or 'image_base64' not in data:
+                return _error('Missing image_base64', 400)
+            buf = decode_base64(data['image_base64'])
+        else:
+            buf = await _request_image_bytes(request)
+        max_faces = request.query_params.get('max_faces')
+        max_faces = int(max_faces) if max_faces else None
+    except Exception as e:
+        return _error(f'Error decoding image: {str(e)}', 400)
+    if not buf:
+        return _error('Missing image data', 400)
+    try:
+        faces = await admission.run(service.predict_faces_bytes, buf, request.state.model, max_faces)
+    except ImageDecodeError as e:
+        return _error(str(e), 400)
+    except Overloaded:
+        raise
+    except Exception as e:
+        logger.exception("Prediction error: %s", e)
+        return _error(f'Error during model prediction: {str(e)}', 500)
+    return _serialize(service.faces_response(faces))
+
+
+@_endpoint('analyze_frame')
+@_uses_model
+async def analyze_frame(request: Request) -> Response:
+    data = await _json(request)
+    if not data or 'image' not in data:
+        return _error('No image data provided in the request', 400)
+    try:
+        header, encoded = data['image'].split(",", 1)
+        image_data = decode_base64(encoded)
+    except Exception as e:
+        return _error(f'Error decoding image: {str(e)}', 400)
+    try:
+        with coalescer.frame(request.headers.get('x-client-id')) as should_run:
+            label, prob, bbox = await admission.run(predict_image_bytes, image_data, request.state.model, should_run)
+    except Superseded:
+        return _superseded('analyze_frame')
+    except ImageDecodeError as e:
+        return _error(str(e), 400)
+    except Overloaded:
+        raise
+    except Exception as e:
+        return _error(f'Error during model prediction: {str(e)}', 500)
+    metrics.record_prediction(bbox is not None)
+    return _serialize({'prediction': label, 'confidence': float(prob)})
+
+
+async def _bulk_items(request: Request):
+    """Same inputs as link._bulk_items; spooling and zip parsing run off the event loop."""
+    content_type = request.headers.get('content-type', '')
+    if content_type.startswith('multipart/form-data'):
+        form = await request.form()
+        files = [(f.filename or key, f.content_type or '', f.file)
+                 for key, f in form.multi_items() if isinstance(f, UploadFile)]
+        return await run_in_threadpool(service.multipart_items, files)
+    spooled = await run_in_threadpool(service.spool_body)
+    async for chunk in request.stream():
+        # Writes go to disk once the body outgrows the in-memory spool
+        await run_in_threadpool(spooled.write, chunk)
+    return await run_in_threadpool(service.zip_body_items, spooled, content_type.split(';')[0].strip())
+
+
+@_endpoint('predict_bulk')
+async def predict_bulk(request: Request) -> Response:
+    """Same as link.predict_bulk: NDJSON results streamed as each image finishes."""
+    try:
+        resident = registry.acquire(_model_name(request))
+    except ModelNotFound as e:
+        return _error(model_error_message(e), service.model_error_status())
+    try:
+        items = await _bulk_items(request)
+    except Exception as e:
+        registry.release(resident)
+        return _error(str(e), 400)
+
+    async def body():
+        # The lease is held until the stream ends or the client goes away
+        lines = service.bulk_lines(items, resident)
+        try:
+            async for line in iterate_in_threadpool(lines):
+                yield line
+        finally:
+            # Cancels images not yet started; ValueError if a thread is still inside the generator
+            with contextlib.suppress(ValueError):
+                lines.close()
+            registry.release(resident)
+
+    return StreamingResponse(body(), media_type='application/x-ndjson')
+
+
+async def stream(ws: WebSocket) -> None:
+    """Same protocol as link.stream. Sessions drop stale frames themselves, so they bypass admission."""
+    await ws.accept()
+    try:
+        resident = registry.acquire(ws.query_params.get('model') or None)
+    except ModelNotFound as e:
+        await ws.send_text(json.dumps({'error': model_error_message(e)}))
+        await ws.close()
+        return
+
+    loop = asyncio.get_running_loop()
+
+    def send(payload: dict) -> None:
+        # Called from the session thread; waiting for the send keeps one message in flight
+        asyncio.run_coroutine_threadsafe(ws.send_text(json.dumps(payload)), loop).result()
+
+    def on_result(frame_id, prediction, info):
+        send(stream_response(frame_id, prediction, info))
+
+    def on_error(frame_id, message):
+        try:
+            send({'error': message, 'frame_id': frame_id})
+        except Exception:
+            pass
+
+    session = StreamSession(
+        resident.engine, on_result, on_error, keyframe_gate(ws.query_params.get('keyframes')), resident.decoder,
+    )
+    try:
+        while True:
+            msg = await ws.receive()
+            if msg['type'] == 'websocket.disconnect':
+                break
+            if msg.get('bytes') is not None:
+                session.push(msg['bytes'])
+                continue
+            try:
+                data = json.loads(msg.get('text') or '')
+                b64 = data['image_base64']
+                if ',' in b64:
+                    b64 = b64.split(',', 1)[1]
+                frame_id = data.get('frame_id')
+                session.push(base64.b64decode(b64), int(frame_id) if frame_id is not None else None)
+            except Exception as e:
+                await ws.send_text(json.dumps({'error': f'Error decoding image: {str(e)}', 'frame_id': None}))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session.close()
+        registry.release(resident)
+        logger.info("Stream session ended: %s", session.stats())
+
+
+async def list_models(request: Request) -> Response:
+    return JSONResponse(registry.stats())
+
+
+async def add_model(request: Request) -> Response:
+    """Same as link.add_model: background load, 202 right away."""
+    data = await _json(request) or {}
+    name, path = data.get('name'), data.get('path')
+    if not name or not path:
+        return _error('Missing name or path', 400)
+    try:
+        full = service.resolve_model_path(path)
+    except (ValueError, FileNotFoundError) as e:
+        return _error(str(e), 400)
+    registry.load_async(name, full, make_default=bool(data.get('default')))
+    return JSONResponse({'loading': name, 'path': full}, status_code=202)
+
+
+async def set_default_model(request: Request) -> Response:
+    name = request.path_params['name']
+    try:
+        registry.set_default(name)
+    except ModelNotFound:
+        return _error(f'Unknown model: {name}', 404)
+    return JSONResponse(registry.stats())
+
+
+async def unload_model(request: Request) -> Response:
+    name = request.path_params['name']
+    try:
+        registry.unload(name)
+    except ModelNotFound:
+        return _error(f'Unknown model: {name}', 404)
+    except ValueError as e:
+        return _error(str(e), 409)
+    return JSONResponse(registry.stats())
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    yield
+    admission.shutdown()
+
+
+app = Starlette(
+    routes=[
+        Route('/healthz', healthz, methods=['GET']),
+        Route('/metrics', metrics_endpoint, methods=['GET']),
+        Route('/capabilities', capabilities, methods=['GET']),
+        Route('/predict/base64', predict_base64, methods=['POST']),
+        Route('/predict/binary', predict_binary, methods=['POST']),
+        Route('/predict/faces', predict_faces, methods=['POST']),
+        Route('/predict/bulk', predict_bulk, methods=['POST']),
+        Route('/analyze', analyze_frame, methods=['POST']),
+        Route('/models', list_models, methods=['GET']),
+        Route('/models', add_model, methods=['POST']),
+        Route('/models/{name}/default', set_default_model, methods=['POST']),
+        Route('/models/{name}', unload_model, methods=['DELETE']),
+        WebSocketRoute('/ws/stream', stream),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
@@ -0,0 +1,123 @@
+"""Score a manifest of images offline and write `id,emotion` rows.
+
+Reads a manifest CSV (e.g. test_template.csv), decodes the listed images in a
+thread pool (OpenCV releases the GIL while decoding), runs them through the
+model in batches and appends each batch of rows to the output as soon as it is
+done. Re-running with the same output file resumes where it stopped.
+
+Usage (from backend/):
+    python batch_predict.py --manifest ../test_template.csv --images data/test \\
+        --output predictions.csv --model best_CNN_model.keras
+"""
+import argparse
+import collections
+import csv
+import os
+import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import cv2
+
+import model as model_ml
+
+
+def read_manifest(path: str, id_column: str = 'id') -> List[str]:
+    with open(path, newline='', encoding='utf-8') as f:
+        return [row[id_column] for row in csv.DictReader(f) if row.get(id_column)]
+
+
+def drop_partial_row(path: str) -> None:
+    """Cut off a trailing row left half-written by an interrupted run."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+def read_done(path: str) -> Set[str]:
+    """Ids that already have a prediction in a partially written output file."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline='', encoding='utf-8') as f:
+        return {row['id'] for row in csv.DictReader(f) if row.get('id') and row.get('emotion')}
+
+
+def load_image(path: str) -> Optional[np.ndarray]:
+    try:
+        return cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    except Exception:
+        return None
+
+
+def decoded_batches(pool: ThreadPoolExecutor, image_dir: str, ids: List[str], batch_size: int, prefetch: int) -> Iterator[List[Tuple[str, Optional[np.ndarray]]]]:
+    """Yield decoded batches in manifest order, keeping at most `prefetch` batches in flight."""
+    pending: Deque[List[Tuple[str, Future]]] = collections.deque()
+    chunks = (ids[i:i + batch_size] for i in range(0, len(ids), batch_size))
+    for chunk in chunks:
+        pending.append([(image_id, pool.submit(load_image, os.path.join(image_dir, image_id))) for image_id in chunk])
+        if len(pending) > prefetch:
+            yield [(image_id, fut.result()) for image_id, fut in pending.popleft()]
+    while pending:
+        yield [(image_id, fut.result()) for image_id, fut in pending.popleft()]
+
+
+def main() -> None:
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--manifest', default=os.path.join(base_dir, '..', 'test_template.csv'))
+    parser.add_argument('--images', default=os.path.join(base_dir, 'data', 'test'))
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--model', default=None, help='Model path (defaults to load_model() resolution)')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Decode threads')
+    parser.add_argument('--prefetch', type=int, default=4, help='Batches decoded ahead of inference')
+    parser.add_argument('--detect-faces', action='store_true', help='Run face detection first (FER images are already crops)')
+    parser.add_argument('--no-resume', action='store_true', help='Overwrite the output instead of resuming')
+    args = parser.parse_args()
+
+    ids = read_manifest(args.manifest)
+    done: Set[str] = set()
+    if not args.no_resume:
+        drop_partial_row(args.output)
+        done = read_done(args.output)
+    todo = [i for i in ids if i not in done]
+    print(f"{len(ids)} images in manifest, {len(done)} already scored, {len(todo)} to go", file=sys.stderr)
+    if not todo:
+        return
+
+    bundle = model_ml.load_model(args.model)
+    print(f"Loaded {bundle['kind']} model from {bundle['path']}", file=sys.stderr)
+
+    fresh = args.no_resume or not os.path.exists(args.output) or os.path.getsize(args.output) == 0
+    scored = failed = 0
+    t0 = time.perf_counter()
+    with open(args.output, 'w' if fresh else 'a', newline='', encoding='utf-8') as out, \
+            ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        writer = csv.writer(out)
+        if fresh:
+            writer.writerow(['id', 'emotion'])
+        for batch in decoded_batches(pool, args.images, todo, args.batch_size, args.prefetch):
+            ok = [(image_id, img) for image_id, img in batch if img is not None]
+            for image_id, img in batch:
+                if img is None:
+                    failed += 1
+                    print(f"warning: could not decode {image_id}", file=sys.stderr)
+            if ok:
+                results = model_ml.predict_batch([img for _, img in ok], bundle, detect_faces=args.detect_faces)
+                writer.writerows((image_id, label) for (image_id, _), (label, _, _) in zip(ok, results))
+                out.flush()
+                scored += len(ok)
+            elapsed = time.perf_counter() - t0
+            print(f"\r{scored}/{len(todo)} scored, {scored / elapsed:.1f} images/s", end='', file=sys.stderr)
+
+    elapsed = time.perf_counter() - t0
+    print(f"\nDone: {scored} scored, {failed} failed in {elapsed:.1f}s ({scored / max(elapsed, 1e-9):.1f} images/s)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import model as model_ml
+from coalescing import Superseded
+
+logger = logging.getLogger("moodcam")
+
+BBox = Tuple[int, int, int, int]
+Prediction = Tuple[str, float, Optional[BBox]]
+# (frame, bbox, future, should_run, bbox is the located face rather than a hint)
+_Item = Tuple[np.ndarray, Optional[BBox], Future, Optional[Callable[[], bool]], bool]
+
+
+class BatchingEngine:
+    """Gather frames from concurrent callers into batched model calls.
+
+    A single worker thread waits for the first queued frame, then keeps
+    collecting until either `max_batch_size` frames are queued or `max_wait_ms`
+    has elapsed, and runs them through `model.predict_batch` in one call.
+    Each caller gets back its own (label, probability, bbox) tuple.
+    """
+
+    def __init__(self, model_bundle: Dict[str, Any], max_batch_size: int = 8, max_wait_ms: float = 5.0):
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size must be >= 1')
+        self.model_bundle = model_bundle
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: 'queue.Queue[Optional[_Item]]' = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+
+    def submit(self, frame_bgr: np.ndarray, prev_bbox: Optional[BBox] = None,
+               should_run: Optional[Callable[[], bool]] = None, detect: bool = True) -> 'Future[Prediction]':
+        """Queue a frame for the next batch and return a future for its prediction.
+
+        prev_bbox is the last known face position, used to narrow face detection.
+        With detect=False the caller already ran detection on this frame:
+        prev_bbox is taken as the face (None: no face) and not searched again.
+        should_run is checked when the frame's batch is about to run; if it
+        returns False the frame is skipped and the future fails with Superseded.
+        """
+        if self._closed:
+            raise RuntimeError('BatchingEngine is closed')
+        self._ensure_worker()
+        fut: 'Future[Prediction]' = Future()
+        self._queue.put((frame_bgr, prev_bbox, fut, should_run, not detect))
+        return fut
+
+    def predict(self, frame_bgr: np.ndarray, prev_bbox: Optional[BBox] = None, timeout: Optional[float] = None,
+                should_run: Optional[Callable[[], bool]] = None, detect: bool = True) -> Prediction:
+        """Blocking equivalent of `model.predict` that goes through the batcher."""
+        return self.submit(frame_bgr, prev_bbox, should_run, detect).result(timeout=timeout)
+
+    def close(self) -> None:
+        self._closed = True
+        with self._lock:
+            if self._worker is not None:
+                self._queue.put(None)
+                self._worker.join()
+                self._worker = None
+
+    def _ensure_worker(self) -> None:
+        # Started lazily so the engine can be created before the process forks
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='moodcam-batcher', daemon=True)
+                self._worker.start()
+
+    def _collect(self, first: _Item) -> Tuple[List[_Item], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch, stop = self._collect(item)
+            # Drop callers that gave up before their batch started, and superseded frames
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel() and self._still_wanted(item)]
+            if batch:
+                self._run_batch(batch)
+            if stop:
+                return
+
+    @staticmethod
+    def _still_wanted(item: _Item) -> bool:
+        should_run, fut = item[3], item[2]
+        if should_run is None:
+            return True
+        try:
+            if should_run():
+                return True
+        except Exception as e:
+            fut.set_exception(e)
+            return False
+        fut.set_exception(Superseded())
+        return False
+
+    def _run_batch(self, batch: List[_Item]) -> None:
+        frames = [frame for frame, _, _, _, _ in batch]
+        prev_bboxes = [prev for _, prev, _, _, _ in batch]
+        located = [known for _, _, _, _, known in batch]
+        try:
+            results = model_ml.predict_batch(frames, self.model_bundle, prev_bboxes, located=located)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][2].set_exception(e)
+                return
+            # Retry one by one so a single bad frame does not fail the whole batch
+            logger.warning("Batched prediction failed (%s); retrying %d frames individually", e, len(batch))
+            for frame, prev, fut, _, known in batch:
+                try:
+                    fut.set_result(model_ml.predict(frame, self.model_bundle, prev, known))
+                except Exception as e2:
+                    fut.set_exception(e2)
+            return
+        for (_, _, fut, _, _), result in zip(batch, results):
+            fut.set_result(result)
@@ -0,0 +1,97 @@
+"""Compare full decoding with the model-driven decode planner on phone-sized uploads.
+
+backend/data/test faces are pasted into canvases of each resolution (as in
+bench_face_detection.py) and JPEG-encoded. Each upload is then decoded twice:
+with cv2.IMREAD_COLOR, as link.py used to, and with decode.DecodePlanner
+for the model's input shape. For both it reports decode latency, the size of
+the decoded frame and the peak memory allocated per request (tracemalloc,
+which sees OpenCV's numpy-backed output), plus how often the face detector
+still finds the face.
+
+The planner is built from --input-shape (HxWxC, e.g. the 48x48 grayscale CNN)
+unless --model is given, in which case that model is loaded.
+
+Usage (from backend/):
+    python bench_decode.py --resolutions 4032x3024,3000x4000,1920x1080 --input-shape 48x48x1
+    python bench_decode.py --model best_CNN_model.keras
+"""
+import argparse
+import os
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import cv2
+
+import model as model_ml
+from bench_face_detection import load_frames
+from decode import DecodePlanner
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _ShapeOnly:
+    def __init__(self, shape: Tuple[int, int, int]):
+        h, w, c = shape
+        self.input_shape = (None, h, w, c)
+
+
+def measure(payloads: List[bytes], decode: Callable[[bytes], Optional[np.ndarray]]) -> Dict[str, Any]:
+    lat, frame_bytes, peaks, found = [], [], [], 0
+    for buf in payloads:
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        frame = decode(buf)
+        lat.append((time.perf_counter() - t0) * 1000.0)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks.append(peak)
+        frame_bytes.append(frame.nbytes)
+        if model_ml._detect_face_bbox(frame) is not None:
+            found += 1
+    h, w = frame.shape[:2]
+    return {
+        'decoded': f'{w}x{h}x{1 if frame.ndim == 2 else frame.shape[2]}',
+        'p50_ms': float(np.percentile(lat, 50)),
+        'p95_ms': float(np.percentile(lat, 95)),
+        'frame_mib': float(np.mean(frame_bytes)) / 2**20,
+        'peak_mib': float(np.mean(peaks)) / 2**20,
+        'face_found': found / len(payloads),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=None, help='Model file to plan for (default: --input-shape)')
+    parser.add_argument('--input-shape', default='48x48x1', help='HxWxC of a Keras-style model input')
+    parser.add_argument('--resolutions', default='4032x3024,3000x4000,1920x1080')
+    parser.add_argument('--data-dir', default=os.path.join(BASE_DIR, 'data', 'test'))
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--face-fraction', type=float, default=0.35, help='Face size relative to the short side')
+    parser.add_argument('--quality', type=int, default=90)
+    args = parser.parse_args()
+
+    if args.model:
+        planner = DecodePlanner.for_bundle(model_ml.load_model(args.model))
+    else:
+        shape = tuple(int(v) for v in args.input_shape.lower().split('x'))
+        planner = DecodePlanner.for_bundle({'kind': 'keras', 'model': _ShapeOnly(shape)})
+    print(f"Planner: min_side={planner.min_side} grayscale={planner.grayscale}")
+
+    for res in args.resolutions.split(','):
+        w, h = (int(v) for v in res.lower().split('x'))
+        frames = load_frames(args.data_dir, args.limit, (w, h), int(min(w, h) * args.face_fraction), seed=0)
+        payloads = [cv2.imencode('.jpg', f, [cv2.IMWRITE_JPEG_QUALITY, args.quality])[1].tobytes() for f in frames]
+        del frames
+        full = measure(payloads, lambda b: cv2.imdecode(np.frombuffer(b, np.uint8), cv2.IMREAD_COLOR))
+        planned = measure(payloads, lambda b: planner.decode(b)[0])
+        print(f"\n{res} ({np.mean([len(p) for p in payloads]) / 2**20:.2f} MiB JPEG, {len(payloads)} images)")
+        for name, r in (('full', full), ('planned', planned)):
+            print(f"  {name:<8} -> {r['decoded']:<12} p50 {r['p50_ms']:7.2f} ms  p95 {r['p95_ms']:7.2f} ms  "
+                  f"frame {r['frame_mib']:6.2f} MiB  peak {r['peak_mib']:6.2f} MiB  face found {r['face_found']:.0%}")
+        print(f"  speedup {full['p50_ms'] / planned['p50_ms']:.1f}x, memory {full['peak_mib'] / max(planned['peak_mib'], 1e-9):.1f}x less")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark face detection throughput on the backend/data/test images.
+
+Compares the original detector (new CascadeClassifier per call, full-resolution
+search) with FaceDetector (cached cascade, downscaled search, and ROI-restricted
+re-detection when the previous bbox is known).
+
+The FER test images are 48x48 face crops, so each one is upscaled and pasted
+into a webcam-sized canvas to get realistic per-frame cost.
+
+Usage:
+    python bench_face_detection.py --limit 300 --canvas 640x480 --face-size 220
+"""
+import argparse
+import glob
+import os
+import time
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import cv2
+
+from face_detector import FaceDetector
+
+
+def legacy_detect(frame_bgr: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    # Verbatim copy of the original model._detect_face_bbox
+    gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+    cascade_path = os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+    face_cascade = cv2.CascadeClassifier(cascade_path)
+    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(60, 60))
+    if len(faces) == 0:
+        return None
+    x, y, w, h = max(faces, key=lambda box: box[2] * box[3])
+    return int(x), int(y), int(w), int(h)
+
+
+def load_frames(data_dir: str, limit: int, canvas: Optional[Tuple[int, int]], face_size: int, seed: int) -> List[np.ndarray]:
+    paths = sorted(glob.glob(os.path.join(data_dir, '*.jpg')))[:limit]
+    if not paths:
+        raise SystemExit(f'No images found in {data_dir}')
+    rng = np.random.default_rng(seed)
+    frames = []
+    for p in paths:
+        img = cv2.imread(p, cv2.IMREAD_COLOR)
+        if img is None:
+            continue
+        if canvas is None:
+            frames.append(img)
+            continue
+        cw, ch = canvas
+        size = min(face_size, cw, ch)
+        face = cv2.resize(img, (size, size), interpolation=cv2.INTER_CUBIC)
+        frame = np.full((ch, cw, 3), 96, dtype=np.uint8)
+        x = int(rng.integers(0, cw - size + 1))
+        y = int(rng.integers(0, ch - size + 1))
+        frame[y:y+size, x:x+size] = face
+        frames.append(frame)
+    return frames
+
+
+def run(name: str, frames: List[np.ndarray], fn: Callable[[int, np.ndarray], Optional[Tuple[int, int, int, int]]]) -> Tuple[float, int]:
+    found = 0
+    t0 = time.perf_counter()
+    for i, frame in enumerate(frames):
+        if fn(i, frame) is not None:
+            found += 1
+    elapsed = time.perf_counter() - t0
+    fps = len(frames) / elapsed if elapsed > 0 else float('inf')
+    print(f"{name:<28} {fps:9.1f} frames/s   faces found: {found}/{len(frames)}")
+    return fps, found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', default=os.path.join(os.path.dirname(__file__), 'data', 'test'))
+    parser.add_argument('--limit', type=int, default=300)
+    parser.add_argument('--canvas', default='640x480', help="WxH canvas, or 'none' to use the raw images")
+    parser.add_argument('--face-size', type=int, default=220)
+    parser.add_argument('--max-side', type=int, default=320)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    canvas = None
+    if args.canvas.lower() != 'none':
+        w, h = args.canvas.lower().split('x')
+        canvas = (int(w), int(h))
+
+    frames = load_frames(args.data_dir, args.limit, canvas, args.face_size, args.seed)
+    print(f"{len(frames)} frames, size {frames[0].shape[1]}x{frames[0].shape[0]}, cv2 threads={cv2.getNumThreads()}")
+
+    detector = FaceDetector(max_side=args.max_side)
+    full_res = FaceDetector(max_side=10**6)
+    # First pass gives the "previous" bbox used to simulate a tracked face in a video stream
+    known = [detector.detect(f) for f in frames]
+
+    base_fps, _ = run('before: legacy', frames, lambda i, f: legacy_detect(f))
+    run('cached cascade', frames, lambda i, f: full_res.detect(f))
+    run(f'cached + downscale({args.max_side})', frames, lambda i, f: detector.detect(f))
+    roi_fps, _ = run('cached + downscale + ROI', frames, lambda i, f: detector.detect(f, known[i]))
+    print(f"speedup (ROI path vs legacy): {roi_fps / base_fps:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
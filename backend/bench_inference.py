@@ -0,0 +1,180 @@
+"""Per-stage inference benchmark over the backend/data/test images.
+
+For every model, input resolution and batch size, times:
+  decode       cv2.imdecode of the JPEG-encoded frame (per image)
+  detect       face detection (model._detect_face_bbox)
+  preprocess   model.preprocess_batch (Keras/TFLite/ONNX/TorchScript) or RGB conversion
+  inference    the framework forward pass
+  postprocess  argmax/softmax and label lookup
+and reports p50/p95/p99 latency per call plus throughput (images/s) per stage.
+Stage timings come from model.set_stage_observer, so they measure the exact
+code the server runs.
+
+The 48x48 test faces are pasted into canvases of each resolution (as in
+bench_face_detection.py) and JPEG-encoded once up front. Results are written
+as JSON tagged with the git commit, so runs can be diffed with --compare.
+
+Usage (from backend/):
+    python bench_inference.py --models best_CNN_model.keras --resolutions 320x240,640x480,1280x720 \\
+        --batch-sizes 1,8,32 --out bench_results/run.json
+    python bench_inference.py ... --compare bench_results/previous.json
+"""
+import argparse
+import collections
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import cv2
+
+import model as model_ml
+from bench_face_detection import load_frames
+
+STAGES = ('decode', 'detect', 'preprocess', 'inference', 'postprocess')
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        )
+        return out.stdout.strip()
+    except Exception:
+        return None
+
+
+def summarize(samples: List[Tuple[float, int]]) -> Dict[str, float]:
+    """samples are (seconds, images) per call."""
+    if not samples:
+        return {}
+    ms = np.array([s for s, _ in samples]) * 1000.0
+    total_s = sum(s for s, _ in samples)
+    images = sum(n for _, n in samples)
+    return {
+        'calls': len(samples),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'mean_ms': float(ms.mean()),
+        'throughput_ips': images / total_s if total_s > 0 else float('inf'),
+    }
+
+
+def run_case(bundle: Dict[str, Any], encoded: List[bytes], batch_size: int, warmup: int) -> Dict[str, Any]:
+    samples: Dict[str, List[Tuple[float, int]]] = collections.defaultdict(list)
+
+    def observer(stage: str, seconds: float, n: int) -> None:
+        samples[stage].append((seconds, n))
+
+    # Warm up the framework for this batch shape before recording
+    warm = [cv2.imdecode(np.frombuffer(b, np.uint8), cv2.IMREAD_COLOR) for b in encoded[:batch_size]]
+    for _ in range(warmup):
+        model_ml.predict_batch(warm, bundle)
+
+    model_ml.set_stage_observer(observer)
+    t_start = time.perf_counter()
+    try:
+        for i in range(0, len(encoded) - batch_size + 1, batch_size):
+            frames = []
+            for buf in encoded[i:i + batch_size]:
+                t0 = time.perf_counter()
+                frames.append(cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR))
+                samples['decode'].append((time.perf_counter() - t0, 1))
+            model_ml.predict_batch(frames, bundle)
+    finally:
+        model_ml.set_stage_observer(None)
+    wall = time.perf_counter() - t_start
+    images = sum(n for _, n in samples['inference'])
+    return {
+        'images': images,
+        'end_to_end_ips': images / wall if wall > 0 else float('inf'),
+        'stages': {stage: summarize(samples[stage]) for stage in STAGES if samples.get(stage)},
+    }
+
+
+def case_key(r: Dict[str, Any]) -> Tuple[str, str, int]:
+    return os.path.basename(r['model']), r['resolution'], r['batch_size']
+
+
+def print_compare(results: List[Dict[str, Any]], previous_path: str) -> None:
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = {case_key(r): r for r in json.load(f)['results']}
+    print(f"\nComparison with {previous_path} (p50 ms, negative is faster):")
+    for r in results:
+        old = previous.get(case_key(r))
+        if old is None:
+            continue
+        parts = []
+        for stage in STAGES:
+            new_s, old_s = r['stages'].get(stage), old['stages'].get(stage)
+            if new_s and old_s:
+                parts.append(f"{stage} {new_s['p50_ms'] - old_s['p50_ms']:+.2f}")
+        print(f"  {case_key(r)}: " + '  '.join(parts))
+
+
+def main() -> None:
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', default='', help='Comma-separated model paths (default: load_model() resolution)')
+    parser.add_argument('--data-dir', default=os.path.join(base_dir, 'data', 'test'))
+    parser.add_argument('--limit', type=int, default=256)
+    parser.add_argument('--resolutions', default='320x240,640x480,1280x720')
+    parser.add_argument('--batch-sizes', default='1,8,32')
+    parser.add_argument('--face-fraction', type=float, default=0.45, help='Face size relative to frame height')
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--out', default=None, help='JSON output (default: bench_results/<commit>-<time>.json)')
+    parser.add_argument('--compare', default=None, help='Previous JSON results to diff against')
+    args = parser.parse_args()
+
+    model_paths = [p for p in args.models.split(',') if p] or [None]
+    resolutions = [r.strip().lower() for r in args.resolutions.split(',') if r.strip()]
+    batch_sizes = [int(b) for b in args.batch_sizes.split(',') if b.strip()]
+
+    results: List[Dict[str, Any]] = []
+    for path in model_paths:
+        bundle = model_ml.load_model(path)
+        for res in resolutions:
+            w, h = (int(v) for v in res.split('x'))
+            frames = load_frames(args.data_dir, args.limit, (w, h), int(h * args.face_fraction), seed=0)
+            encoded = [cv2.imencode('.jpg', f, [cv2.IMWRITE_JPEG_QUALITY, args.quality])[1].tobytes() for f in frames]
+            for bs in batch_sizes:
+                case = run_case(bundle, encoded, bs, args.warmup)
+                case.update(model=bundle['path'], kind=bundle['kind'], resolution=res, batch_size=bs)
+                results.append(case)
+                print(f"\n{os.path.basename(bundle['path'])} [{bundle['kind']}] {res} batch={bs}: "
+                      f"{case['end_to_end_ips']:.1f} images/s end-to-end")
+                for stage, s in case['stages'].items():
+                    print(f"  {stage:<12} p50 {s['p50_ms']:8.3f}  p95 {s['p95_ms']:8.3f}  p99 {s['p99_ms']:8.3f} ms"
+                          f"   {s['throughput_ips']:10.1f} images/s")
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+        },
+        'config': vars(args),
+        'results': results,
+    }
+    out = args.out or os.path.join(base_dir, 'bench_results', f"{commit or 'unknown'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {out}")
+    if args.compare:
+        print_compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark batched preprocessing against the per-frame functions it replaces.
+
+Face crops are taken from backend/data/test images upscaled to --roi-size (the
+size of a face crop in a webcam frame). For each input spec and batch size it
+times the old path (model._preprocess_for_keras per crop + np.concatenate, or
+model._preprocess_for_torchscript + torch.cat when torch is installed) and
+preprocessing.BatchPreprocessor, checks that both produce the same tensor, and
+reports the per-batch latency and the memory allocated per call (tracemalloc).
+
+Usage (from backend/):
+    python bench_preprocess.py --batch-sizes 1,8,32 --roi-size 200
+"""
+import argparse
+import glob
+import os
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import cv2
+
+import model as model_ml
+from preprocessing import BatchPreprocessor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _ShapeOnly:
+    def __init__(self, h: int, w: int, c: int):
+        self.input_shape = (None, h, w, c)
+
+
+def load_rois(data_dir: str, limit: int, size: int) -> List[np.ndarray]:
+    rois = []
+    for p in sorted(glob.glob(os.path.join(data_dir, '*.jpg')))[:limit]:
+        img = cv2.imread(p, cv2.IMREAD_COLOR)
+        if img is not None:
+            rois.append(cv2.resize(img, (size, size), interpolation=cv2.INTER_CUBIC))
+    if not rois:
+        raise SystemExit(f'No images found in {data_dir}')
+    return rois
+
+
+def time_it(fn: Callable[[List[np.ndarray]], Any], batches: List[List[np.ndarray]], repeat: int) -> Dict[str, float]:
+    fn(batches[0])
+    tracemalloc.start()
+    fn(batches[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    lat = []
+    for _ in range(repeat):
+        for batch in batches:
+            t0 = time.perf_counter()
+            fn(batch)
+            lat.append((time.perf_counter() - t0) * 1000.0)
+    return {'p50_ms': float(np.percentile(lat, 50)), 'mean_ms': float(np.mean(lat)), 'alloc_kib': peak / 1024.0}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', default=os.path.join(BASE_DIR, 'data', 'test'))
+    parser.add_argument('--limit', type=int, default=256)
+    parser.add_argument('--roi-size', type=int, default=200)
+    parser.add_argument('--batch-sizes', default='1,8,32')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rois = load_rois(args.data_dir, args.limit, args.roi_size)
+    try:
+        torch = model_ml._import_torch()
+    except RuntimeError:
+        torch = None
+
+    specs = [
+        ('48x48x1 NHWC f32', lambda b: np.concatenate([model_ml._preprocess_for_keras(r, _ShapeOnly(48, 48, 1)) for r in b]),
+         BatchPreprocessor(48, 48, 1, 'NHWC')),
+        ('224x224x3 NHWC f32', lambda b: np.concatenate([model_ml._preprocess_for_keras(r, _ShapeOnly(224, 224, 3)) for r in b]),
+         BatchPreprocessor(224, 224, 3, 'NHWC')),
+        ('224x224x3 NHWC f16', None, BatchPreprocessor(224, 224, 3, 'NHWC', np.float16)),
+    ]
+    if torch is not None:
+        specs.append(('224x224x3 NCHW f32', lambda b: torch.cat([model_ml._preprocess_for_torchscript(r) for r in b]).numpy(),
+                      BatchPreprocessor(224, 224, 3, 'NCHW')))
+
+    for bs in (int(v) for v in args.batch_sizes.split(',') if v.strip()):
+        batches = [rois[i:i + bs] for i in range(0, len(rois) - bs + 1, bs)]
+        print(f"\nbatch size {bs} ({len(batches)} batches of {args.roi_size}px crops)")
+        for name, old, new in specs:
+            r_new = time_it(new, batches, args.repeat)
+            line = f"  {name:<20} batched p50 {r_new['p50_ms']:7.3f} ms  alloc {r_new['alloc_kib']:9.1f} KiB"
+            if old is not None:
+                r_old = time_it(old, batches, args.repeat)
+                diff = float(np.max(np.abs(old(batches[0]) - new(batches[0]))))
+                line += (f"   per-frame p50 {r_old['p50_ms']:7.3f} ms  alloc {r_old['alloc_kib']:9.1f} KiB"
+                         f"   speedup {r_old['p50_ms'] / r_new['p50_ms']:.2f}x  max|diff| {diff:.4f}")
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
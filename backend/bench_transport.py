@@ -0,0 +1,111 @@
+"""Compare request/response size and latency of the predict endpoints.
+
+Each backend/data/test image is upscaled to a webcam-sized frame, JPEG-encoded
+once, and sent to /predict/base64 (JSON + base64 data URL), /predict/binary
+as application/octet-stream, and /predict/binary as multipart. Requests go
+through Flask's test client with the prediction cache off, so the numbers
+cover request parsing, decoding and inference but not the network itself.
+
+Usage (from backend/, with a model available to link.py):
+    python bench_transport.py --limit 100 --size 1280x720
+"""
+import argparse
+import base64
+import glob
+import io
+import json
+import os
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import cv2
+
+
+def encode_frames(data_dir: str, limit: int, size: str, quality: int) -> List[bytes]:
+    w, h = (int(v) for v in size.lower().split('x'))
+    out = []
+    for p in sorted(glob.glob(os.path.join(data_dir, '*.jpg')))[:limit]:
+        img = cv2.imread(p, cv2.IMREAD_COLOR)
+        if img is None:
+            continue
+        frame = cv2.resize(img, (w, h), interpolation=cv2.INTER_CUBIC)
+        ok, enc = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if ok:
+            out.append(enc.tobytes())
+    if not out:
+        raise SystemExit(f'No images found in {data_dir}')
+    return out
+
+
+def measure(name: str, payloads: List[bytes], send: Callable[[bytes], Tuple[int, Any]]) -> Dict[str, float]:
+    req_sizes, resp_sizes, lat = [], [], []
+    for jpeg in payloads:
+        t0 = time.perf_counter()
+        body_len, resp = send(jpeg)
+        lat.append((time.perf_counter() - t0) * 1000.0)
+        if resp.status_code != 200:
+            raise SystemExit(f'{name}: HTTP {resp.status_code}: {resp.get_data(as_text=True)}')
+        req_sizes.append(body_len)
+        resp_sizes.append(len(resp.get_data()))
+    lat.sort()
+    stats = {
+        'request_bytes': statistics.mean(req_sizes),
+        'response_bytes': statistics.mean(resp_sizes),
+        'p50_ms': lat[len(lat) // 2],
+        'p95_ms': lat[min(len(lat) - 1, int(len(lat) * 0.95))],
+        'mean_ms': statistics.mean(lat),
+    }
+    print(
+        f"{name:<22} req {stats['request_bytes'] / 1024:8.1f} KiB   resp {stats['response_bytes']:6.0f} B   "
+        f"p50 {stats['p50_ms']:7.2f} ms   p95 {stats['p95_ms']:7.2f} ms"
+    )
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', default=os.path.join(os.path.dirname(__file__), 'data', 'test'))
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--size', default='1280x720')
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--json-out', help='Optional path to write the results as JSON')
+    args = parser.parse_args()
+
+    # Every transport sends the same frames; cache hits would hide decode and inference
+    os.environ['MOODCAM_CACHE_ENTRIES'] = '0'
+    import link  # loads the model
+    if link.registry.default_name is None:
+        raise SystemExit('Model not loaded; set MOODCAM_MODEL_PATH')
+    client = link.app.test_client()
+
+    payloads = encode_frames(args.data_dir, args.limit, args.size, args.quality)
+    print(f"{len(payloads)} frames at {args.size}, mean JPEG {sum(map(len, payloads)) / len(payloads) / 1024:.1f} KiB")
+
+    def send_base64(jpeg: bytes):
+        body = json.dumps({'image_base64': 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode('ascii')})
+        return len(body), client.post('/predict/base64', data=body, content_type='application/json')
+
+    def send_octet(jpeg: bytes):
+        return len(jpeg), client.post('/predict/binary', data=jpeg, content_type='application/octet-stream')
+
+    def send_multipart(jpeg: bytes):
+        resp = client.post('/predict/binary', data={'image': (io.BytesIO(jpeg), 'frame.jpg')}, content_type='multipart/form-data')
+        return int(resp.request.headers.get('Content-Length', len(jpeg))), resp
+
+    # Warm every path once so the first measured request is not an outlier
+    for send in (send_base64, send_octet, send_multipart):
+        send(payloads[0])
+
+    results = {
+        '/predict/base64': measure('/predict/base64', payloads, send_base64),
+        '/predict/binary (raw)': measure('/predict/binary (raw)', payloads, send_octet),
+        '/predict/binary (mp)': measure('/predict/binary (mp)', payloads, send_multipart),
+    }
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump({'size': args.size, 'frames': len(payloads), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Measure serving throughput as the number of gunicorn workers grows.
+
+For each worker count, starts `gunicorn -c gunicorn.conf.py link:app` on a
+local port, waits for /healthz, then keeps `--concurrency` client threads
+posting JPEG frames to /predict/binary for `--duration` seconds. The prediction
+cache is disabled so every request runs the model. Reports requests/s, scaling
+relative to one worker and client-side latency, prints a Markdown table and
+writes the results as JSON.
+
+Frames are backend/data/test images pasted into webcam-sized canvases, as in
+bench_face_detection.py.
+
+Usage (from backend/, with gunicorn installed):
+    python bench_workers.py --workers 1,2,4,8 --concurrency 32 --duration 20
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List
+
+import numpy as np
+import cv2
+
+from bench_face_detection import load_frames
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def wait_ready(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url + '/healthz', timeout=2) as resp:
+                if json.load(resp).get('status') == 'ok':
+                    return
+        except (OSError, ValueError):  # URLError, refused and timed-out connections while workers boot
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f'Server at {url} not ready after {timeout:.0f}s')
+
+
+def load_test(url: str, payloads: List[bytes], concurrency: int, duration: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(offset: int) -> None:
+        i = offset
+        local, failed = [], 0
+        while time.monotonic() < stop_at:
+            req = urllib.request.Request(
+                url + '/predict/binary', data=payloads[i % len(payloads)],
+                headers={'Content-Type': 'application/octet-stream'},
+            )
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=30) as resp:
+                    resp.read()
+                local.append(time.perf_counter() - t0)
+            except Exception:
+                failed += 1
+            i += concurrency
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    t_start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(k,)) for k in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t_start
+    ms = np.array(latencies) * 1000.0 if latencies else np.zeros(1)
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': len(latencies) / wall if wall > 0 else 0.0,
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+    }
+
+
+def run_server(workers: int, port: int, args: argparse.Namespace) -> subprocess.Popen:
+    env = dict(os.environ, MOODCAM_WORKERS=str(workers), MOODCAM_BIND=f'127.0.0.1:{port}', MOODCAM_CACHE_ENTRIES='0')
+    if args.intra_op_threads:
+        env['MOODCAM_INTRA_OP_THREADS'] = str(args.intra_op_threads)
+    cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--log-level', 'warning', 'link:app']
+    return subprocess.Popen(cmd, cwd=BASE_DIR, env=env)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4', help='Comma-separated worker counts')
+    parser.add_argument('--concurrency', type=int, default=32, help='Client threads')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds of load per worker count')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--intra-op-threads', type=int, default=None, help='Override per-worker framework threads')
+    parser.add_argument('--data-dir', default=os.path.join(BASE_DIR, 'data', 'test'))
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--size', default='640x480')
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--ready-timeout', type=float, default=300.0)
+    parser.add_argument('--out', default=os.path.join(BASE_DIR, 'bench_results', 'workers.json'))
+    args = parser.parse_args()
+
+    w, h = (int(v) for v in args.size.lower().split('x'))
+    frames = load_frames(args.data_dir, args.limit, (w, h), int(h * 0.45), seed=0)
+    payloads = [cv2.imencode('.jpg', f, [cv2.IMWRITE_JPEG_QUALITY, args.quality])[1].tobytes() for f in frames]
+    url = f'http://127.0.0.1:{args.port}'
+
+    results = []
+    for n in (int(v) for v in args.workers.split(',') if v.strip()):
+        proc = run_server(n, args.port, args)
+        try:
+            wait_ready(url, args.ready_timeout)
+            # Let the remaining workers finish their warmup
+            time.sleep(2.0)
+            res = load_test(url, payloads, args.concurrency, args.duration)
+        finally:
+            proc.terminate()
+            proc.wait()
+        res['workers'] = n
+        results.append(res)
+        print(f"{n} workers: {res['rps']:.1f} req/s  p50 {res['p50_ms']:.1f} ms  p95 {res['p95_ms']:.1f} ms  errors {res['errors']}")
+
+    base = results[0]['rps'] if results and results[0]['rps'] else None
+    print('\n| workers | req/s | scaling | p50 ms | p95 ms | p99 ms |')
+    print('|--------:|------:|--------:|-------:|-------:|-------:|')
+    for r in results:
+        r['scaling'] = r['rps'] / base if base else None
+        print(f"| {r['workers']} | {r['rps']:.1f} | {r['scaling'] or 0:.2f}x | {r['p50_ms']:.1f} | {r['p95_ms']:.1f} | {r['p99_ms']:.1f} |")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump({
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'host': {'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+            'config': vars(args),
+            'results': results,
+        }, f, indent=2)
+    print(f"\nWrote {args.out}")
+
+
+if __name__ == '__main__':
+    main()
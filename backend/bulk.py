@@ -0,0 +1,151 @@
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+ZIP_MIMETYPES = ('application/zip', 'application/x-zip-compressed')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+# An upload item: (name, encoded bytes) or (name, the error that made it unreadable)
+Item = Tuple[str, Union[bytes, Exception]]
+
+
+class BulkInputError(ValueError):
+    """The bulk request as a whole is unusable (not a zip, corrupt archive, ...)."""
+
+
+def is_zip(name: str, mimetype: str, head: bytes = b'') -> bool:
+    return mimetype in ZIP_MIMETYPES or name.lower().endswith('.zip') or head.startswith(b'PK\x03\x04')
+
+
+def open_zip(fileobj: IO[bytes]) -> zipfile.ZipFile:
+    """Open an archive up front so a bad one fails the request before any result is streamed."""
+    try:
+        return zipfile.ZipFile(fileobj)
+    except (zipfile.BadZipFile, OSError) as e:
+        raise BulkInputError(f'Invalid zip archive: {e}') from e
+
+
+def iter_zip(archive: zipfile.ZipFile, max_image_bytes: int, prefix: str = '') -> Iterator[Item]:
+    """Yield image entries one at a time; only the entry being read is held in memory."""
+    with archive:
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith('__MACOSX/') or not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            if info.file_size > max_image_bytes:
+                yield prefix + name, ValueError(f'Image larger than {max_image_bytes} bytes')
+                continue
+            try:
+                with archive.open(info) as f:
+                    # Read one byte past the limit in case the header understates the size
+                    data = f.read(max_image_bytes + 1)
+            except (zipfile.BadZipFile, OSError, RuntimeError) as e:
+                yield prefix + name, e
+                continue
+            if len(data) > max_image_bytes:
+                yield prefix + name, ValueError(f'Image larger than {max_image_bytes} bytes')
+            else:
+                yield prefix + name, data
+
+
+def stream_results(
+    items: Iterable[Item],
+    handle: Callable[[bytes], Dict[str, Any]],
+    executor: Executor,
+    window: int,
+    max_items: int,
+) -> Iterator[Dict[str, Any]]:
+    """Run `handle` over uploaded images and yield one result dict per image as each finishes.
+
+    At most `window` images are read and in flight at once, so memory stays
+    bounded by the window rather than the size of the upload; concurrent
+    handle() calls land in the same BatchingEngine batches. Results come in
+    completion order and carry the upload `index` and `name`. A final
+    {"done": true, ...} line reports the totals. Stopping iteration early
+    (client disconnect) cancels whatever has not started.
+    """
+    pending: Dict[Future, Tuple[int, str]] = {}
+    source = iter(items)
+    count = errors = 0
+    exhausted = truncated = False
+
+    def _error(index: int, name: str, e: Exception) -> Dict[str, Any]:
+        nonlocal errors
+        errors += 1
+        return {'index': index, 'name': name, 'error': str(e)}
+
+    try:
+        while True:
+            while not exhausted and len(pending) < window:
+                try:
+                    name, data = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if count >= max_items:
+                    exhausted = truncated = True
+                    break
+                index, count = count, count + 1
+                if isinstance(data, Exception):
+                    yield _error(index, name, data)
+                else:
+                    pending[executor.submit(handle, data)] = (index, name)
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                index, name = pending.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    yield _error(index, name, e)
+                else:
+                    yield dict(result, index=index, name=name)
+        summary = {'done': True, 'count': count, 'errors': errors}
+        if truncated:
+            summary['truncated'] = True
+            summary['max_images'] = max_items
+        yield summary
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+
+def spool_files(files: Iterable[Tuple[str, str, IO[bytes]]], max_memory: int) -> List[Tuple[str, str, IO[bytes]]]:
+    """Copy upload parts into spooled temp files owned by the caller.
+
+    The web frameworks close their part files when the request handler
+    returns, before a streamed response has read them. Parts larger than
+    `max_memory` go to disk.
+    """
+    spooled = []
+    for name, mimetype, fileobj in files:
+        copy = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        shutil.copyfileobj(fileobj, copy)
+        copy.seek(0)
+        spooled.append((name, mimetype, copy))
+    return spooled
+
+
+def iter_files(files: Iterable[Tuple[str, str, IO[bytes]]], max_image_bytes: int) -> Iterator[Item]:
+    """Yield the images of a multipart upload given as (name, mimetype, file); zip parts are expanded.
+
+    Each file is closed once its images have been read.
+    """
+    for name, mimetype, fileobj in files:
+        with fileobj:
+            if is_zip(name, mimetype):
+                try:
+                    archive = open_zip(fileobj)
+                except BulkInputError as e:
+                    yield name, e
+                    continue
+                yield from iter_zip(archive, max_image_bytes, prefix=name + '/')
+                continue
+            data = fileobj.read(max_image_bytes + 1)
+        if len(data) > max_image_bytes:
+            yield name, ValueError(f'Image larger than {max_image_bytes} bytes')
+        else:
+            yield name, data
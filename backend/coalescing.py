@@ -0,0 +1,58 @@
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+
+class Superseded(Exception):
+    """The frame was replaced by a newer one from the same client before inference started."""
+
+
+class ClientCoalescer:
+    """Latest-frame-wins across HTTP requests from the same client.
+
+    Each request from a client takes a ticket; a newer ticket supersedes the
+    older ones. The returned `should_run` check is handed to the batching
+    engine (and checked before decoding), so a frame that has not started
+    inference when a newer one arrives is answered as superseded instead of
+    queued. Only clients with a request in flight are tracked, so the table
+    stays as large as the number of active clients. Coalescing is per
+    process: frames from one client spread over several workers are not
+    coalesced with each other.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tickets = itertools.count(1)
+        self._latest: Dict[str, int] = {}
+
+    def _begin(self, client_id: str) -> int:
+        with self._lock:
+            ticket = next(self._tickets)
+            self._latest[client_id] = ticket
+            return ticket
+
+    def _end(self, client_id: str, ticket: int) -> None:
+        with self._lock:
+            if self._latest.get(client_id) == ticket:
+                del self._latest[client_id]
+
+    def is_latest(self, client_id: str, ticket: int) -> bool:
+        with self._lock:
+            return self._latest.get(client_id) == ticket
+
+    @contextmanager
+    def frame(self, client_id: Optional[str]) -> Iterator[Optional[Callable[[], bool]]]:
+        """Register a frame for `client_id` and yield its should_run check (None without a client id)."""
+        if not client_id:
+            yield None
+            return
+        ticket = self._begin(client_id)
+        try:
+            yield lambda: self.is_latest(client_id, ticket)
+        finally:
+            self._end(client_id, ticket)
+
+    def active_clients(self) -> int:
+        with self._lock:
+            return len(self._latest)
@@ -0,0 +1,124 @@
+import struct
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import cv2
+
+BBox = Tuple[int, int, int, int]
+
+# cv2.imread flags for JPEG DCT-domain downscaling, by factor
+_REDUCED_COLOR = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+_REDUCED_GRAY = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+
+# Start-of-frame markers carry the image size; C4/C8/CC share the range but are not SOFs
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_size(buf: Any) -> Optional[Tuple[int, int]]:
+    """Return (width, height) from a JPEG header without decoding, or None if not a JPEG."""
+    data = memoryview(buf).cast('B')
+    n = len(data)
+    if n < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 4 <= n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        (length,) = struct.unpack('>H', data[i + 2:i + 4])
+        if marker in _SOF_MARKERS:
+            if i + 9 > n:
+                return None
+            h, w = struct.unpack('>HH', data[i + 5:i + 9])
+            return w, h
+        if marker == 0xDA:
+            return None
+        i += 2 + length
+    return None
+
+
+class DecodePlanner:
+    """Decode uploads at the smallest resolution and channel count the model can use.
+
+    JPEGs are decoded with IMREAD_REDUCED_* (1/2, 1/4 or 1/8 scale in the DCT
+    domain) as long as the short side stays at or above `min_side`. With
+    `grayscale`, images are decoded straight to one channel. Other formats are
+    decoded at full size. `decode` returns the frame together with the factor
+    that maps its pixel coordinates back to the uploaded image.
+    """
+
+    def __init__(self, min_side: int = 240, grayscale: bool = False):
+        self.min_side = int(min_side)
+        self.grayscale = grayscale
+
+    @classmethod
+    def for_bundle(cls, bundle: Dict[str, Any], face_fraction: float = 0.25, detect_side: int = 240) -> 'DecodePlanner':
+        """Planner for a loaded model bundle.
+
+        Face classifiers get a short side that keeps a face covering
+        `face_fraction` of it at least as large as the model input (and never
+        below `detect_side`, so the face detector still finds it). Ultralytics
+        models see the whole frame, so their input size is the bound.
+        Single-channel Keras/TFLite/ONNX models are decoded to grayscale.
+        """
+        kind, model = bundle['kind'], bundle['model']
+        if kind in ('keras', 'tflite', 'onnx') and hasattr(model, 'input_shape'):
+            _, h, w, c = model.input_shape
+            side = max(int(h or 0), int(w or 0))
+            return cls(max(detect_side, int(side / face_fraction)), grayscale=(c == 1))
+        if kind == 'torchscript':
+            return cls(max(detect_side, int(224 / face_fraction)))
+        imgsz = (getattr(model, 'overrides', None) or {}).get('imgsz') or 640
+        if isinstance(imgsz, (list, tuple)):
+            imgsz = max(imgsz)
+        return cls(int(imgsz))
+
+    def reduction(self, buf: Any) -> int:
+        """Largest JPEG reduction factor that keeps the short side >= min_side."""
+        size = jpeg_size(buf)
+        if size is None:
+            return 1
+        short = min(size)
+        for factor in (8, 4, 2):
+            if short // factor >= self.min_side:
+                return factor
+        return 1
+
+    def decode(self, buf: Any, reduce: bool = True) -> Tuple[Optional[np.ndarray], float]:
+        """Decode `buf`; returns (frame or None, scale from frame to original pixels)."""
+        factor = self.reduction(buf) if reduce else 1
+        flags = (_REDUCED_GRAY if self.grayscale else _REDUCED_COLOR)[factor]
+        frame = cv2.imdecode(np.frombuffer(buf, np.uint8), flags)
+        if frame is None or factor == 1:
+            return frame, 1.0
+        w, h = jpeg_size(buf)
+        # EXIF orientation may have swapped the axes, so compare the long sides
+        return frame, max(w, h) / float(max(frame.shape[:2]))
+
+
+def scale_bbox(bbox: Optional[BBox], scale: float) -> Optional[BBox]:
+    if bbox is None or scale == 1.0:
+        return bbox
+    x, y, w, h = bbox
+    return int(round(x * scale)), int(round(y * scale)), int(round(w * scale)), int(round(h * scale))
+
+
+def roi_to_frame(bbox: Optional[BBox], offset: Tuple[float, float], scale: float = 1.0) -> Optional[BBox]:
+    """Map a bbox found in a client-cropped ROI back to full-frame pixels.
+
+    The client cut the ROI at `offset` in its frame and shrank it by `scale`
+    (frame pixels per ROI pixel) before upload.
+    """
+    if bbox is None:
+        return None
+    x, y, w, h = bbox
+    ox, oy = offset
+    return (int(round(ox + x * scale)), int(round(oy + y * scale)),
+            int(round(w * scale)), int(round(h * scale)))
@@ -0,0 +1,230 @@
+"""Distill the MobileNetV2 teacher into a compact 48x48 grayscale student.
+
+The FER images are 48x48 grayscale; model_training.py upsamples them to
+224x224x3 for MobileNetV2. The student instead takes the native 48x48x1 crop
+(model._preprocess_for_keras handles C == 1) and is trained on a mix of the
+true labels and the teacher's temperature-softened predictions:
+
+    loss = alpha * T^2 * KL(softmax(teacher / T) || softmax(student / T))
+         + (1 - alpha) * CE(label, student)
+
+Teacher logits are computed once per image from the packed dataset (it is by
+far the expensive model), then the student trains on them with flip/shift
+augmentation only, which the teacher's prediction is close to invariant to.
+
+The saved student takes inputs in [0, 1] (what model.py feeds Keras models)
+and ends in a softmax, so load_model() serves its scores as probabilities.
+
+Reported against the teacher:
+  - accuracy on the labeled held-out split (split_indices, seed 123)
+  - top-1 agreement with the teacher on PrivateTest (accuracy too if labeled)
+  - parameters, file size and serving latency through model.classify_rois
+
+Usage (from backend/, after `python packed_dataset.py train` and `... test`):
+    python distill_student.py --teacher best_model.keras --output student_48x48.keras
+    python distill_student.py --teacher best_CNN_model.keras --temperature 2 --alpha 0.5
+"""
+import argparse
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+import model as model_ml
+from packed_dataset import BASE_DIR, open_packed, split_indices
+
+STUDENT_SHAPE = (48, 48, 1)
+
+
+def build_student(tf, num_classes: int, width: int = 32, dropout: float = 0.3) -> Any:
+    """Depthwise-separable CNN on 48x48x1; returns (softmax model, logits model) sharing weights."""
+    inputs = tf.keras.Input(shape=STUDENT_SHAPE)
+    x = tf.keras.layers.Conv2D(width, 3, padding='same', use_bias=False)(inputs)
+    x = tf.keras.layers.BatchNormalization()(x)
+    x = tf.keras.layers.ReLU()(x)
+    for filters in (width, 2 * width, 4 * width, 8 * width):
+        x = tf.keras.layers.SeparableConv2D(filters, 3, padding='same', use_bias=False)(x)
+        x = tf.keras.layers.BatchNormalization()(x)
+        x = tf.keras.layers.ReLU()(x)
+        x = tf.keras.layers.SeparableConv2D(filters, 3, padding='same', use_bias=False)(x)
+        x = tf.keras.layers.BatchNormalization()(x)
+        x = tf.keras.layers.ReLU()(x)
+        x = tf.keras.layers.MaxPooling2D()(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    x = tf.keras.layers.Dropout(dropout)(x)
+    logits = tf.keras.layers.Dense(num_classes, name='logits')(x)
+    probs = tf.keras.layers.Softmax(name='probs')(logits)
+    return tf.keras.Model(inputs, probs, name='student_48x48'), tf.keras.Model(inputs, logits)
+
+
+def teacher_logits(tf, teacher: Any, images: np.ndarray, batch_size: int) -> np.ndarray:
+    """Teacher logits for packed uint8 (N, 48, 48, 1) images, fed the way it was trained ([0, 255])."""
+    _, h, w, c = teacher.input_shape
+    softmax_out = getattr(teacher.layers[-1], 'activation', None) is tf.keras.activations.softmax
+    out = []
+    for i in range(0, len(images), batch_size):
+        x = tf.cast(images[i:i + batch_size], tf.float32)
+        if x.shape[1:3] != (h, w):
+            x = tf.image.resize(x, (h, w))
+        if c == 3 and x.shape[-1] == 1:
+            x = tf.image.grayscale_to_rgb(x)
+        y = np.asarray(teacher(x, training=False))
+        out.append(np.log(np.clip(y, 1e-7, 1.0)) if softmax_out else y)
+    return np.concatenate(out).astype(np.float32)
+
+
+def distillation_loss(tf, temperature: float, alpha: float):
+    """Loss over y = [label, teacher logits...] so Keras fit() can carry both targets."""
+    kld = tf.keras.losses.KLDivergence()
+
+    def loss(y, logits):
+        labels = tf.cast(y[:, 0], tf.int32)
+        soft_teacher = tf.nn.softmax(y[:, 1:] / temperature)
+        soft_student = tf.nn.softmax(logits / temperature)
+        kd = kld(soft_teacher, soft_student) * temperature ** 2
+        ce = tf.reduce_mean(tf.keras.losses.sparse_categorical_crossentropy(labels, logits, from_logits=True))
+        return alpha * kd + (1.0 - alpha) * ce
+
+    return loss
+
+
+def label_accuracy(tf):
+    def accuracy(y, logits):
+        labels = tf.cast(y[:, 0], tf.int64)
+        return tf.reduce_mean(tf.cast(tf.equal(tf.argmax(logits, axis=-1), labels), tf.float32))
+    return accuracy
+
+
+def make_dataset(tf, images: np.ndarray, labels: np.ndarray, logits: np.ndarray, batch_size: int, train: bool, seed: int) -> Any:
+    targets = np.concatenate([labels[:, None].astype(np.float32), logits], axis=1)
+    ds = tf.data.Dataset.from_tensor_slices((images, targets))
+    if train:
+        ds = ds.shuffle(len(images), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+    augment = tf.keras.Sequential([
+        tf.keras.layers.RandomFlip('horizontal'),
+        tf.keras.layers.RandomTranslation(0.1, 0.1),
+    ])
+
+    def _prep(x, y):
+        x = tf.cast(x, tf.float32) / 255.0
+        if train:
+            x = augment(x, training=True)
+        return x, y
+
+    return ds.map(_prep, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def serving_latency(path: str, crops: List[np.ndarray], batch_sizes: List[int], repeat: int) -> Dict[int, float]:
+    """p50 ms per classify_rois call, loading the file the way the server does."""
+    bundle = model_ml.load_model(path)
+    result = {}
+    for bs in batch_sizes:
+        batch = crops[:bs]
+        model_ml.classify_rois(batch, bundle)
+        lat = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            model_ml.classify_rois(batch, bundle)
+            lat.append((time.perf_counter() - t0) * 1000.0)
+        result[bs] = float(np.percentile(lat, 50))
+    return result
+
+
+def _accuracy(pred: np.ndarray, labels: np.ndarray) -> float:
+    known = labels >= 0
+    return float(np.mean(pred[known] == labels[known])) if known.any() else float('nan')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--teacher', default=os.path.join(BASE_DIR, 'best_model.keras'))
+    parser.add_argument('--packed', default=os.path.join(BASE_DIR, 'data', 'packed', 'train'))
+    parser.add_argument('--packed-test', default=os.path.join(BASE_DIR, 'data', 'packed', 'test'))
+    parser.add_argument('--output', default=os.path.join(BASE_DIR, 'student_48x48.keras'))
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--alpha', type=float, default=0.7, help='Weight of the distillation term')
+    parser.add_argument('--width', type=int, default=32, help='Filters in the first block')
+    parser.add_argument('--dropout', type=float, default=0.3)
+    parser.add_argument('--epochs', type=int, default=60)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--learning-rate', type=float, default=0.001)
+    parser.add_argument('--latency-batch-sizes', default='1,8')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=123)
+    args = parser.parse_args()
+
+    tf = model_ml._import_tensorflow()
+
+    packed = open_packed(args.packed)
+    if (packed.meta['height'], packed.meta['width'], packed.meta['channels']) != STUDENT_SHAPE:
+        raise SystemExit(f"{args.packed} is not packed as 48x48x1; repack with --size 48 --channels 1")
+    num_classes = len(packed.class_names)
+    train_idx, val_idx = split_indices(len(packed), validation_split=0.2, seed=args.seed)
+    train_x, train_y = packed.gather(train_idx)
+    val_x, val_y = packed.gather(val_idx)
+
+    teacher = tf.keras.models.load_model(args.teacher)
+    t0 = time.perf_counter()
+    train_t = teacher_logits(tf, teacher, train_x, args.batch_size)
+    val_t = teacher_logits(tf, teacher, val_x, args.batch_size)
+    print(f"Teacher logits for {len(train_x) + len(val_x)} images in {time.perf_counter() - t0:.1f}s")
+
+    student, student_logits = build_student(tf, num_classes, args.width, args.dropout)
+    student_logits.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=args.learning_rate),
+                           loss=distillation_loss(tf, args.temperature, args.alpha),
+                           metrics=[label_accuracy(tf)])
+    student_logits.fit(
+        make_dataset(tf, train_x, train_y, train_t, args.batch_size, True, args.seed),
+        validation_data=make_dataset(tf, val_x, val_y, val_t, args.batch_size, False, args.seed),
+        epochs=args.epochs,
+        callbacks=[
+            tf.keras.callbacks.EarlyStopping(monitor='val_accuracy', mode='max', patience=8, verbose=1, restore_best_weights=True),
+            tf.keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.2, patience=3, verbose=1, min_lr=1e-6),
+        ],
+    )
+    student.save(args.output)
+    print(f"Saved {args.output}")
+
+    # Accuracy / agreement, both models on the same images
+    def student_pred(images: np.ndarray) -> np.ndarray:
+        return np.argmax(student.predict(images.astype(np.float32) / 255.0, batch_size=256, verbose=0), axis=1)
+
+    rows: List[Tuple[str, str, str]] = []
+    teacher_val, student_val = np.argmax(val_t, axis=1), student_pred(val_x)
+    rows.append(('held-out accuracy', f'{_accuracy(teacher_val, val_y):.4f}', f'{_accuracy(student_val, val_y):.4f}'))
+    rows.append(('held-out agreement', '-', f'{np.mean(teacher_val == student_val):.4f}'))
+
+    crops = [img[..., 0] for img in val_x[:max(int(v) for v in args.latency_batch_sizes.split(','))]]
+    if os.path.exists(os.path.join(args.packed_test, 'meta.json')):
+        test = open_packed(args.packed_test)
+        test_x, test_y = test.gather(np.arange(len(test)))
+        private = np.array([image_id.startswith('PrivateTest') for image_id in test.ids], dtype=bool)
+        if private.any():
+            test_x, test_y = test_x[private], test_y[private]
+        teacher_test = np.argmax(teacher_logits(tf, teacher, test_x, args.batch_size), axis=1)
+        student_test = student_pred(test_x)
+        rows.append((f'PrivateTest agreement ({len(test_x)})', '-', f'{np.mean(teacher_test == student_test):.4f}'))
+        if (test_y >= 0).any():
+            rows.append(('PrivateTest accuracy', f'{_accuracy(teacher_test, test_y):.4f}', f'{_accuracy(student_test, test_y):.4f}'))
+        crops = [img[..., 0] for img in test_x[:len(crops)]]
+    else:
+        print(f"No packed test split at {args.packed_test}; run `python packed_dataset.py test` for PrivateTest numbers")
+
+    rows.append(('parameters', f'{teacher.count_params():,}', f'{student.count_params():,}'))
+    rows.append(('file size (MiB)', f'{os.path.getsize(args.teacher) / 2**20:.2f}', f'{os.path.getsize(args.output) / 2**20:.2f}'))
+    batch_sizes = [int(v) for v in args.latency_batch_sizes.split(',') if v.strip()]
+    teacher_lat = serving_latency(args.teacher, crops, batch_sizes, args.repeat)
+    student_lat = serving_latency(args.output, crops, batch_sizes, args.repeat)
+    for bs in batch_sizes:
+        rows.append((f'classify_rois p50 ms (batch {bs})', f'{teacher_lat[bs]:.2f}', f'{student_lat[bs]:.2f}'))
+
+    print(f"\n| metric | teacher ({os.path.basename(args.teacher)}) | student ({os.path.basename(args.output)}) |")
+    print('|---|---:|---:|')
+    for name, t, s in rows:
+        print(f'| {name} | {t} | {s} |')
+
+
+if __name__ == '__main__':
+    main()
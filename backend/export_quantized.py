@@ -0,0 +1,198 @@
+"""Export a Keras model to quantized TFLite or ONNX and report the trade-off.
+
+Calibration images come from backend/data/train. A disjoint, class-stratified
+held-out sample of the same folders is used to compare the exported model with
+the original: accuracy, agreement with the original's predictions, file size
+and single-image latency. The report is printed and saved next to the output
+as <output>.report.json.
+
+Inputs are preprocessed exactly as the server does (model.preprocess_batch),
+so the calibration ranges match serving traffic.
+
+Usage (from backend/):
+    python export_quantized.py --model best_CNN_model.keras --format tflite --quant int8
+    python export_quantized.py --model best_CNN_model.keras --format onnx --quant int8
+Then serve it with MOODCAM_MODEL_PATH=best_CNN_model.int8.tflite python link.py
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+import cv2
+
+import model as model_ml
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def split_images(train_dir: str, calib_count: int, eval_count: int, seed: int) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """Pick disjoint calibration paths and labelled held-out (path, label) pairs, stratified by class."""
+    rng = random.Random(seed)
+    classes = sorted(d for d in os.listdir(train_dir) if os.path.isdir(os.path.join(train_dir, d)))
+    per_class = {c: sorted(glob.glob(os.path.join(train_dir, c, '*.jpg'))) for c in classes}
+    for paths in per_class.values():
+        rng.shuffle(paths)
+    total = sum(len(p) for p in per_class.values())
+    calib: List[str] = []
+    held_out: List[Tuple[str, str]] = []
+    for c, paths in per_class.items():
+        share = len(paths) / total
+        n_cal = max(1, int(round(calib_count * share)))
+        n_eval = max(1, int(round(eval_count * share)))
+        calib.extend(paths[:n_cal])
+        held_out.extend((p, c) for p in paths[n_cal:n_cal + n_eval])
+    rng.shuffle(calib)
+    return calib, held_out
+
+
+def preprocess(paths: List[str], keras_model: Any) -> Iterator[np.ndarray]:
+    for p in paths:
+        img = cv2.imread(p, cv2.IMREAD_COLOR)
+        if img is not None:
+            # Copy out of the reused preprocessing buffer before the next image
+            yield model_ml.preprocess_batch([img], {'kind': 'keras', 'model': keras_model}).copy()
+
+
+def export_tflite(keras_model: Any, quant: str, calib_paths: List[str], output: str) -> None:
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    if quant in ('int8', 'float16', 'dynamic'):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quant == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quant == 'int8':
+        def representative_dataset():
+            for x in preprocess(calib_paths, keras_model):
+                yield [x.astype(np.float32)]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    with open(output, 'wb') as f:
+        f.write(converter.convert())
+
+
+def export_onnx(keras_model: Any, quant: str, calib_paths: List[str], output: str) -> None:
+    import tensorflow as tf
+    import tf2onnx  # type: ignore
+
+    _, h, w, c = keras_model.input_shape
+    fp32_path = output if quant == 'none' else output + '.fp32.onnx'
+    spec = (tf.TensorSpec((None, h, w, c), tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(keras_model, input_signature=spec, opset=13, output_path=fp32_path)
+    if quant == 'none':
+        return
+
+    if quant == 'float16':
+        import onnx  # type: ignore
+        from onnxconverter_common import float16  # type: ignore
+        onnx.save(float16.convert_float_to_float16(onnx.load(fp32_path), keep_io_types=True), output)
+    elif quant == 'dynamic':
+        from onnxruntime.quantization import QuantType, quantize_dynamic  # type: ignore
+        quantize_dynamic(fp32_path, output, weight_type=QuantType.QInt8)
+    else:
+        from onnxruntime.quantization import (  # type: ignore
+            CalibrationDataReader, QuantFormat, QuantType, quantize_static,
+        )
+
+        class _Reader(CalibrationDataReader):
+            def __init__(self):
+                self._it = iter({'input': x.astype(np.float32)} for x in preprocess(calib_paths, keras_model))
+
+            def get_next(self):
+                return next(self._it, None)
+
+        quantize_static(
+            fp32_path, output, _Reader(),
+            quant_format=QuantFormat.QDQ, activation_type=QuantType.QInt8,
+            weight_type=QuantType.QInt8, per_channel=True,
+        )
+    os.remove(fp32_path)
+
+
+def evaluate(bundle: Dict[str, Any], held_out: List[Tuple[str, str]], batch_size: int, latency_samples: int) -> Dict[str, Any]:
+    frames, labels = [], []
+    for p, label in held_out:
+        img = cv2.imread(p, cv2.IMREAD_COLOR)
+        if img is not None:
+            frames.append(img)
+            labels.append(label)
+    preds: List[str] = []
+    for i in range(0, len(frames), batch_size):
+        preds.extend(r[0] for r in model_ml.predict_batch(frames[i:i + batch_size], bundle, detect_faces=False))
+    model_ml.predict_batch(frames[:1], bundle, detect_faces=False)  # warm the single-image shape
+    lat = []
+    for frame in frames[:latency_samples]:
+        t0 = time.perf_counter()
+        model_ml.predict_batch([frame], bundle, detect_faces=False)
+        lat.append((time.perf_counter() - t0) * 1000.0)
+    lat.sort()
+    return {
+        'predictions': preds,
+        'accuracy': float(np.mean([p == t for p, t in zip(preds, labels)])) if labels else 0.0,
+        'latency_p50_ms': lat[len(lat) // 2] if lat else 0.0,
+        'latency_mean_ms': float(np.mean(lat)) if lat else 0.0,
+        'file_bytes': os.path.getsize(bundle['path']),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=os.path.join(BASE_DIR, 'best_CNN_model.keras'))
+    parser.add_argument('--format', choices=['tflite', 'onnx'], default='tflite')
+    parser.add_argument('--quant', choices=['int8', 'float16', 'dynamic', 'none'], default='int8')
+    parser.add_argument('--output', help='Defaults to <model>.<quant>.<format>')
+    parser.add_argument('--train-dir', default=os.path.join(BASE_DIR, 'data', 'train'))
+    parser.add_argument('--calib-count', type=int, default=500)
+    parser.add_argument('--eval-count', type=int, default=2000)
+    parser.add_argument('--latency-samples', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=123)
+    args = parser.parse_args()
+
+    output = args.output or f"{os.path.splitext(args.model)[0]}.{args.quant}.{args.format}"
+    source = model_ml.load_model(args.model)
+    if source['kind'] != 'keras':
+        raise SystemExit(f"Expected a Keras model, got {source['kind']}")
+    calib, held_out = split_images(args.train_dir, args.calib_count, args.eval_count, args.seed)
+    print(f"{len(calib)} calibration images, {len(held_out)} held-out images")
+
+    exporter = export_tflite if args.format == 'tflite' else export_onnx
+    # Export the Keras model itself, not the compiled serving wrapper
+    keras_model = getattr(source['model'], 'keras_model', source['model'])
+    exporter(keras_model, args.quant, calib, output)
+    print(f"Wrote {output}")
+
+    exported = model_ml.load_model(output)
+    base = evaluate(source, held_out, args.batch_size, args.latency_samples)
+    quant = evaluate(exported, held_out, args.batch_size, args.latency_samples)
+    agreement = float(np.mean([a == b for a, b in zip(base['predictions'], quant['predictions'])]))
+    report = {
+        'source': args.model,
+        'output': output,
+        'format': args.format,
+        'quant': args.quant,
+        'held_out_images': len(base['predictions']),
+        'agreement': agreement,
+        'accuracy_delta': quant['accuracy'] - base['accuracy'],
+        'speedup_p50': base['latency_p50_ms'] / quant['latency_p50_ms'] if quant['latency_p50_ms'] else None,
+    }
+    for name, res in (('keras', base), (args.format, quant)):
+        report[name] = {k: v for k, v in res.items() if k != 'predictions'}
+        print(
+            f"{name:<8} acc {res['accuracy']:.4f}   p50 {res['latency_p50_ms']:7.2f} ms   "
+            f"size {res['file_bytes'] / 1e6:7.2f} MB"
+        )
+    print(f"accuracy delta {report['accuracy_delta']:+.4f}, agreement {agreement:.4f}, speedup {report['speedup_p50'] or 0:.2f}x")
+    with open(output + '.report.json', 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+import cv2
+
+BBox = Tuple[int, int, int, int]
+
+# Haar cascades slide a fixed 24x24 window; faces smaller than this after downscaling are lost
+_CASCADE_WINDOW = 24
+
+
+class FaceDetector:
+    """Haar-cascade face detector tuned for per-frame use.
+
+    - The cascade XML is parsed once per thread (CascadeClassifier is not thread-safe).
+    - Detection runs on a copy downscaled so its longest side is at most `max_side`
+      pixels, and boxes are mapped back to full-frame coordinates.
+    - When a previous bbox is given, only a window around it is searched first;
+      the full frame is searched only if the face is lost.
+    """
+
+    def __init__(
+        self,
+        cascade_path: Optional[str] = None,
+        max_side: int = 320,
+        scale_factor: float = 1.1,
+        min_neighbors: int = 5,
+        min_size: int = 60,
+        roi_margin: float = 0.5,
+    ):
+        if cascade_path is None:
+            cascade_path = os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+        self.cascade_path = cascade_path
+        self.max_side = int(max_side)
+        self.scale_factor = float(scale_factor)
+        self.min_neighbors = int(min_neighbors)
+        self.min_size = int(min_size)
+        self.roi_margin = float(roi_margin)
+        self._local = threading.local()
+
+    def _cascade(self) -> 'cv2.CascadeClassifier':
+        cascade = getattr(self._local, 'cascade', None)
+        if cascade is None:
+            cascade = cv2.CascadeClassifier(self.cascade_path)
+            if cascade.empty():
+                raise RuntimeError(f'Failed to load face cascade: {self.cascade_path}')
+            self._local.cascade = cascade
+        return cascade
+
+    def _search(self, gray: np.ndarray, ox: int = 0, oy: int = 0) -> List[BBox]:
+        h, w = gray.shape[:2]
+        if h == 0 or w == 0:
+            return []
+        # Never shrink so far that the smallest wanted face drops below the cascade window
+        scale = min(1.0, max(self.max_side / float(max(h, w)), _CASCADE_WINDOW / float(self.min_size)))
+        small = gray
+        if scale < 1.0:
+            small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        min_px = max(_CASCADE_WINDOW, int(round(self.min_size * scale)))
+        faces = self._cascade().detectMultiScale(
+            small, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors, minSize=(min_px, min_px)
+        )
+        inv = 1.0 / scale
+        return [
+            (int(round(x * inv)) + ox, int(round(y * inv)) + oy, int(round(bw * inv)), int(round(bh * inv)))
+            for (x, y, bw, bh) in faces
+        ]
+
+    def _window(self, bbox: BBox, width: int, height: int) -> Tuple[int, int, int, int]:
+        x, y, w, h = bbox
+        mx = int(w * self.roi_margin)
+        my = int(h * self.roi_margin)
+        x0 = max(0, x - mx)
+        y0 = max(0, y - my)
+        x1 = min(width, x + w + mx)
+        y1 = min(height, y + h + my)
+        return x0, y0, x1, y1
+
+    def detect_all(self, frame: np.ndarray, prev_bbox: Optional[BBox] = None) -> List[BBox]:
+        """Return every face as (x, y, w, h) in full-frame pixels.
+
+        `frame` may be BGR or already grayscale.
+        """
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if prev_bbox is not None:
+            x0, y0, x1, y1 = self._window(prev_bbox, gray.shape[1], gray.shape[0])
+            if x1 > x0 and y1 > y0:
+                faces = self._search(gray[y0:y1, x0:x1], x0, y0)
+                if faces:
+                    return faces
+        return self._search(gray)
+
+    def detect(self, frame: np.ndarray, prev_bbox: Optional[BBox] = None) -> Optional[BBox]:
+        """Return the largest face as (x, y, w, h), or None."""
+        faces = self.detect_all(frame, prev_bbox)
+        if not faces:
+            return None
+        return max(faces, key=lambda box: box[2] * box[3])
@@ -0,0 +1,52 @@
+"""Production serving: gunicorn with pre-forked workers, each warmed up before taking traffic.
+
+Each worker imports link.py, loads the model and runs a warmup inference
+before it takes traffic. Framework thread pools are split across workers so
+they do not oversubscribe the cores.
+
+Usage (from backend/):
+    gunicorn -c gunicorn.conf.py link:app
+    MOODCAM_WORKERS=4 MOODCAM_INTRA_OP_THREADS=2 gunicorn -c gunicorn.conf.py link:app
+
+Environment:
+    MOODCAM_BIND              listen address (default 0.0.0.0:8000)
+    MOODCAM_WORKERS           worker processes (default: number of cores)
+    MOODCAM_WORKER_THREADS    request threads per worker (default 4); several
+                              threads let the batching engine group requests
+                              and keep WebSocket streams open
+    MOODCAM_INTRA_OP_THREADS  framework threads per op in each worker
+                              (default: cores // workers, at least 1)
+    MOODCAM_INTER_OP_THREADS  framework threads across ops (default 1)
+    MOODCAM_PRELOAD           set to 1 to load the model once in the master and
+                              share the weights copy-on-write between workers.
+                              Off by default: TensorFlow and PyTorch start
+                              runtime threads while loading, and threads do
+                              not survive fork. Only use it for .tflite/.onnx
+                              models, whose inference stays in the worker.
+
+Prometheus metrics, the prediction cache and /healthz are per worker.
+"""
+import os
+
+_cores = os.cpu_count() or 1
+
+bind = os.environ.get('MOODCAM_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('MOODCAM_WORKERS', str(_cores)))
+worker_class = 'gthread'
+threads = int(os.environ.get('MOODCAM_WORKER_THREADS', '4'))
+preload_app = os.environ.get('MOODCAM_PRELOAD', '0') == '1'
+timeout = 120
+
+# Read by model.py at import, which happens after this file is evaluated
+os.environ.setdefault('MOODCAM_INTRA_OP_THREADS', str(max(1, _cores // max(1, workers))))
+os.environ.setdefault('MOODCAM_INTER_OP_THREADS', '1')
+os.environ.setdefault('OMP_NUM_THREADS', os.environ['MOODCAM_INTRA_OP_THREADS'])
+# Warm up in each worker (after fork when preloading)
+os.environ['MOODCAM_DEFER_WARMUP'] = '1'
+
+
+def post_worker_init(worker):
+    import service
+
+    service.warmup_worker()
+    worker.log.info("Worker %s warmed up: %s", worker.pid, service.startup)
@@ -0,0 +1,83 @@
+import threading
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+class CompiledKerasModel:
+    """Keras model served through traced graph functions instead of Keras' predict loop.
+
+    One concrete function is traced per batch-size bucket, with a fully static
+    input shape. A batch is zero-padded up to the smallest bucket that holds
+    it (larger ones are split into chunks of the largest bucket), so at most
+    len(buckets) traces ever happen. Nothing is traced on construction:
+    `warmup()` traces every bucket up front (model.warmup calls it in each
+    serving process), otherwise a bucket is traced on its first batch.
+    Exposes the same `input_shape` / `predict_on_batch` surface as the Keras
+    model, so model.py drives it unchanged; the original model stays available as `keras_model`.
+    """
+
+    def __init__(self, keras_model: Any, tf: Any, buckets: Sequence[int] = DEFAULT_BUCKETS, jit_compile: bool = False):
+        self.keras_model = keras_model
+        self.input_shape: Tuple[Optional[int], int, int, int] = tuple(keras_model.input_shape)  # type: ignore[assignment]
+        self.input_dtype = np.float32
+        self.buckets = tuple(sorted({int(b) for b in buckets if int(b) > 0}))
+        if not self.buckets:
+            raise ValueError('At least one positive batch bucket is required')
+        self._tf = tf
+
+        @tf.function(jit_compile=jit_compile, reduce_retracing=True)
+        def forward(x):
+            return keras_model(x, training=False)
+
+        self._forward = forward
+        self._fns: Dict[int, Any] = {}
+        self._trace_lock = threading.Lock()
+        # Padding buffers per thread: the server calls in from several threads
+        self._local = threading.local()
+
+    def _fn(self, b: int) -> Any:
+        fn = self._fns.get(b)
+        if fn is None:
+            with self._trace_lock:
+                fn = self._fns.get(b)
+                if fn is None:
+                    _, h, w, c = self.input_shape
+                    spec = self._tf.TensorSpec((b, h, w, c), self._tf.float32)
+                    fn = self._fns[b] = self._forward.get_concrete_function(spec)
+        return fn
+
+    def warmup(self) -> None:
+        """Trace and run every bucket once so graph optimization and kernel setup happen before traffic."""
+        for b in self.buckets:
+            self.predict_on_batch(np.zeros((b,) + tuple(self.input_shape[1:]), np.float32))
+
+    def _bucket(self, n: int) -> int:
+        for b in self.buckets:
+            if b >= n:
+                return b
+        return self.buckets[-1]
+
+    def _run(self, x: np.ndarray) -> np.ndarray:
+        n = x.shape[0]
+        b = self._bucket(n)
+        if n < b:
+            padded: Dict[int, np.ndarray] = self._local.__dict__.setdefault('padded', {})
+            buf = padded.get(b)
+            if buf is None:
+                buf = padded[b] = np.zeros((b,) + x.shape[1:], np.float32)
+            buf[:n] = x
+            buf[n:] = 0.0
+            x = buf
+        out = self._fn(b)(self._tf.constant(x, dtype=self._tf.float32))
+        if isinstance(out, (list, tuple)):
+            out = out[0]
+        return out.numpy()[:n]
+
+    def predict_on_batch(self, x: np.ndarray) -> np.ndarray:
+        top = self.buckets[-1]
+        if x.shape[0] <= top:
+            return self._run(x)
+        return np.concatenate([self._run(x[i:i + top]) for i in range(0, x.shape[0], top)], axis=0)
@@ -1,89 +1,416 @@
-from flask import Flask, request, jsonify
+import time
+
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-import cv2
-import numpy as np
+from flask_sock import Sock
 import base64
-import logging
+import functools
+import json
+import shutil
+import threading
 
-import model as model_ml
+import metrics
+import service
+from coalescing import Superseded
+from model_registry import ModelNotFound
+from service import (
+    ImageDecodeError, coalescer, decode_base64, keyframe_gate, logger, model_error_message, parse_roi,
+    predict_image_bytes, prediction_response, registry, roi_bbox, stream_response,
+)
+from streaming import StreamSession
 
 app = Flask(__name__)
 CORS(app)
+sock = Sock(app)
+
+
+@app.before_request
+def _metrics_start():
+    g.metrics_endpoint = request.endpoint or 'unknown'
+    g.metrics_started = time.perf_counter()
+    metrics.IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+
+
+@app.after_request
+def _metrics_record(response):
+    endpoint = g.get('metrics_endpoint', 'unknown')
+    metrics.REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+    if response.status_code >= 400:
+        metrics.ERRORS.inc(endpoint=endpoint)
+    started = g.get('metrics_started')
+    if started is not None:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+    return response
+
+
+@app.teardown_request
+def _metrics_finish(exc):
+    endpoint = g.pop('metrics_endpoint', None)
+    if endpoint is not None:
+        metrics.IN_FLIGHT.dec(endpoint=endpoint)
+
+
+def _serialize(payload: dict):
+    with metrics.STAGE_SECONDS.time(stage='serialize'):
+        return jsonify(payload)
+
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger("moodcam")
+def _request_image_buffer():
+    """Return the raw image bytes of a binary or multipart request without copying them."""
+    if request.mimetype == 'multipart/form-data':
+        f = request.files.get('image') or next(iter(request.files.values()), None)
+        if f is None:
+            return None
+        stream = f.stream
+        # Small uploads are spooled in memory; expose that buffer directly
+        if hasattr(stream, 'getbuffer'):
+            return stream.getbuffer()
+        return stream.read()
+    return request.get_data(cache=False)
 
-try:
-    model_object = model_ml.load_model()
-    logger.info("Model loaded successfully")
-except Exception as e:
-    logger.exception("Failed to load model: %s", e)
-    model_object = None
+
+def _client_id():
+    """Client tag from the X-Client-Id header; requests without one are never coalesced."""
+    return request.headers.get('X-Client-Id') or None
+
+
+def _superseded_response(endpoint: str):
+    """Answer for a frame replaced by a newer one from the same client; clients just drop it."""
+    metrics.SUPERSEDED.inc(endpoint=endpoint)
+    return jsonify({'superseded': True})
+
+
+def _model_name():
+    """Model requested with ?model=<name> or an X-Model header; None selects the default."""
+    return request.args.get('model') or request.headers.get('X-Model') or None
+
+
+def _model_error(e: ModelNotFound):
+    return jsonify({'error': model_error_message(e)}), service.model_error_status()
+
+
+def _uses_model(view):
+    """Lease the requested model for the duration of the view as `g.model`."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            resident = registry.acquire(_model_name())
+        except ModelNotFound as e:
+            return _model_error(e)
+        g.model = resident
+        try:
+            return view(*args, **kwargs)
+        finally:
+            registry.release(resident)
+    return wrapper
 
 
 @app.get('/healthz')
 def healthz():
-    status = 'ok' if model_object is not None else 'model-not-loaded'
-    return jsonify({'status': status})
+    status = 'ok' if registry.default_name is not None else 'model-not-loaded'
+    return jsonify({
+        'status': status,
+        'startup': service.startup,
+        'cache': service.prediction_cache.stats(),
+        'models': registry.stats(),
+        'coalescing': {'active_clients': coalescer.active_clients()},
+        'capabilities': service.default_capabilities(),
+    })
+
+
+@app.get('/capabilities')
+@_uses_model
+def capabilities():
+    """Input the selected model needs, so clients can send smaller frames or face crops.
+
+    Reports the model input (size, channels, layout, dtype), the capture size
+    beyond which frames are shrunk on the server anyway, the target frame
+    rate, and how to cut a face ROI (see /predict/base64).
+    """
+    return jsonify(service.capabilities(g.model))
+
+
+@app.get('/metrics')
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.post('/predict/base64')
+@_uses_model
 def predict_base64():
-    if model_object is None:
-        return jsonify({'error': 'Model not loaded'}), 500
+    """Classify the face in a base64 image.
+
+    Frames tagged with an X-Client-Id header are coalesced per client: if a
+    newer frame from the same client arrives before this one has started
+    inference, this one is answered 200 {"superseded": true} without being
+    classified. The same applies to /predict/binary and /analyze.
 
+    The image may be a face crop instead of the full frame: `roi_offset`
+    ([x, y], where the crop starts in the frame) and optional `roi_scale`
+    (frame pixels per crop pixel, if the crop was shrunk) map the returned
+    bbox back to full-frame coordinates. See /capabilities for crop sizing.
+    """
     data = request.get_json(silent=True)
     if not data or 'image_base64' not in data:
         return jsonify({'error': 'Missing image_base64'}), 400
 
-    b64 = data['image_base64']
     try:
-        if ',' in b64:
-            b64 = b64.split(',', 1)[1]
-        image_bytes = base64.b64decode(b64)
-        np_arr = np.frombuffer(image_bytes, np.uint8)
-        frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        if frame is None:
-            return jsonify({'error': 'Failed to decode image'}), 400
+        image_bytes = decode_base64(data['image_base64'])
+    except Exception as e:
+        return jsonify({'error': f'Error decoding image: {str(e)}'}), 400
+    try:
+        roi = parse_roi(data.get('roi_offset'), data.get('roi_scale'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid ROI: {str(e)}'}), 400
+
+    try:
+        with coalescer.frame(_client_id()) as should_run:
+            label, prob, bbox = predict_image_bytes(image_bytes, g.model, should_run)
+        return _serialize(prediction_response(label, prob, roi_bbox(bbox, roi)))
+    except Superseded:
+        return _superseded_response('predict_base64')
+    except ImageDecodeError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("Prediction error: %s", e)
+        return jsonify({'error': f'Error during model prediction: {str(e)}'}), 500
+
+
+@app.post('/predict/binary')
+@_uses_model
+def predict_binary():
+    """Same as /predict/base64, but the body is the raw JPEG/PNG bytes.
+
+    Accepts `application/octet-stream` (or `image/*`) bodies, or multipart
+    uploads with the file in the `image` field. Face crops pass
+    `?roi_offset=x,y&roi_scale=s`.
+    """
+    try:
+        buf = _request_image_buffer()
+    except Exception as e:
+        return jsonify({'error': f'Error decoding image: {str(e)}'}), 400
+    if not buf:
+        return jsonify({'error': 'Missing image data'}), 400
+    try:
+        roi = parse_roi(request.args.get('roi_offset'), request.args.get('roi_scale'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid ROI: {str(e)}'}), 400
+
+    try:
+        with coalescer.frame(_client_id()) as should_run:
+            label, prob, bbox = predict_image_bytes(buf, g.model, should_run)
+        return _serialize(prediction_response(label, prob, roi_bbox(bbox, roi)))
+    except Superseded:
+        return _superseded_response('predict_binary')
+    except ImageDecodeError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("Prediction error: %s", e)
+        return jsonify({'error': f'Error during model prediction: {str(e)}'}), 500
+
+
+@app.post('/predict/faces')
+@_uses_model
+def predict_faces():
+    """Classify every face in the image with one model call.
+
+    Takes a JSON `image_base64` body or a raw/multipart body like
+    /predict/binary. The optional `max_faces` query parameter keeps only the
+    largest faces. Responds with {"faces": [{label, probability, bbox}], "count"}.
+    """
+    try:
+        if request.is_json:
+            data = request.get_json(silent=True)
+            if not data or 'image_base64' not in data:
+                return jsonify({'error': 'Missing image_base64'}), 400
+            buf = decode_base64(data['image_base64'])
+        else:
+            buf = _request_image_buffer()
+        max_faces = request.args.get('max_faces', type=int)
     except Exception as e:
         return jsonify({'error': f'Error decoding image: {str(e)}'}), 400
+    if not buf:
+        return jsonify({'error': 'Missing image data'}), 400
 
     try:
-        label, prob, bbox = model_ml.predict(frame, model_object)
-        resp = {'label': label, 'probability': float(prob), 'face_found': bool(bbox is not None)}
-        if bbox is not None:
-            resp['bbox'] = [int(bbox[0]), int(bbox[1]), int(bbox[2]), int(bbox[3])]
-        return jsonify(resp)
+        faces = service.predict_faces_bytes(buf, g.model, max_faces)
+        return _serialize(service.faces_response(faces))
+    except ImageDecodeError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.exception("Prediction error: %s", e)
         return jsonify({'error': f'Error during model prediction: {str(e)}'}), 500
 
 
 @app.post('/analyze')
+@_uses_model
 def analyze_frame():
-    if model_object is None:
-        return jsonify({'error': 'Model not loaded'}), 500
-
     data = request.get_json(silent=True)
     if not data or 'image' not in data:
         return jsonify({'error': 'No image data provided in the request'}), 400
 
     try:
         header, encoded = data['image'].split(",", 1)
-        image_data = base64.b64decode(encoded)
-        np_arr = np.frombuffer(image_data, np.uint8)
-        frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        if frame is None:
-            return jsonify({'error': 'Failed to decode image'}), 400
+        image_data = decode_base64(encoded)
     except Exception as e:
         return jsonify({'error': f'Error decoding image: {str(e)}'}), 400
 
     try:
-        label, prob, _ = model_ml.predict(frame, model_object)
-        return jsonify({'prediction': label, 'confidence': float(prob)})
+        with coalescer.frame(_client_id()) as should_run:
+            label, prob, bbox = predict_image_bytes(image_data, g.model, should_run)
+        metrics.record_prediction(bbox is not None)
+        return _serialize({'prediction': label, 'confidence': float(prob)})
+    except Superseded:
+        return _superseded_response('analyze_frame')
+    except ImageDecodeError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Error during model prediction: {str(e)}'}), 500
 
 
+def _bulk_items():
+    """Images of a multipart upload (every file part, zips expanded) or of a raw zip body."""
+    if request.mimetype == 'multipart/form-data':
+        files = [(f.filename or key, f.mimetype, f.stream) for key in request.files for f in request.files.getlist(key)]
+        return service.multipart_items(files)
+    spooled = service.spool_body()
+    shutil.copyfileobj(request.stream, spooled)
+    return service.zip_body_items(spooled, request.mimetype)
+
+
+@app.post('/predict/bulk')
+def predict_bulk():
+    """Classify many images from one request, streaming results as newline-delimited JSON.
+
+    The body is a multipart upload with any number of image (or zip) file
+    parts, or a raw zip archive. Each result line is the /predict/binary
+    response plus `index` (position in the upload) and `name`, or
+    {index, name, error} for an image that could not be processed; lines
+    arrive as images finish, not in upload order. The last line is
+    {"done": true, "count", "errors"} (plus `truncated` when more than
+    MOODCAM_BULK_MAX_IMAGES were sent).
+    """
+    # The model lease has to outlive this view, until the response is closed
+    try:
+        resident = registry.acquire(_model_name())
+    except ModelNotFound as e:
+        return _model_error(e)
+    try:
+        items = _bulk_items()
+    except Exception as e:
+        registry.release(resident)
+        return jsonify({'error': str(e)}), 400
+    response = Response(stream_with_context(service.bulk_lines(items, resident)), mimetype='application/x-ndjson')
+    response.call_on_close(lambda: registry.release(resident))
+    return response
+
+
+@app.get('/models')
+def list_models():
+    return jsonify(registry.stats())
+
+
+@app.post('/models')
+def add_model():
+    """Load (or replace) a model in the background: {"name", "path", "default": bool}.
+
+    Answers 202 right away; requests keep using the resident models until the
+    new one is loaded and warmed, then `default: true` switches traffic to it.
+    Each server process has its own registry, so under gunicorn this only
+    affects the worker that handled the request; preload fleet-wide models
+    with MOODCAM_MODELS instead.
+    """
+    data = request.get_json(silent=True) or {}
+    name, path = data.get('name'), data.get('path')
+    if not name or not path:
+        return jsonify({'error': 'Missing name or path'}), 400
+    try:
+        full = service.resolve_model_path(path)
+    except (ValueError, FileNotFoundError) as e:
+        return jsonify({'error': str(e)}), 400
+    registry.load_async(name, full, make_default=bool(data.get('default')))
+    return jsonify({'loading': name, 'path': full}), 202
+
+
+@app.post('/models/<name>/default')
+def set_default_model(name):
+    try:
+        registry.set_default(name)
+    except ModelNotFound:
+        return jsonify({'error': f'Unknown model: {name}'}), 404
+    return jsonify(registry.stats())
+
+
+@app.delete('/models/<name>')
+def unload_model(name):
+    try:
+        registry.unload(name)
+    except ModelNotFound:
+        return jsonify({'error': f'Unknown model: {name}'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify(registry.stats())
+
+
+@sock.route('/ws/stream')
+def stream(ws):
+    """Realtime analysis over one persistent connection.
+
+    Client -> server: binary messages with JPEG/PNG bytes, or text messages
+    `{"image_base64": ..., "frame_id": n}`.
+    Server -> client: one JSON message per processed frame, shaped like the
+    /predict/base64 response plus `frame_id`, `latency_ms`, `dropped` and
+    `reused` (true when the face was unchanged and the classifier was skipped).
+    Only the newest pending frame is processed; stale ones are dropped.
+    The model is chosen once per connection with ?model=<name>, and keyframe
+    gating can be turned off with ?keyframes=0.
+    """
+    try:
+        resident = registry.acquire(_model_name())
+    except ModelNotFound as e:
+        ws.send(json.dumps({'error': model_error_message(e)}))
+        return
+
+    send_lock = threading.Lock()
+
+    def send(payload: dict) -> None:
+        with send_lock:
+            ws.send(json.dumps(payload))
+
+    def on_result(frame_id, prediction, info):
+        send(stream_response(frame_id, prediction, info))
+
+    def on_error(frame_id, message):
+        try:
+            send({'error': message, 'frame_id': frame_id})
+        except Exception:
+            pass
+
+    session = StreamSession(
+        resident.engine, on_result, on_error, keyframe_gate(request.args.get('keyframes')), resident.decoder,
+    )
+    try:
+        while True:
+            msg = ws.receive()
+            if msg is None:
+                break
+            if isinstance(msg, (bytes, bytearray)):
+                session.push(msg)
+                continue
+            try:
+                data = json.loads(msg)
+                b64 = data['image_base64']
+                if ',' in b64:
+                    b64 = b64.split(',', 1)[1]
+                frame_id = data.get('frame_id')
+                session.push(base64.b64decode(b64), int(frame_id) if frame_id is not None else None)
+            except Exception as e:
+                on_error(None, f'Error decoding image: {str(e)}')
+    finally:
+        session.close()
+        registry.release(resident)
+        logger.info("Stream session ended: %s", session.stats())
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
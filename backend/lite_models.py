@@ -0,0 +1,127 @@
+import threading
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+
+def _tflite_interpreter_class() -> Any:
+    """Prefer the standalone runtimes; fall back to the one bundled with TensorFlow."""
+    try:
+        from tflite_runtime.interpreter import Interpreter  # type: ignore
+        return Interpreter
+    except Exception:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter  # type: ignore
+        return Interpreter
+    except Exception:
+        pass
+    try:
+        import tensorflow as tf  # type: ignore
+    except Exception as e:
+        raise RuntimeError(
+            "No TFLite runtime installed. Install with `pip install tflite-runtime` (or tensorflow)."
+        ) from e
+    return tf.lite.Interpreter
+
+
+def _import_onnxruntime() -> Any:
+    try:
+        import onnxruntime as ort  # type: ignore
+    except Exception as e:
+        raise RuntimeError("onnxruntime not installed. Install with `pip install onnxruntime`.") from e
+    return ort
+
+
+def import_runtime(ext: str) -> Any:
+    """Import the runtime for a '.tflite' or '.onnx' file (cached by Python after the first call)."""
+    return _tflite_interpreter_class() if ext == '.tflite' else _import_onnxruntime()
+
+
+def _quantize(x: np.ndarray, detail: dict) -> np.ndarray:
+    dtype = detail['dtype']
+    if dtype in (np.int8, np.uint8):
+        scale, zero_point = detail['quantization']
+        info = np.iinfo(dtype)
+        return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(dtype)
+    return x.astype(dtype, copy=False)
+
+
+def _dequantize(y: np.ndarray, detail: dict) -> np.ndarray:
+    if detail['dtype'] in (np.int8, np.uint8):
+        scale, zero_point = detail['quantization']
+        return (y.astype(np.float32) - zero_point) * scale
+    return y.astype(np.float32, copy=False)
+
+
+class TFLiteModel:
+    """TFLite interpreter with the keras-like surface `predict` relies on.
+
+    Exposes `input_shape` (NHWC) and `predict_on_batch`, so the keras code path
+    in model.py can drive it unchanged. int8/uint8 inputs and outputs are
+    (de)quantized here. The interpreter is not thread-safe, so calls are serialized.
+    """
+
+    def __init__(self, model_path: str, num_threads: Optional[int] = None):
+        interpreter_cls = _tflite_interpreter_class()
+        self.interpreter = interpreter_cls(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        _, h, w, c = (int(v) for v in self._input['shape'])
+        self.input_shape: Tuple[Optional[int], int, int, int] = (None, h, w, c)
+        self.input_dtype = np.dtype(self._input['dtype'])
+        self._batch = int(self._input['shape'][0])
+        self._lock = threading.Lock()
+
+    def predict_on_batch(self, x: np.ndarray) -> np.ndarray:
+        n = x.shape[0]
+        with self._lock:
+            if n != self._batch:
+                self.interpreter.resize_tensor_input(self._input['index'], [n] + list(self.input_shape[1:]))
+                self.interpreter.allocate_tensors()
+                self._input = self.interpreter.get_input_details()[0]
+                self._output = self.interpreter.get_output_details()[0]
+                self._batch = n
+            self.interpreter.set_tensor(self._input['index'], _quantize(x, self._input))
+            self.interpreter.invoke()
+            y = self.interpreter.get_tensor(self._output['index'])
+            return _dequantize(y, self._output)
+
+
+class OnnxModel:
+    """onnxruntime session with the keras-like surface `predict` relies on.
+
+    Models exported from Keras are NHWC; channels-first graphs are detected
+    from the input shape and fed transposed inputs. Only the batch dimension
+    may be dynamic; other symbolic dims raise ValueError at load time.
+    """
+
+    def __init__(self, model_path: str, num_threads: Optional[int] = None):
+        ort = _import_onnxruntime()
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = int(num_threads)
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+        inp = self.session.get_inputs()[0]
+        self._input_name = inp.name
+        dims = [d if isinstance(d, int) else None for d in inp.shape]
+        if len(dims) != 4:
+            raise ValueError(f'Unsupported ONNX input rank: {inp.shape}')
+        self.channels_first = dims[1] in (1, 3) and dims[3] not in (1, 3)
+        if self.channels_first:
+            _, c, h, w = dims
+        else:
+            _, h, w, c = dims
+        if h is None or w is None or c is None:
+            # Preprocessing resizes every face to the model input, so it has to be known up front
+            raise ValueError(f'ONNX model input {inp.name} has dynamic height, width or channels '
+                             f'({inp.shape}); export it with a fixed input size')
+        self.input_shape = (None, h, w, c)
+        self.input_dtype = np.float16 if inp.type == 'tensor(float16)' else np.float32
+
+    def predict_on_batch(self, x: np.ndarray) -> np.ndarray:
+        if self.channels_first:
+            x = np.ascontiguousarray(x.transpose(0, 3, 1, 2))
+        y = self.session.run(None, {self._input_name: x.astype(self.input_dtype, copy=False)})[0]
+        return np.asarray(y, dtype=np.float32)
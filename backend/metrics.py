@@ -0,0 +1,160 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple, TypeVar
+
+# Latency buckets in seconds, from sub-millisecond preprocessing up to slow batches
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + '}'
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames and self.kind in ('counter', 'gauge'):
+            self._values[()] = 0.0
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = state
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float('inf'),), counts):
+                cumulative += c
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, (("le", le),))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+M = TypeVar('M', bound=_Metric)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: M) -> M:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter('moodcam_requests_total', 'HTTP requests by endpoint and status code.', ('endpoint', 'status')))
+ERRORS = REGISTRY.register(Counter('moodcam_errors_total', 'Requests answered with status >= 400, by endpoint.', ('endpoint',)))
+IN_FLIGHT = REGISTRY.register(Gauge('moodcam_in_flight_requests', 'Requests currently being handled.', ('endpoint',)))
+REQUEST_SECONDS = REGISTRY.register(Histogram('moodcam_request_seconds', 'End-to-end request latency.', ('endpoint',)))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'moodcam_stage_seconds',
+    'Latency per pipeline stage: base64, decode, detect, preprocess, inference, postprocess, serialize.',
+    ('stage',),
+))
+BATCH_SIZE = REGISTRY.register(Histogram('moodcam_batch_size', 'Frames per model call.', (), BATCH_BUCKETS))
+PREDICTIONS = REGISTRY.register(Counter('moodcam_predictions_total', 'Predictions returned to clients.'))
+FACES_FOUND = REGISTRY.register(Counter('moodcam_faces_found_total', 'Predictions where a face bbox was found.'))
+CACHE_LOOKUPS = REGISTRY.register(Counter('moodcam_cache_lookups_total', 'Prediction cache lookups by result (hit/miss).', ('result',)))
+STREAM_FRAMES = REGISTRY.register(Counter('moodcam_stream_frames_total', 'Stream frames answered, by whether the classifier ran or the keyframe result was reused.', ('result',)))
+LOAD_SHED = REGISTRY.register(Counter('moodcam_load_shed_total', 'Requests rejected by admission control, by endpoint and reason.', ('endpoint', 'reason')))
+SUPERSEDED = REGISTRY.register(Counter('moodcam_superseded_total', 'HTTP frames skipped because a newer frame from the same client arrived first.', ('endpoint',)))
+BULK_IMAGES = REGISTRY.register(Counter('moodcam_bulk_images_total', 'Images processed by /predict/bulk, by outcome.', ('result',)))
+
+
+def observe_stage(stage: str, seconds: float, batch_size: int) -> None:
+    """Hook for model.set_stage_observer."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    if stage == 'inference':
+        BATCH_SIZE.observe(batch_size)
+
+
+def record_prediction(face_found: bool) -> None:
+    PREDICTIONS.inc()
+    if face_found:
+        FACES_FOUND.inc()
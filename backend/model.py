@@ -1,27 +1,89 @@
 import os
 import json
-from typing import Tuple, Optional, List, Literal, Any, Dict
+import time
+import zipfile
+from typing import Tuple, Optional, List, Literal, Any, Dict, Sequence, Callable
 
 import numpy as np
 import cv2
 
-# Optional imports: we'll only require the framework that matches the model file
-try:
-    import tensorflow as tf  # type: ignore
-    from tensorflow.keras.models import load_model as keras_load_model  # type: ignore
-except Exception:  # pragma: no cover
-    tf = None  # type: ignore
-    keras_load_model = None  # type: ignore
-
-try:
-    import torch  # type: ignore
-except Exception:  # pragma: no cover
-    torch = None  # type: ignore
-
-try:
-    from ultralytics import YOLO  # type: ignore
-except Exception:  # pragma: no cover
-    YOLO = None  # type: ignore
+import keras_engine
+import lite_models
+from face_detector import FaceDetector
+from preprocessing import BatchPreprocessor
+
+# Frameworks are imported lazily: only the one matching the model file is ever loaded.
+# These stay None until the corresponding _import_* helper has run.
+tf = None  # type: ignore
+torch = None  # type: ignore
+YOLO = None  # type: ignore
+
+
+def _env_threads(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+# Framework thread pools, applied when a framework is imported. None keeps the
+# framework default (one thread per core), which oversubscribes the CPU when
+# several server processes run side by side. gunicorn.conf.py sets these per
+# worker before model.py is imported.
+INTRA_OP_THREADS: Optional[int] = _env_threads('MOODCAM_INTRA_OP_THREADS')
+INTER_OP_THREADS: Optional[int] = _env_threads('MOODCAM_INTER_OP_THREADS')
+
+
+def _apply_torch_threads() -> None:
+    if INTRA_OP_THREADS:
+        torch.set_num_threads(INTRA_OP_THREADS)
+    if INTER_OP_THREADS:
+        try:
+            torch.set_num_interop_threads(INTER_OP_THREADS)
+        except RuntimeError:
+            # Only allowed before the first parallel op
+            pass
+
+
+def _import_tensorflow() -> Any:
+    global tf
+    if tf is None:
+        try:
+            import tensorflow  # type: ignore
+        except Exception as e:
+            raise RuntimeError(
+                "TensorFlow/Keras not installed. Install with `pip install tensorflow`."
+            ) from e
+        tf = tensorflow
+        if INTRA_OP_THREADS:
+            tf.config.threading.set_intra_op_parallelism_threads(INTRA_OP_THREADS)
+        if INTER_OP_THREADS:
+            tf.config.threading.set_inter_op_parallelism_threads(INTER_OP_THREADS)
+    return tf
+
+
+def _import_torch() -> Any:
+    global torch
+    if torch is None:
+        try:
+            import torch as _torch  # type: ignore
+        except Exception as e:
+            raise RuntimeError("Torch not installed; cannot load .pt model. Install torch.") from e
+        torch = _torch
+        _apply_torch_threads()
+    return torch
+
+
+def _import_ultralytics() -> Optional[Any]:
+    """Return the YOLO class, or None if ultralytics is not installed."""
+    global YOLO
+    if YOLO is None:
+        try:
+            from ultralytics import YOLO as _YOLO  # type: ignore
+        except Exception:
+            return None
+        YOLO = _YOLO
+        # Ultralytics runs on torch; bind it so the thread limits apply
+        _import_torch()
+    return YOLO
 
 
 CLASS_NAMES: Optional[List[str]] = None
@@ -40,19 +102,62 @@ def load_class_names(path: Optional[str] = None) -> List[str]:
     return CLASS_NAMES
 
 
-ModelKind = Literal['keras', 'ultralytics']
+ModelKind = Literal['keras', 'ultralytics', 'torchscript', 'tflite', 'onnx']
+
+
+def _is_torchscript_archive(model_path: str) -> bool:
+    """TorchScript archives carry serialized code; plain torch/Ultralytics checkpoints do not."""
+    try:
+        with zipfile.ZipFile(model_path) as zf:
+            return any(n.endswith('/constants.pkl') or '/code/' in n for n in zf.namelist())
+    except Exception:
+        return False
+
+
+_TORCHSCRIPT_HINT = (
+    "Failed to load .pt as TorchScript. Export your model with torch.jit.trace or torch.jit.script."
+)
+
+
+def _load_torchscript(model_path: str, timings: Dict[str, float], error_hint: str = _TORCHSCRIPT_HINT) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    _import_torch()
+    timings['import_s'] = timings.get('import_s', 0.0) + time.perf_counter() - t0
+    t0 = time.perf_counter()
+    try:
+        ts_model = torch.jit.load(model_path, map_location='cpu')
+        ts_model.eval()
+    except Exception as e:
+        raise RuntimeError(error_hint) from e
+    timings['load_s'] = time.perf_counter() - t0
+    # Ensure class names are loaded
+    try:
+        load_class_names()
+    except Exception:
+        pass
+    return {'kind': 'torchscript', 'model': ts_model}
 
 
 def load_model(model_path: Optional[str] = None) -> Dict[str, Any]:
     """Load the trained model.
 
-    Supports two formats:
+    Supports these formats:
       - Ultralytics .pt (recommended): moodcam_best.pt
-      - Keras .h5 fallback: model.h5
+      - TorchScript .pt
+      - TFLite .tflite and ONNX .onnx (e.g. quantized exports from export_quantized.py)
+      - Keras .h5/.keras fallback: model.h5
+
+    The path defaults to $MOODCAM_MODEL_PATH, then moodcam_best.pt, then model.h5.
+    Only the framework needed by the file is imported, on first use.
 
-    Returns a dict with keys: {'kind': ModelKind, 'model': Any}
+    Returns a dict with keys: {'kind': ModelKind, 'model': Any, 'path': str,
+    'id': str, 'timings': {'import_s', 'load_s'}}. Loading does no inference
+    or graph tracing (it may run in a process that forks later); warmup()
+    does that and adds 'compile_s' / 'first_inference_s' to the timings.
     """
     base_dir = os.path.dirname(__file__)
+    if model_path is None:
+        model_path = os.environ.get('MOODCAM_MODEL_PATH') or None
     if model_path is None:
         # Prefer a .pt model if present, else fallback to .h5
         pt_path = os.path.join(base_dir, 'moodcam_best.pt')
@@ -68,64 +173,82 @@ def load_model(model_path: Optional[str] = None) -> Dict[str, Any]:
         )
 
     ext = os.path.splitext(model_path)[1].lower()
+    timings: Dict[str, float] = {}
+    bundle = _load_model_file(model_path, ext, timings)
+    bundle['path'] = model_path
+    bundle['id'] = _model_identity(model_path, bundle['kind'])
+    bundle['timings'] = timings
+    return bundle
+
 
-    # Ultralytics .pt
+def _model_identity(model_path: str, kind: str) -> str:
+    """Identifies the loaded weights; changes whenever a different or rewritten file is loaded."""
+    st = os.stat(model_path)
+    return f"{kind}:{os.path.abspath(model_path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _load_model_file(model_path: str, ext: str, timings: Dict[str, float]) -> Dict[str, Any]:
     if ext == '.pt':
-        # First, try Ultralytics YOLO format
-        if YOLO is not None:
-            try:
-                model = YOLO(model_path)
-                # Attempt to load class names
-                try:
-                    names = getattr(model, 'names', None)
-                    if isinstance(names, (list, dict)):
-                        _ = names  # not used directly; frontend uses our class_names mapping when needed
-                    load_class_names()
-                except Exception:
-                    pass
-                return {'kind': 'ultralytics', 'model': model}
-            except Exception as e:
-                # If the file is not a YOLO checkpoint (KeyError: 'model'), try TorchScript
-                if torch is None:
-                    raise RuntimeError("Torch not installed; cannot attempt TorchScript load. Install torch.") from e
-                try:
-                    ts_model = torch.jit.load(model_path, map_location='cpu')
-                    ts_model.eval()
-                    # Ensure class names are loaded
-                    try:
-                        load_class_names()
-                    except Exception:
-                        pass
-                    return {'kind': 'torchscript', 'model': ts_model}
-                except Exception as e2:
-                    raise RuntimeError(
-                        "Failed to load .pt as Ultralytics YOLO or TorchScript.\n"
-                        "- If this is a YOLO model, export/save weights with Ultralytics (yolo train/export).\n"
-                        "- If this is a custom PyTorch model, export TorchScript with torch.jit.trace/script."
-                    ) from e2
-        else:
+        # TorchScript archives never need ultralytics, which is slow to import
+        if _is_torchscript_archive(model_path):
+            return _load_torchscript(model_path, timings)
+
+        t0 = time.perf_counter()
+        yolo_cls = _import_ultralytics()
+        timings['import_s'] = time.perf_counter() - t0
+        if yolo_cls is None:
             # No YOLO available; try TorchScript directly
-            if torch is None:
-                raise RuntimeError("Torch not installed; cannot load .pt model. Install torch.")
-            try:
-                ts_model = torch.jit.load(model_path, map_location='cpu')
-                ts_model.eval()
-                try:
-                    load_class_names()
-                except Exception:
-                    pass
-                return {'kind': 'torchscript', 'model': ts_model}
-            except Exception as e2:
-                raise RuntimeError(
-                    "Failed to load .pt as TorchScript. Export your model with torch.jit.trace or torch.jit.script."
-                ) from e2
-
-    # Keras .h5
-    if keras_load_model is None:
-        raise RuntimeError(
-            "TensorFlow/Keras not installed. Install with `pip install tensorflow`."
+            return _load_torchscript(model_path, timings)
+        try:
+            t0 = time.perf_counter()
+            model = yolo_cls(model_path)
+            timings['load_s'] = time.perf_counter() - t0
+        except Exception:
+            # If the file is not a YOLO checkpoint (KeyError: 'model'), try TorchScript
+            return _load_torchscript(
+                model_path,
+                timings,
+                "Failed to load .pt as Ultralytics YOLO or TorchScript.\n"
+                "- If this is a YOLO model, export/save weights with Ultralytics (yolo train/export).\n"
+                "- If this is a custom PyTorch model, export TorchScript with torch.jit.trace/script.",
+            )
+        # Attempt to load class names
+        try:
+            load_class_names()
+        except Exception:
+            pass
+        return {'kind': 'ultralytics', 'model': model}
+
+    # Quantized / lightweight runtimes; the wrappers look like a keras model to predict()
+    if ext in ('.tflite', '.onnx'):
+        t0 = time.perf_counter()
+        lite_models.import_runtime(ext)
+        timings['import_s'] = time.perf_counter() - t0
+        wrapper_cls = lite_models.TFLiteModel if ext == '.tflite' else lite_models.OnnxModel
+        t0 = time.perf_counter()
+        model = wrapper_cls(model_path, num_threads=INTRA_OP_THREADS)
+        timings['load_s'] = time.perf_counter() - t0
+        try:
+            load_class_names()
+        except Exception:
+            pass
+        return {'kind': 'tflite' if ext == '.tflite' else 'onnx', 'model': model}
+
+    # Keras .h5 / .keras
+    t0 = time.perf_counter()
+    _import_tensorflow()
+    timings['import_s'] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    model = tf.keras.models.load_model(model_path)
+    timings['load_s'] = time.perf_counter() - t0
+    if os.environ.get('MOODCAM_KERAS_COMPILE', '1') != '0':
+        # Traced per-bucket graphs (traced in warmup(), not here); MOODCAM_KERAS_COMPILE=0
+        # serves the plain Keras model
+        buckets = [int(b) for b in os.environ.get('MOODCAM_KERAS_BUCKETS', '').split(',') if b.strip()]
+        model = keras_engine.CompiledKerasModel(
+            model, tf, buckets or keras_engine.DEFAULT_BUCKETS,
+            jit_compile=os.environ.get('MOODCAM_KERAS_XLA') == '1',
         )
-    model = keras_load_model(model_path)
     try:
         load_class_names()
     except Exception:
@@ -133,12 +256,34 @@ def load_model(model_path: Optional[str] = None) -> Dict[str, Any]:
     return {'kind': 'keras', 'model': model}
 
 
+def warmup(model_bundle: Dict[str, Any], size: Tuple[int, int] = (480, 640)) -> float:
+    """Run one inference on a blank frame so lazy framework setup happens before traffic.
+
+    Compiled Keras models first trace and run every batch bucket, recorded
+    as timings['compile_s']. Meant to run in the serving process (e.g.
+    gunicorn's post_worker_init), never before a fork. Returns the elapsed
+    seconds of the blank-frame inference, recorded as timings['first_inference_s'].
+    """
+    model = model_bundle['model']
+    if isinstance(model, keras_engine.CompiledKerasModel):
+        t0 = time.perf_counter()
+        model.warmup()
+        model_bundle.setdefault('timings', {})['compile_s'] = time.perf_counter() - t0
+    frame = np.zeros((size[0], size[1], 3), dtype=np.uint8)
+    t0 = time.perf_counter()
+    predict_batch([frame], model_bundle)
+    elapsed = time.perf_counter() - t0
+    model_bundle.setdefault('timings', {})['first_inference_s'] = elapsed
+    return elapsed
+
+
 def _preprocess_for_keras(frame_bgr: np.ndarray, model) -> np.ndarray:
     if not hasattr(model, 'input_shape'):
         raise ValueError('Model has no input_shape; cannot infer preprocessing.')
     _, H, W, C = model.input_shape
     if C == 1:
-        gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+        # Frames may already be grayscale when decoded for a single-channel model
+        gray = frame_bgr if frame_bgr.ndim == 2 else cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
         resized = cv2.resize(gray, (W, H), interpolation=cv2.INTER_AREA)
         x = resized.astype('float32') / 255.0
         x = np.expand_dims(x, axis=-1)
@@ -166,130 +311,337 @@ def _preprocess_for_torchscript(frame_bgr: np.ndarray, size: int = 224) -> 'torc
     return t
 
 
-def _detect_face_bbox(frame_bgr: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
-    """Detect the largest face using OpenCV Haar cascade and return (x, y, w, h)."""
+FACE_DETECTOR = FaceDetector()
+
+
+def _detect_face_bbox(frame_bgr: np.ndarray, prev_bbox: Optional[Tuple[int, int, int, int]] = None) -> Optional[Tuple[int, int, int, int]]:
+    """Detect the largest face using OpenCV Haar cascade and return (x, y, w, h).
+
+    If prev_bbox is given, the search starts in a window around it.
+    """
     try:
-        gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
-        cascade_path = os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
-        face_cascade = cv2.CascadeClassifier(cascade_path)
-        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(60, 60))
-        if len(faces) == 0:
-            return None
-        # Pick largest face
-        x, y, w, h = max(faces, key=lambda box: box[2] * box[3])
-        return int(x), int(y), int(w), int(h)
+        return FACE_DETECTOR.detect(frame_bgr, prev_bbox)
     except Exception:
         return None
 
 
-def predict(frame_bgr: np.ndarray, model_bundle: Dict[str, Any]) -> Tuple[str, float, Optional[Tuple[int, int, int, int]]]:
-    """Run prediction on a BGR frame and return (label, probability, bbox?).
+# Optional per-stage timing hook, called as observer(stage, seconds, batch_size) for the
+# 'detect', 'preprocess', 'inference' and 'postprocess' stages of predict_batch.
+_STAGE_OBSERVER: Optional[Callable[[str, float, int], None]] = None
 
-    bbox is (x,y,w,h) in pixels relative to input frame if available.
-    """
-    kind: ModelKind = model_bundle['kind']
-    model = model_bundle['model']
 
-    if kind == 'keras':
-        # Try face crop to help classification models trained on faces
-        bbox = _detect_face_bbox(frame_bgr)
+def set_stage_observer(observer: Optional[Callable[[str, float, int], None]]) -> None:
+    """Install (or clear, with None) the per-stage timing hook used by benchmarks and metrics."""
+    global _STAGE_OBSERVER
+    _STAGE_OBSERVER = observer
+
+
+def _mark(stage: str, t0: float, n: int) -> float:
+    now = time.perf_counter()
+    observer = _STAGE_OBSERVER
+    if observer is not None:
+        observer(stage, now - t0, n)
+    return now
+
+
+def _label_for(idx: int, names: Any = None) -> str:
+    label = None
+    if isinstance(names, dict):
+        label = names.get(idx)
+    elif isinstance(names, list) and idx < len(names):
+        label = names[idx]
+    if label is None:
+        classes = CLASS_NAMES or []
+        label = classes[idx] if idx < len(classes) else str(idx)
+    return label
+
+
+def _crop_faces(
+    frames_bgr: Sequence[np.ndarray],
+    prev_bboxes: Optional[Sequence[Optional[Tuple[int, int, int, int]]]] = None,
+    detect_faces: bool = True,
+    located: Optional[Sequence[bool]] = None,
+) -> Tuple[List[np.ndarray], List[Optional[Tuple[int, int, int, int]]]]:
+    """Crop the largest face out of every frame, falling back to the whole frame."""
+    if not detect_faces:
+        return list(frames_bgr), [None] * len(frames_bgr)
+    rois: List[np.ndarray] = []
+    bboxes: List[Optional[Tuple[int, int, int, int]]] = []
+    for i, frame_bgr in enumerate(frames_bgr):
+        bbox = _face_bbox(frame_bgr, prev_bboxes, located, i)
         roi = frame_bgr
         if bbox is not None:
             x0, y0, w0, h0 = bbox
             roi = frame_bgr[y0:y0+h0, x0:x0+w0]
-        x = _preprocess_for_keras(roi, model)
-        preds = model.predict(x)
-        if isinstance(preds, (list, tuple)):
-            preds = preds[0]
-        preds = np.array(preds).squeeze()
-        if preds.ndim != 1:
-            raise ValueError(f'Unexpected prediction shape: {preds.shape}')
-        idx = int(np.argmax(preds))
-        prob = float(preds[idx])
-        classes = CLASS_NAMES or []
-        label = classes[idx] if idx < len(classes) else str(idx)
-        return label, prob, bbox
-
-    if kind == 'ultralytics':
-        # Convert BGR to RGB; Ultralytics handles resizing/normalization internally
-        rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-        results = model.predict(source=rgb, verbose=False)
-        if not results:
-            raise RuntimeError('Empty prediction results')
-        r0 = results[0]
-        # Prefer classification path when available
-        if getattr(r0, 'probs', None) is not None and r0.probs is not None:
-            probs = r0.probs.data.cpu().numpy().squeeze()
-            idx = int(np.argmax(probs))
-            prob = float(probs[idx])
-            label = None
-            names = getattr(model, 'names', None)
-            if isinstance(names, dict):
-                label = names.get(idx)
-            elif isinstance(names, list) and idx < len(names):
-                label = names[idx]
-            if label is None:
-                classes = CLASS_NAMES or []
-                label = classes[idx] if idx < len(classes) else str(idx)
-            # Try to also provide a face bbox from classical detector
-            bbox = _detect_face_bbox(frame_bgr)
-            return label, prob, bbox
-
-        # Detection path: take highest-confidence box
-        boxes = getattr(r0, 'boxes', None)
-        if boxes is None or boxes.cls is None or boxes.conf is None:
-            raise RuntimeError('Model did not return usable outputs')
-        confs = boxes.conf.cpu().numpy().squeeze()
-        clses = boxes.cls.cpu().numpy().astype(int).squeeze()
-        xyxy = boxes.xyxy.cpu().numpy().squeeze()
-        if confs.ndim == 0:
-            confs = np.array([float(confs)])
-            clses = np.array([int(clses)])
-            xyxy = np.array([xyxy])
-        best_i = int(np.argmax(confs))
-        prob = float(confs[best_i])
-        idx = int(clses[best_i])
-        x1, y1, x2, y2 = xyxy[best_i]
+        rois.append(roi)
+        bboxes.append(bbox)
+    return rois, bboxes
+
+
+def _face_bbox(
+    frame_bgr: np.ndarray,
+    prev_bboxes: Optional[Sequence[Optional[Tuple[int, int, int, int]]]],
+    located: Optional[Sequence[bool]],
+    i: int,
+) -> Optional[Tuple[int, int, int, int]]:
+    prev = prev_bboxes[i] if prev_bboxes is not None else None
+    if located is not None and located[i]:
+        return prev
+    return _detect_face_bbox(frame_bgr, prev)
+
+
+def _ultralytics_is_classification(r0: Any) -> bool:
+    return getattr(r0, 'probs', None) is not None and r0.probs is not None
+
+
+def _ultralytics_boxes(r0: Any, model: Any) -> List[Tuple[str, float, Tuple[int, int, int, int]]]:
+    """Every box of a detection result as (label, confidence, bbox), highest confidence first."""
+    names = getattr(model, 'names', None)
+    boxes = getattr(r0, 'boxes', None)
+    if boxes is None or boxes.cls is None or boxes.conf is None:
+        raise RuntimeError('Model did not return usable outputs')
+    confs = np.atleast_1d(boxes.conf.cpu().numpy().squeeze())
+    clses = np.atleast_1d(boxes.cls.cpu().numpy().astype(int).squeeze())
+    xyxy = boxes.xyxy.cpu().numpy().reshape(-1, 4)
+    out = []
+    for i in np.argsort(-confs):
+        x1, y1, x2, y2 = xyxy[i]
         x = max(0, int(round(x1)))
         y = max(0, int(round(y1)))
         w = max(0, int(round(x2 - x1)))
         h = max(0, int(round(y2 - y1)))
-        names = getattr(model, 'names', None)
-        label = None
-        if isinstance(names, dict):
-            label = names.get(idx)
-        elif isinstance(names, list) and idx < len(names):
-            label = names[idx]
-        if label is None:
-            classes = CLASS_NAMES or []
-            label = classes[idx] if idx < len(classes) else str(idx)
-        return label, prob, (x, y, w, h)
+        out.append((_label_for(int(clses[i]), names), float(confs[i]), (x, y, w, h)))
+    return out
+
+
+def _ultralytics_result(r0: Any, model: Any) -> Tuple[str, float, Optional[Tuple[int, int, int, int]]]:
+    """Decode one Ultralytics result; classification results carry no bbox."""
+    # Prefer classification path when available
+    if _ultralytics_is_classification(r0):
+        probs = r0.probs.data.cpu().numpy().squeeze()
+        idx = int(np.argmax(probs))
+        prob = float(probs[idx])
+        return _label_for(idx, getattr(model, 'names', None)), prob, None
+
+    # Detection path: take highest-confidence box
+    boxes = _ultralytics_boxes(r0, model)
+    if not boxes:
+        raise RuntimeError('Model did not return usable outputs')
+    return boxes[0]
 
+
+def _input_dtype(model: Any) -> np.dtype:
+    """Float dtype to feed the model: float16 for fp16 ONNX graphs, float32 otherwise."""
+    dtype = np.dtype(getattr(model, 'input_dtype', np.float32))
+    return dtype if dtype.kind == 'f' else np.dtype(np.float32)
+
+
+def input_spec(model_bundle: Dict[str, Any]) -> Dict[str, Any]:
+    """Input the model consumes: height, width, channels, layout and dtype (sizes may be None if dynamic)."""
+    kind, model = model_bundle['kind'], model_bundle['model']
+    if kind in ('keras', 'tflite', 'onnx') and hasattr(model, 'input_shape'):
+        _, H, W, C = model.input_shape
+        return {'height': int(H) if H else None, 'width': int(W) if W else None, 'channels': int(C) if C else None,
+                'layout': 'NHWC', 'dtype': _input_dtype(model).name}
     if kind == 'torchscript':
-        # Face crop to improve classification odds when model expects a face crop
-        bbox = _detect_face_bbox(frame_bgr)
-        roi = frame_bgr
-        if bbox is not None:
-            x0, y0, w0, h0 = bbox
-            roi = frame_bgr[y0:y0+h0, x0:x0+w0]
-        inp = _preprocess_for_torchscript(roi, size=224)
+        return {'height': 224, 'width': 224, 'channels': 3, 'layout': 'NCHW', 'dtype': 'float32'}
+    imgsz = (getattr(model, 'overrides', None) or {}).get('imgsz') or 640
+    if isinstance(imgsz, (list, tuple)):
+        imgsz = max(imgsz)
+    return {'height': int(imgsz), 'width': int(imgsz), 'channels': 3, 'layout': 'NCHW', 'dtype': 'float32'}
+
+
+def preprocess_batch(rois: Sequence[np.ndarray], model_bundle: Dict[str, Any]) -> np.ndarray:
+    """Model input tensor for a batch of face crops (NHWC for keras-like models, NCHW for TorchScript).
+
+    The result is a view of a per-thread buffer that the next call overwrites.
+    """
+    kind, model = model_bundle['kind'], model_bundle['model']
+    if kind in ('keras', 'tflite', 'onnx'):
+        if not hasattr(model, 'input_shape'):
+            raise ValueError('Model has no input_shape; cannot infer preprocessing.')
+        _, H, W, C = model.input_shape
+        return BatchPreprocessor.for_thread(H, W, C, 'NHWC', _input_dtype(model))(rois)
+    if kind == 'torchscript':
+        return BatchPreprocessor.for_thread(224, 224, 3, 'NCHW')(rois)
+    raise ValueError(f'No tensor preprocessing for model kind: {kind}')
+
+
+def _classify_rois(kind: ModelKind, model: Any, rois: Sequence[np.ndarray]) -> List[Tuple[str, float]]:
+    """Classify face crops with one forward pass; returns (label, probability) per crop."""
+    n = len(rois)
+    t = time.perf_counter()
+
+    if kind in ('keras', 'tflite', 'onnx'):
+        x = preprocess_batch(rois, {'kind': kind, 'model': model})
+        t = _mark('preprocess', t, n)
+        # predict_on_batch skips the per-call data pipeline and callbacks of model.predict
+        preds = model.predict_on_batch(x)
+        if isinstance(preds, (list, tuple)):
+            preds = preds[0]
+        preds = np.asarray(preds)
+        t = _mark('inference', t, n)
+        if preds.ndim != 2 or preds.shape[0] != n:
+            raise ValueError(f'Unexpected prediction shape: {preds.shape}')
+        results = []
+        for scores in preds:
+            idx = int(np.argmax(scores))
+            results.append((_label_for(idx), float(scores[idx])))
+        _mark('postprocess', t, n)
+        return results
+
+    if kind == 'torchscript':
+        # Shares memory with the preprocessing buffer; consumed before the next call
+        inp = torch.from_numpy(preprocess_batch(rois, {'kind': kind, 'model': model}))
+        t = _mark('preprocess', t, n)
         with torch.no_grad():
             out = model(inp)
-        # Expect logits or probabilities as (1, num_classes)
+        # Expect logits or probabilities as (N, num_classes)
         if isinstance(out, (list, tuple)):
             out = out[0]
         if hasattr(out, 'detach'):
             out = out.detach().cpu().numpy()
-        arr = np.array(out).squeeze()
-        if arr.ndim != 1:
+        arr = np.asarray(out)
+        t = _mark('inference', t, n)
+        if arr.ndim != 2 or arr.shape[0] != n:
             raise RuntimeError(f"Unexpected TorchScript output shape: {arr.shape}")
-        idx = int(np.argmax(arr))
         # If outputs are logits, softmax is optional for argmax, but we need probability estimate
-        exp = np.exp(arr - np.max(arr))
-        probs = exp / np.sum(exp)
-        prob = float(probs[idx])
-        classes = CLASS_NAMES or []
-        label = classes[idx] if idx < len(classes) else str(idx)
-        return label, prob, bbox
+        exp = np.exp(arr - np.max(arr, axis=1, keepdims=True))
+        probs = exp / np.sum(exp, axis=1, keepdims=True)
+        results = []
+        for row in probs:
+            idx = int(np.argmax(row))
+            results.append((_label_for(idx), float(row[idx])))
+        _mark('postprocess', t, n)
+        return results
+
+    if kind == 'ultralytics':
+        rgbs = [cv2.cvtColor(roi, cv2.COLOR_BGR2RGB) for roi in rois]
+        t = _mark('preprocess', t, n)
+        raw = model.predict(source=rgbs, verbose=False)
+        t = _mark('inference', t, n)
+        if not raw or len(raw) != n:
+            raise RuntimeError('Empty prediction results')
+        results = []
+        for r0 in raw:
+            label, prob, _ = _ultralytics_result(r0, model)
+            results.append((label, prob))
+        _mark('postprocess', t, n)
+        return results
+
+    raise ValueError(f'Unsupported model kind: {kind}')
+
+
+def classify_rois(rois: Sequence[np.ndarray], model_bundle: Dict[str, Any]) -> List[Tuple[str, float]]:
+    """Classify BGR face crops (no detection) in one model call; returns (label, probability) each."""
+    if len(rois) == 0:
+        return []
+    return _classify_rois(model_bundle['kind'], model_bundle['model'], rois)
+
+
+def predict_batch(
+    frames_bgr: Sequence[np.ndarray],
+    model_bundle: Dict[str, Any],
+    prev_bboxes: Optional[Sequence[Optional[Tuple[int, int, int, int]]]] = None,
+    detect_faces: bool = True,
+    located: Optional[Sequence[bool]] = None,
+) -> List[Tuple[str, float, Optional[Tuple[int, int, int, int]]]]:
+    """Run prediction on several BGR frames with a single model call.
+
+    Returns one (label, probability, bbox?) tuple per input frame, in order.
+    prev_bboxes optionally holds the last known face bbox per frame so face
+    detection can search around it first. Frames flagged in `located` were
+    already searched by the caller: their prev_bboxes entry is the face in
+    that frame (None: no face) and detection is skipped. Set
+    detect_faces=False when the frames are already face crops (e.g. the FER
+    dataset images).
+    """
+    kind: ModelKind = model_bundle['kind']
+    model = model_bundle['model']
+    if len(frames_bgr) == 0:
+        return []
+
+    n = len(frames_bgr)
+    t = time.perf_counter()
+
+    if kind in ('keras', 'tflite', 'onnx', 'torchscript'):
+        # Try face crop to help classification models trained on faces
+        rois, bboxes = _crop_faces(frames_bgr, prev_bboxes, detect_faces, located)
+        _mark('detect', t, n)
+        labels = _classify_rois(kind, model, rois)
+        return [(label, prob, bbox) for (label, prob), bbox in zip(labels, bboxes)]
+
+    if kind == 'ultralytics':
+        # Convert BGR to RGB; Ultralytics handles resizing/normalization internally
+        rgbs = [cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB) for frame_bgr in frames_bgr]
+        t = _mark('preprocess', t, n)
+        raw = model.predict(source=rgbs, verbose=False)
+        t = _mark('inference', t, n)
+        if not raw or len(raw) != n:
+            raise RuntimeError('Empty prediction results')
+        results = [_ultralytics_result(r0, model) for r0 in raw]
+        t = _mark('postprocess', t, n)
+        if detect_faces:
+            # Classification models give no box; also provide a face bbox from classical detector
+            for i, r0 in enumerate(raw):
+                if _ultralytics_is_classification(r0):
+                    label, prob, _ = results[i]
+                    results[i] = (label, prob, _face_bbox(frames_bgr[i], prev_bboxes, located, i))
+            _mark('detect', t, n)
+        return results
 
     raise ValueError(f'Unsupported model kind: {kind}')
+
+
+def predict(
+    frame_bgr: np.ndarray,
+    model_bundle: Dict[str, Any],
+    prev_bbox: Optional[Tuple[int, int, int, int]] = None,
+    located: bool = False,
+) -> Tuple[str, float, Optional[Tuple[int, int, int, int]]]:
+    """Run prediction on a BGR frame and return (label, probability, bbox?).
+
+    bbox is (x,y,w,h) in pixels relative to input frame if available. With
+    located=True, prev_bbox is the face already found in this frame and
+    detection is skipped.
+    """
+    return predict_batch([frame_bgr], model_bundle, [prev_bbox], located=[located])[0]
+
+
+def predict_faces(
+    frame_bgr: np.ndarray,
+    model_bundle: Dict[str, Any],
+    max_faces: Optional[int] = None,
+) -> List[Tuple[str, float, Tuple[int, int, int, int]]]:
+    """Detect every face in a BGR frame and classify all crops in one model call.
+
+    Returns a (label, probability, bbox) tuple per face, largest face first;
+    an empty list if no face is found. Ultralytics detection models already
+    localize faces, so their boxes are returned directly.
+    """
+    kind: ModelKind = model_bundle['kind']
+    model = model_bundle['model']
+    t = time.perf_counter()
+
+    if kind == 'ultralytics' and getattr(model, 'task', None) == 'detect':
+        raw = model.predict(source=cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB), verbose=False)
+        t = _mark('inference', t, 1)
+        if not raw:
+            raise RuntimeError('Empty prediction results')
+        boxes = _ultralytics_boxes(raw[0], model)
+        _mark('postprocess', t, 1)
+        return boxes[:max_faces] if max_faces is not None else boxes
+
+    try:
+        bboxes = FACE_DETECTOR.detect_all(frame_bgr)
+    except Exception:
+        bboxes = []
+    bboxes.sort(key=lambda box: box[2] * box[3], reverse=True)
+    if max_faces is not None:
+        bboxes = bboxes[:max_faces]
+    _mark('detect', t, 1)
+    if not bboxes:
+        return []
+    rois = [frame_bgr[y:y+h, x:x+w] for (x, y, w, h) in bboxes]
+    labels = _classify_rois(kind, model, rois)
+    return [(label, prob, bbox) for (label, prob), bbox in zip(labels, bboxes)]
@@ -0,0 +1,252 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import model as model_ml
+from batching import BatchingEngine
+from decode import DecodePlanner
+
+logger = logging.getLogger("moodcam")
+
+# Margin clients add around the last face box when cropping a ROI, as a fraction of its size
+ROI_MARGIN = 0.25
+
+
+class ModelNotFound(KeyError):
+    pass
+
+
+class ResidentModel:
+    """A loaded, warmed model with its own batching engine and decode planner.
+
+    `leases` counts requests and stream sessions currently using it; an evicted
+    or unloaded model is only closed once the last lease is returned.
+    """
+
+    def __init__(self, name: str, bundle: Dict[str, Any], engine: BatchingEngine, size_bytes: int):
+        self.name = name
+        self.bundle = bundle
+        self.engine = engine
+        self.size_bytes = size_bytes
+        self.decoder = DecodePlanner.for_bundle(bundle)
+        self.loaded_at = time.time()
+        self.last_used = time.monotonic()
+        self.leases = 0
+        self.retired = False
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'kind': self.bundle['kind'],
+            'path': self.bundle['path'],
+            'id': self.bundle['id'],
+            'size_bytes': self.size_bytes,
+            'in_use': self.leases,
+            'timings': self.bundle.get('timings', {}),
+        }
+
+    def capabilities(self) -> Dict[str, Any]:
+        """What a client needs to send no more pixels than this model uses.
+
+        `capture.short_side` is the decode planner's target: frames larger
+        than that are shrunk on the server anyway. Clients tracking a face
+        can send a pre-cropped ROI around its last box instead; it should be cut
+        with `roi.margin` around the box and scaled so the face is about
+        `roi.face_side` pixels (the model input, but no smaller than the face
+        detector's minimum face size, as the server re-detects inside it).
+        """
+        spec = model_ml.input_spec(self.bundle)
+        face_side = max(spec['height'] or 0, spec['width'] or 0, model_ml.FACE_DETECTOR.min_size)
+        return {
+            'model': self.name,
+            'kind': self.bundle['kind'],
+            'input': spec,
+            'capture': {'short_side': self.decoder.min_side, 'grayscale': self.decoder.grayscale},
+            'roi': {'margin': ROI_MARGIN, 'face_side': face_side},
+        }
+
+
+class ModelRegistry:
+    """Named models kept resident side by side, with hot-swapping of the default.
+
+    `load` reads and warms a model off the request path, then publishes it
+    under its name in one step, so requests see either the old or the new
+    model and never a half-loaded one. Loading an existing name replaces it
+    the same way. When the summed model file sizes exceed
+    `memory_budget_bytes`, the least recently used models other than the
+    default and the one just loaded are evicted; a model that does not fit
+    beside the default is rejected with ValueError instead of being published.
+    Models in use are closed only after their last lease.
+
+    `on_evict(bundle)` is called when a model leaves the registry, e.g. to
+    drop its cached predictions.
+    """
+
+    def __init__(
+        self,
+        memory_budget_bytes: Optional[int] = None,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        on_evict: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.memory_budget = memory_budget_bytes or None
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.on_evict = on_evict
+        self._models: 'OrderedDict[str, ResidentModel]' = OrderedDict()
+        self._default: Optional[str] = None
+        self._lock = threading.Lock()
+        self._loading: Dict[str, Future] = {}
+        self.evictions = 0
+
+    @property
+    def default_name(self) -> Optional[str]:
+        return self._default
+
+    def load(self, name: str, path: Optional[str] = None, make_default: bool = False, warm: bool = True) -> ResidentModel:
+        """Load and warm a model, then publish it as `name` (replacing any previous one)."""
+        bundle = model_ml.load_model(path)
+        if warm:
+            try:
+                model_ml.warmup(bundle)
+            except Exception as e:
+                logger.exception("Warmup inference failed for model %s: %s", name, e)
+        engine = BatchingEngine(bundle, self.max_batch_size, self.max_wait_ms)
+        resident = ResidentModel(name, bundle, engine, os.path.getsize(bundle['path']))
+        with self._lock:
+            default = name if make_default or self._default is None else self._default
+            # Only the new model and the default are kept; everything else can be evicted
+            needed = resident.size_bytes
+            if default != name:
+                needed += self._models[default].size_bytes
+            fits = self.memory_budget is None or needed <= self.memory_budget
+            if fits:
+                previous = self._models.pop(name, None)
+                self._models[name] = resident
+                self._default = default
+                retired = [previous] if previous is not None else []
+                retired.extend(self._evict_over_budget(keep=name))
+                for old in retired:
+                    old.retired = True
+        if not fits:
+            engine.close()
+            beside = '' if default == name else f' beside the default model {default}'
+            raise ValueError(f'Model {name} ({resident.size_bytes} bytes) does not fit in the memory budget '
+                             f'({self.memory_budget} bytes){beside}')
+        for old in retired:
+            self._release_retired(old)
+        logger.info("Model %s loaded (%s: %s)%s", name, bundle['kind'], bundle['path'],
+                    ' as default' if self._default == name else '')
+        return resident
+
+    def load_async(self, name: str, path: Optional[str] = None, make_default: bool = False) -> 'Future[ResidentModel]':
+        """Load on a background thread; requests keep using the current models meanwhile."""
+        with self._lock:
+            pending = self._loading.get(name)
+            if pending is not None and not pending.done():
+                return pending
+            fut: 'Future[ResidentModel]' = Future()
+            self._loading[name] = fut
+
+        def run() -> None:
+            try:
+                fut.set_result(self.load(name, path, make_default))
+            except Exception as e:
+                logger.exception("Loading model %s from %s failed: %s", name, path, e)
+                fut.set_exception(e)
+
+        threading.Thread(target=run, name=f'moodcam-load-{name}', daemon=True).start()
+        return fut
+
+    def set_default(self, name: str) -> None:
+        with self._lock:
+            if name not in self._models:
+                raise ModelNotFound(name)
+            self._default = name
+
+    def unload(self, name: str) -> None:
+        with self._lock:
+            if name == self._default:
+                raise ValueError('Cannot unload the default model; make another one default first')
+            resident = self._models.pop(name, None)
+            if resident is None:
+                raise ModelNotFound(name)
+            resident.retired = True
+        self._release_retired(resident)
+
+    def acquire(self, name: Optional[str] = None) -> ResidentModel:
+        """Take a lease on a model (the default if `name` is None); pair with release()."""
+        with self._lock:
+            key = name or self._default
+            resident = self._models.get(key) if key is not None else None
+            if resident is None:
+                raise ModelNotFound(name or 'default')
+            self._models.move_to_end(key)
+            resident.last_used = time.monotonic()
+            resident.leases += 1
+            return resident
+
+    def release(self, resident: ResidentModel) -> None:
+        with self._lock:
+            resident.leases -= 1
+        self._release_retired(resident)
+
+    @contextmanager
+    def lease(self, name: Optional[str] = None) -> Iterator[ResidentModel]:
+        resident = self.acquire(name)
+        try:
+            yield resident
+        finally:
+            self.release(resident)
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._models)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = [m.info() for m in self._models.values()]
+            return {
+                'default': self._default,
+                'models': models,
+                'resident_bytes': sum(m.size_bytes for m in self._models.values()),
+                'memory_budget_bytes': self.memory_budget,
+                'evictions': self.evictions,
+                'loading': sorted(n for n, f in self._loading.items() if not f.done()),
+            }
+
+    def _evict_over_budget(self, keep: str) -> List[ResidentModel]:
+        # Caller holds the lock; least recently used first, never the default or `keep`
+        evicted = []
+        if self.memory_budget is None:
+            return evicted
+        total = sum(m.size_bytes for m in self._models.values())
+        for name in list(self._models):
+            if total <= self.memory_budget:
+                break
+            if name in (self._default, keep):
+                continue
+            resident = self._models.pop(name)
+            total -= resident.size_bytes
+            self.evictions += 1
+            evicted.append(resident)
+            logger.info("Evicting model %s (%d bytes) to stay within the memory budget", name, resident.size_bytes)
+        return evicted
+
+    def _release_retired(self, resident: ResidentModel) -> None:
+        with self._lock:
+            if not resident.retired or resident.leases > 0 or resident.engine is None:
+                return
+            engine, resident.engine = resident.engine, None
+        # Frames already queued on the engine are still answered before it stops
+        engine.close()
+        if self.on_evict is not None:
+            try:
+                self.on_evict(resident.bundle)
+            except Exception as e:
+                logger.warning("on_evict failed for model %s: %s", resident.name, e)
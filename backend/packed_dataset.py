@@ -0,0 +1,261 @@
+"""Pack the FER image folders into a memory-mapped uint8 array.
+
+A packed split is a directory holding:
+  - images.u8   raw (count, height, width, channels) uint8 pixels
+  - index.csv   `id,label` per row, in the same order (label -1 when unknown)
+  - meta.json   shape, count and class names; `count` is the commit point
+
+Packing is incremental: ids already in index.csv are skipped and new images
+are appended, so adding files to data/train does not repack everything. A run
+interrupted mid-append is rolled back to the last committed `count`.
+
+Usage (from backend/):
+    python packed_dataset.py train      # data/train + ../train.csv -> data/packed/train
+    python packed_dataset.py test       # data/test + ../test_template.csv -> data/packed/test
+
+Training code reads it back without decoding any JPEG:
+    packed = open_packed('data/packed/train')
+    train_idx, val_idx = split_indices(len(packed), validation_split=0.2, seed=123)
+    train_ds = make_tf_dataset(packed, train_idx, image_size=(224, 224), rgb=True)
+"""
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import cv2
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGES_FILE = 'images.u8'
+INDEX_FILE = 'index.csv'
+META_FILE = 'meta.json'
+
+
+def _load_class_names() -> List[str]:
+    with open(os.path.join(BASE_DIR, 'class_names.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _read_meta(out_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(out_dir, META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_meta(out_dir: str, meta: Dict[str, Any]) -> None:
+    tmp = os.path.join(out_dir, META_FILE + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, os.path.join(out_dir, META_FILE))
+
+
+def _read_index(out_dir: str, count: int) -> List[Tuple[str, int]]:
+    path = os.path.join(out_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = [(r['id'], int(r['label'])) for r in csv.DictReader(f)]
+    return rows[:count]
+
+
+def _rollback(out_dir: str, meta: Dict[str, Any], index: List[Tuple[str, int]]) -> None:
+    """Drop anything written after the last committed count."""
+    frame_bytes = meta['height'] * meta['width'] * meta['channels']
+    with open(os.path.join(out_dir, IMAGES_FILE), 'ab') as f:
+        f.truncate(meta['count'] * frame_bytes)
+    with open(os.path.join(out_dir, INDEX_FILE), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'label'])
+        writer.writerows(index)
+
+
+def _load_pixels(path: str, height: int, width: int, channels: int) -> Optional[np.ndarray]:
+    flags = cv2.IMREAD_GRAYSCALE if channels == 1 else cv2.IMREAD_COLOR
+    try:
+        img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), flags)
+    except Exception:
+        return None
+    if img is None:
+        return None
+    if img.shape[0] != height or img.shape[1] != width:
+        img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+    if channels == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return img.reshape(height, width, channels)
+
+
+def pack(
+    manifest: str,
+    image_dir: str,
+    out_dir: str,
+    by_class: bool,
+    size: int = 48,
+    channels: int = 1,
+    workers: Optional[int] = None,
+) -> Tuple[int, int]:
+    """Append every manifest image not yet packed; returns (added, total).
+
+    With by_class=True images live in image_dir/<label>/<id>, else image_dir/<id>.
+    """
+    class_names = _load_class_names()
+    class_index = {name: i for i, name in enumerate(class_names)}
+    os.makedirs(out_dir, exist_ok=True)
+
+    meta = _read_meta(out_dir)
+    if meta is None:
+        meta = {'height': size, 'width': size, 'channels': channels, 'count': 0, 'class_names': class_names}
+    elif (meta['height'], meta['width'], meta['channels']) != (size, size, channels):
+        raise ValueError(
+            f"{out_dir} was packed as {meta['height']}x{meta['width']}x{meta['channels']}; "
+            f"cannot append {size}x{size}x{channels} images"
+        )
+    index = _read_index(out_dir, meta['count'])
+    _rollback(out_dir, meta, index)
+
+    packed_ids = {image_id for image_id, _ in index}
+    todo: List[Tuple[str, str, int]] = []
+    with open(manifest, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            image_id = row['id']
+            if image_id in packed_ids:
+                continue
+            label_name = (row.get('emotion') or '').strip()
+            path = os.path.join(image_dir, label_name, image_id) if by_class else os.path.join(image_dir, image_id)
+            if os.path.exists(path):
+                todo.append((image_id, path, class_index.get(label_name, -1)))
+
+    added = 0
+    chunk = 1024
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool, \
+            open(os.path.join(out_dir, IMAGES_FILE), 'ab') as images_f, \
+            open(os.path.join(out_dir, INDEX_FILE), 'a', newline='', encoding='utf-8') as index_f:
+        writer = csv.writer(index_f)
+        for start in range(0, len(todo), chunk):
+            part = todo[start:start + chunk]
+            pixels = pool.map(lambda item: _load_pixels(item[1], size, size, channels), part)
+            rows = []
+            for (image_id, _, label), img in zip(part, pixels):
+                if img is None:
+                    continue
+                images_f.write(np.ascontiguousarray(img).tobytes())
+                rows.append((image_id, label))
+            writer.writerows(rows)
+            images_f.flush()
+            index_f.flush()
+            added += len(rows)
+            meta['count'] += len(rows)
+            _write_meta(out_dir, meta)
+    return added, meta['count']
+
+
+class PackedDataset:
+    """Read-only view of a packed split; `images` is an np.memmap, nothing is copied up front."""
+
+    def __init__(self, path: str):
+        meta = _read_meta(path)
+        if meta is None:
+            raise FileNotFoundError(f'No packed dataset at {path}')
+        self.path = path
+        self.meta = meta
+        self.class_names: List[str] = meta['class_names']
+        shape = (meta['count'], meta['height'], meta['width'], meta['channels'])
+        index = _read_index(path, meta['count'])
+        self.ids = [image_id for image_id, _ in index]
+        self.labels = np.array([label for _, label in index], dtype=np.int32)
+        if meta['count'] == 0:
+            self.images = np.zeros(shape, dtype=np.uint8)
+        else:
+            self.images = np.memmap(os.path.join(path, IMAGES_FILE), dtype=np.uint8, mode='r', shape=shape)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def gather(self, indices: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Copy out one batch of (images, labels); reads touch only the pages needed."""
+        idx = np.asarray(indices, dtype=np.int64)
+        return self.images[idx], self.labels[idx]
+
+
+def open_packed(path: str) -> PackedDataset:
+    return PackedDataset(path)
+
+
+def split_indices(n: int, validation_split: float = 0.2, seed: int = 123) -> Tuple[np.ndarray, np.ndarray]:
+    """Deterministic shuffled train/validation split of range(n)."""
+    order = np.random.default_rng(seed).permutation(n)
+    n_val = int(round(n * validation_split))
+    return np.sort(order[n_val:]), np.sort(order[:n_val])
+
+
+def make_tf_dataset(
+    packed: PackedDataset,
+    indices: Optional[Sequence[int]] = None,
+    batch_size: int = 32,
+    shuffle: bool = True,
+    seed: int = 123,
+    image_size: Optional[Tuple[int, int]] = None,
+    rgb: bool = False,
+) -> Any:
+    """Build a tf.data pipeline of (float32 images in [0, 255], int32 labels).
+
+    Only index batches flow through tf.data; pixels are gathered from the
+    memmap per batch, so there is no JPEG decoding and no full in-memory copy.
+    image_size resizes on the fly (e.g. (224, 224) for MobileNetV2) and rgb
+    repeats a grayscale channel three times, matching model_training.py.
+    """
+    import tensorflow as tf
+
+    if indices is None:
+        indices = np.arange(len(packed))
+    indices = np.asarray(indices, dtype=np.int64)
+    h, w, c = packed.meta['height'], packed.meta['width'], packed.meta['channels']
+
+    def _gather(idx):
+        images, labels = packed.gather(idx)
+        return images, labels
+
+    def _load(idx):
+        images, labels = tf.numpy_function(_gather, [idx], [tf.uint8, tf.int32])
+        images.set_shape([None, h, w, c])
+        labels.set_shape([None])
+        images = tf.cast(images, tf.float32)
+        if image_size is not None and tuple(image_size) != (h, w):
+            images = tf.image.resize(images, image_size)
+        if rgb and c == 1:
+            images = tf.image.grayscale_to_rgb(images)
+        return images, labels
+
+    ds = tf.data.Dataset.from_tensor_slices(indices)
+    if shuffle:
+        ds = ds.shuffle(buffer_size=len(indices), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+    ds = ds.map(_load, num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('split', choices=['train', 'test'])
+    parser.add_argument('--manifest', help='Defaults to ../train.csv or ../test_template.csv')
+    parser.add_argument('--images', help='Defaults to data/train or data/test')
+    parser.add_argument('--out', help='Defaults to data/packed/<split>')
+    parser.add_argument('--size', type=int, default=48)
+    parser.add_argument('--channels', type=int, choices=[1, 3], default=1)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    root = os.path.dirname(BASE_DIR)
+    manifest = args.manifest or os.path.join(root, 'train.csv' if args.split == 'train' else 'test_template.csv')
+    images = args.images or os.path.join(BASE_DIR, 'data', args.split)
+    out = args.out or os.path.join(BASE_DIR, 'data', 'packed', args.split)
+    added, total = pack(manifest, images, out, by_class=args.split == 'train', size=args.size, channels=args.channels, workers=args.workers)
+    print(f"{out}: added {added} images, {total} total")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class PredictionCache:
+    """LRU cache of predictions keyed by a hash of the raw image bytes plus model identity.
+
+    Entries expire after `ttl_seconds` and the least recently used one is evicted
+    beyond `max_entries`. The model identity is part of the key, so several
+    resident models share the cache without seeing each other's results;
+    `invalidate(model_id)` drops the entries of a model that was unloaded.
+    max_entries=0 disables caching.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def digest(image_bytes: Any) -> str:
+        return hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+
+    def get(self, image_bytes: Any, model_id: str) -> Optional[Any]:
+        if self.max_entries == 0:
+            return None
+        key = (self.digest(image_bytes), model_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, image_bytes: Any, model_id: str, value: Any) -> None:
+        if self.max_entries == 0:
+            return
+        key = (self.digest(image_bytes), model_id)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, model_id: str) -> None:
+        with self._lock:
+            stale = [key for key in self._entries if key[1] == model_id]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
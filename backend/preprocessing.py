@@ -0,0 +1,84 @@
+import threading
+from typing import Dict, Literal, Sequence, Tuple
+
+import numpy as np
+import cv2
+
+Layout = Literal['NHWC', 'NCHW']
+
+
+class BatchPreprocessor:
+    """Turns a list of BGR (or grayscale) face crops into one normalized input tensor.
+
+    Color crops for a grayscale model are converted first and then resized;
+    otherwise each crop is resized straight into a reused uint8 scratch image
+    (BGR->RGB is a reversed channel view). Either way the result is scaled to
+    [0, 1] directly into its slot of a preallocated output tensor in `layout`
+    and `dtype`. The returned array is a view of that
+    buffer: it is overwritten by the next call, so use it before calling
+    again, and do not share one instance between threads (see `for_thread`).
+    """
+
+    def __init__(self, height: int, width: int, channels: int, layout: Layout = 'NHWC',
+                 dtype: np.dtype = np.float32, capacity: int = 8):
+        if channels not in (1, 3):
+            raise ValueError(f'Unsupported channel count: C={channels}')
+        if layout not in ('NHWC', 'NCHW'):
+            raise ValueError(f'Unsupported layout: {layout}')
+        self.height, self.width, self.channels = int(height), int(width), int(channels)
+        self.layout = layout
+        self.dtype = np.dtype(dtype)
+        self._resized = np.empty((self.height, self.width, 3), np.uint8)
+        self._gray = np.empty((self.height, self.width), np.uint8)
+        self._rgb = np.empty((self.height, self.width, 3), np.uint8)
+        self._out = self._allocate(max(1, int(capacity)))
+
+    def _allocate(self, n: int) -> np.ndarray:
+        if self.layout == 'NHWC':
+            return np.empty((n, self.height, self.width, self.channels), self.dtype)
+        return np.empty((n, self.channels, self.height, self.width), self.dtype)
+
+    def _source(self, roi: np.ndarray) -> np.ndarray:
+        """Resized crop in the model's channel order, as (H, W) or (H, W, 3) uint8."""
+        size = (self.width, self.height)
+        if roi.ndim == 2:
+            small = cv2.resize(roi, size, dst=self._gray, interpolation=cv2.INTER_AREA)
+            if self.channels == 1:
+                return small
+            return cv2.cvtColor(small, cv2.COLOR_GRAY2RGB, dst=self._rgb)
+        if self.channels == 1:
+            # Gray first: resizing one channel is cheaper than resizing three and converting after
+            gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+            return cv2.resize(gray, size, dst=self._gray, interpolation=cv2.INTER_AREA)
+        small = cv2.resize(roi, size, dst=self._resized, interpolation=cv2.INTER_AREA)
+        return small[..., ::-1]
+
+    def __call__(self, rois: Sequence[np.ndarray]) -> np.ndarray:
+        n = len(rois)
+        if n > self._out.shape[0]:
+            self._out = self._allocate(max(n, 2 * self._out.shape[0]))
+        out = self._out[:n]
+        for i, roi in enumerate(rois):
+            src = self._source(roi)
+            if src.ndim == 2:
+                src = src[..., None]
+            if self.layout == 'NCHW':
+                src = src.transpose(2, 0, 1)
+            # A float32 factor keeps uint8 * scale out of float64
+            np.multiply(src, np.float32(1.0 / 255.0), out=out[i], casting='unsafe')
+        return out
+
+    _local = threading.local()
+
+    @classmethod
+    def for_thread(cls, height: int, width: int, channels: int, layout: Layout = 'NHWC',
+                   dtype: np.dtype = np.float32) -> 'BatchPreprocessor':
+        """Instance cached per calling thread and input spec, so buffers are reused safely."""
+        cache: Dict[Tuple, BatchPreprocessor] = getattr(cls._local, 'cache', None)
+        if cache is None:
+            cache = cls._local.cache = {}
+        key = (int(height), int(width), int(channels), layout, np.dtype(dtype).str)
+        pre = cache.get(key)
+        if pre is None:
+            pre = cache[key] = cls(height, width, channels, layout, dtype)
+        return pre
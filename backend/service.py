@@ -0,0 +1,305 @@
+"""Model serving state and request helpers shared by the Flask (link.py) and ASGI (asgi.py) apps.
+
+Importing this module loads the configured models into the registry (and,
+unless MOODCAM_DEFER_WARMUP is set, warms them up). Nothing here depends on
+a web framework: the apps parse requests and build responses, and call into
+these helpers for decoding, caching, inference and bulk uploads.
+"""
+import time
+
+_STARTED = time.perf_counter()
+
+import base64
+import functools
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import bulk
+import metrics
+import model as model_ml
+from coalescing import ClientCoalescer, Superseded
+from decode import DecodePlanner, roi_to_frame, scale_bbox
+from model_registry import ModelNotFound, ModelRegistry
+from prediction_cache import PredictionCache
+from streaming import KeyframeGate
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("moodcam")
+
+# Frames from concurrent requests are grouped into one model call
+MAX_BATCH_SIZE = int(os.environ.get('MOODCAM_MAX_BATCH_SIZE', '8'))
+MAX_BATCH_WAIT_MS = float(os.environ.get('MOODCAM_MAX_BATCH_WAIT_MS', '5'))
+
+# Repeated uploads of the same image skip decoding, detection and inference
+prediction_cache = PredictionCache(
+    max_entries=int(os.environ.get('MOODCAM_CACHE_ENTRIES', '1024')),
+    ttl_seconds=float(os.environ.get('MOODCAM_CACHE_TTL_S', '300')),
+)
+
+# Resident models by name; requests pick one with ?model= or X-Model, else the default.
+# MOODCAM_MODELS preloads extra models as "name=path,name=path".
+registry = ModelRegistry(
+    memory_budget_bytes=int(float(os.environ.get('MOODCAM_MODEL_MEMORY_MB', '0')) * 1024 * 1024),
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=MAX_BATCH_WAIT_MS,
+    on_evict=lambda bundle: prediction_cache.invalidate(bundle['id']),
+)
+# Stream sessions reuse the last label while the face is unchanged (?keyframes=0 disables)
+KEYFRAME_GATING = os.environ.get('MOODCAM_KEYFRAME_GATING', '1') != '0'
+KEYFRAME_THRESHOLD = float(os.environ.get('MOODCAM_KEYFRAME_THRESHOLD', '0.04'))
+KEYFRAME_MAX_SKIP = int(os.environ.get('MOODCAM_KEYFRAME_MAX_SKIP', '10'))
+KEYFRAME_MAX_AGE_MS = float(os.environ.get('MOODCAM_KEYFRAME_MAX_AGE_MS', '500'))
+
+# /predict/bulk: images decoded and classified at once across bulk uploads, and per-upload limits
+BULK_WORKERS = int(os.environ.get('MOODCAM_BULK_WORKERS', str(MAX_BATCH_SIZE)))
+BULK_MAX_IMAGES = int(os.environ.get('MOODCAM_BULK_MAX_IMAGES', '1000'))
+BULK_MAX_IMAGE_BYTES = int(float(os.environ.get('MOODCAM_BULK_MAX_IMAGE_MB', '20')) * 1024 * 1024)
+# Raw zip bodies are spooled to disk past this size instead of held in memory
+BULK_SPOOL_BYTES = 8 * 1024 * 1024
+# Same for each multipart part, which is copied before the response streams
+BULK_PART_SPOOL_BYTES = 1024 * 1024
+bulk_pool = ThreadPoolExecutor(max_workers=BULK_WORKERS, thread_name_prefix='moodcam-bulk')
+
+# Frame rate advertised to realtime clients by /capabilities
+TARGET_FPS = float(os.environ.get('MOODCAM_TARGET_FPS', '15'))
+
+# Frames from one X-Client-Id that have not started inference when a newer one arrives are skipped
+coalescer = ClientCoalescer()
+
+# Admin-loaded model files must live under this directory
+MODEL_DIR = os.path.realpath(os.environ.get('MOODCAM_MODEL_DIR', os.path.dirname(os.path.abspath(__file__))))
+
+# Timings of the default model, filled in by warmup_worker()
+startup = {}
+try:
+    registry.load(os.environ.get('MOODCAM_MODEL_NAME', 'default'), warm=False)
+except Exception as e:
+    logger.exception("Failed to load model: %s", e)
+for _spec in filter(None, os.environ.get('MOODCAM_MODELS', '').split(',')):
+    _name, _, _path = _spec.partition('=')
+    try:
+        registry.load(_name.strip(), _path.strip(), warm=False)
+    except Exception as e:
+        logger.exception("Failed to load model %s: %s", _name, e)
+
+
+def warmup_worker() -> None:
+    """Run the warmup inference of every resident model and record startup timings.
+
+    Called at import for the development servers. Under gunicorn (see
+    gunicorn.conf.py) each worker calls this from post_worker_init before it
+    accepts requests, so framework thread pools and lazy state are created in
+    the process that uses them, including when the app was preloaded.
+    """
+    for name in registry.names():
+        try:
+            with registry.lease(name) as resident:
+                model_ml.warmup(resident.bundle)
+        except Exception as e:
+            logger.exception("Warmup inference failed for model %s: %s", name, e)
+    if registry.default_name is None:
+        return
+    with registry.lease() as resident:
+        startup.update(resident.bundle['timings'], ready_s=time.perf_counter() - _STARTED, pid=os.getpid())
+    logger.info(
+        "Startup timings (pid %d): import=%.2fs load=%.2fs compile=%.2fs first_inference=%.2fs time_to_ready=%.2fs",
+        os.getpid(), startup.get('import_s', 0.0), startup.get('load_s', 0.0), startup.get('compile_s', 0.0),
+        startup.get('first_inference_s', 0.0), startup['ready_s'],
+    )
+
+
+if not os.environ.get('MOODCAM_DEFER_WARMUP'):
+    warmup_worker()
+
+# Per-stage latencies (detect/preprocess/inference/postprocess) and batch sizes for /metrics
+model_ml.set_stage_observer(metrics.observe_stage)
+
+
+def _face_result(label, prob, bbox) -> dict:
+    resp = {'label': label, 'probability': float(prob), 'face_found': bool(bbox is not None)}
+    if bbox is not None:
+        resp['bbox'] = [int(bbox[0]), int(bbox[1]), int(bbox[2]), int(bbox[3])]
+    return resp
+
+
+def prediction_response(label, prob, bbox) -> dict:
+    metrics.record_prediction(bbox is not None)
+    return _face_result(label, prob, bbox)
+
+
+def faces_response(faces) -> dict:
+    """Body for /predict/faces; the request counts as one prediction however many faces it has."""
+    payload = [_face_result(label, prob, bbox) for label, prob, bbox in faces]
+    metrics.record_prediction(bool(payload))
+    return {'faces': payload, 'count': len(payload)}
+
+
+def parse_roi(offset, scale):
+    """(offset, scale) of a client-cropped face ROI, or None when the upload is a full frame.
+
+    `offset` is "x,y" or [x, y] in frame pixels; `scale` is frame pixels per ROI pixel.
+    """
+    if offset is None or offset == '':
+        return None
+    if isinstance(offset, str):
+        offset = offset.split(',')
+    x, y = (float(v) for v in offset)
+    scale = float(scale) if scale not in (None, '') else 1.0
+    if x < 0 or y < 0 or not scale > 0:
+        raise ValueError('roi_offset must be non-negative and roi_scale positive')
+    return (x, y), scale
+
+
+def roi_bbox(bbox, roi):
+    return roi_to_frame(bbox, *roi) if roi is not None else bbox
+
+
+def model_error_message(e: ModelNotFound) -> str:
+    return 'Model not loaded' if registry.default_name is None else f'Unknown model: {e.args[0]}'
+
+
+def model_error_status() -> int:
+    return 500 if registry.default_name is None else 404
+
+
+def capabilities(resident) -> dict:
+    return dict(resident.capabilities(), target_fps=TARGET_FPS)
+
+
+def default_capabilities():
+    try:
+        with registry.lease() as resident:
+            return capabilities(resident)
+    except ModelNotFound:
+        return None
+
+
+class ImageDecodeError(ValueError):
+    pass
+
+
+def decode_base64(b64: str) -> bytes:
+    with metrics.STAGE_SECONDS.time(stage='base64'):
+        if ',' in b64:
+            b64 = b64.split(',', 1)[1]
+        return base64.b64decode(b64)
+
+
+_FULL_DECODER = DecodePlanner()
+
+
+def decode_frame(image_bytes, decoder: DecodePlanner = _FULL_DECODER, reduce: bool = True):
+    """Decode as small as `decoder` allows; returns (frame, scale back to upload pixels)."""
+    try:
+        with metrics.STAGE_SECONDS.time(stage='decode'):
+            frame, scale = decoder.decode(image_bytes, reduce)
+    except Exception as e:
+        raise ImageDecodeError(f'Error decoding image: {str(e)}') from e
+    if frame is None:
+        raise ImageDecodeError('Failed to decode image')
+    return frame, scale
+
+
+def predict_image_bytes(image_bytes, resident, should_run=None):
+    """Decode and classify an encoded image with a leased model, answering repeats from the cache.
+
+    Raises ImageDecodeError if the bytes are not a decodable image, and
+    Superseded if `should_run` turns False before inference starts.
+    """
+    model_id = resident.bundle['id']
+    cached = prediction_cache.get(image_bytes, model_id)
+    metrics.CACHE_LOOKUPS.inc(result='hit' if cached is not None else 'miss')
+    if cached is not None:
+        return cached
+    if should_run is not None and not should_run():
+        raise Superseded()
+    frame, scale = decode_frame(image_bytes, resident.decoder)
+    label, prob, bbox = resident.engine.predict(frame, should_run=should_run)
+    prediction = (label, prob, scale_bbox(bbox, scale))
+    prediction_cache.put(image_bytes, model_id, prediction)
+    return prediction
+
+
+def predict_faces_bytes(image_bytes, resident, max_faces=None):
+    """Every face in an encoded image as (label, probability, bbox in upload pixels)."""
+    # Full resolution: small faces in group shots would not survive a reduced decode
+    frame, scale = decode_frame(image_bytes, resident.decoder, reduce=False)
+    faces = model_ml.predict_faces(frame, resident.bundle, max_faces)
+    return [(label, prob, scale_bbox(bbox, scale)) for label, prob, bbox in faces]
+
+
+def _bulk_predict(image_bytes, resident) -> dict:
+    try:
+        label, prob, bbox = predict_image_bytes(image_bytes, resident)
+    except ImageDecodeError:
+        raise
+    except Exception as e:
+        logger.exception("Prediction error: %s", e)
+        raise RuntimeError(f'Error during model prediction: {str(e)}') from e
+    return prediction_response(label, prob, bbox)
+
+
+def bulk_lines(items, resident):
+    """NDJSON lines for the images of a bulk upload, in completion order."""
+    handle = functools.partial(_bulk_predict, resident=resident)
+    for result in bulk.stream_results(items, handle, bulk_pool, 2 * BULK_WORKERS, BULK_MAX_IMAGES):
+        if 'index' in result:
+            metrics.BULK_IMAGES.inc(result='error' if 'error' in result else 'ok')
+        yield json.dumps(result) + '\n'
+
+
+def multipart_items(files):
+    """Images of the (name, mimetype, file) parts of a multipart bulk upload; zips are expanded.
+
+    The parts are copied first: the frameworks close their part files when
+    the handler returns, before the streamed response has read them.
+    """
+    if not files:
+        raise bulk.BulkInputError('No files in upload')
+    return bulk.iter_files(bulk.spool_files(files, BULK_PART_SPOOL_BYTES), BULK_MAX_IMAGE_BYTES)
+
+
+def spool_body():
+    """Temp file for a raw bulk body; spills to disk past BULK_SPOOL_BYTES."""
+    return tempfile.SpooledTemporaryFile(max_size=BULK_SPOOL_BYTES)
+
+
+def zip_body_items(spooled, mimetype: str):
+    """Images of a raw zip body written to `spooled` (see spool_body)."""
+    spooled.seek(0)
+    if not bulk.is_zip('', mimetype, spooled.read(4)):
+        raise bulk.BulkInputError('Expected a zip archive or a multipart/form-data upload')
+    spooled.seek(0)
+    return bulk.iter_zip(bulk.open_zip(spooled), BULK_MAX_IMAGE_BYTES)
+
+
+def resolve_model_path(path: str) -> str:
+    """Resolve an admin-supplied model path, refusing files outside MODEL_DIR."""
+    full = os.path.realpath(os.path.join(MODEL_DIR, path))
+    if os.path.commonpath([full, MODEL_DIR]) != MODEL_DIR:
+        raise ValueError(f'Model path must be inside {MODEL_DIR}')
+    if not os.path.isfile(full):
+        raise FileNotFoundError(f'Model file not found: {path}')
+    return full
+
+
+def keyframe_gate(param):
+    """Gate for a new stream session; `param` is the ?keyframes= value, if any."""
+    enabled = KEYFRAME_GATING if param is None else param not in ('0', 'false', 'off')
+    if not enabled:
+        return None
+    return KeyframeGate(KEYFRAME_THRESHOLD, KEYFRAME_MAX_SKIP, KEYFRAME_MAX_AGE_MS / 1000.0)
+
+
+def stream_response(frame_id, prediction, info) -> dict:
+    label, prob, bbox = prediction
+    resp = prediction_response(label, prob, bbox)
+    resp.update(
+        frame_id=frame_id, latency_ms=round(info['latency_ms'], 2),
+        dropped=info['dropped'], reused=info['reused'],
+    )
+    metrics.STREAM_FRAMES.inc(result='reused' if info['reused'] else 'classified')
+    return resp
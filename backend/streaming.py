@@ -0,0 +1,230 @@
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+import cv2
+
+import model as model_ml
+from batching import BatchingEngine, BBox, Prediction
+from decode import DecodePlanner, scale_bbox
+
+logger = logging.getLogger("moodcam")
+
+
+class LatestFrameSlot:
+    """Single-slot mailbox where a newer item replaces one not yet taken."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item: Any = None
+        self._has_item = False
+        self._closed = False
+
+    def put(self, item: Any) -> bool:
+        """Store `item`; returns True if it replaced a stale, unprocessed one."""
+        with self._cond:
+            replaced = self._has_item
+            self._item = item
+            self._has_item = True
+            self._cond.notify()
+            return replaced
+
+    def take(self, timeout: Optional[float] = None) -> Optional[Any]:
+        """Wait for the newest item; returns None on timeout or once closed."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._has_item or self._closed, timeout=timeout):
+                return None
+            if not self._has_item:
+                return None
+            item = self._item
+            self._item = None
+            self._has_item = False
+            return item
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class KeyframeGate:
+    """Decides when a stream frame can reuse the last classification.
+
+    The face crop is shrunk to a `size` x `size` grayscale thumbnail and
+    compared with the thumbnail of the last classified frame (the keyframe).
+    The previous label is reused while the mean absolute difference stays
+    under `threshold` (fraction of full scale), the face has not moved or
+    resized by more than `max_shift` of its size, fewer than `max_skip` frames
+    have reused it and it is younger than `max_age_s`. Frames without a face
+    are always classified.
+    """
+
+    def __init__(self, threshold: float = 0.04, max_skip: int = 10, max_age_s: float = 0.5,
+                 max_shift: float = 0.2, size: int = 16):
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.max_age_s = max_age_s
+        self.max_shift = max_shift
+        self.size = size
+        self._thumb: Optional[np.ndarray] = None
+        self._bbox: Optional[BBox] = None
+        self._result: Optional[Tuple[str, float]] = None
+        self._at = 0.0
+        self._skipped = 0
+
+    def _thumbnail(self, frame: np.ndarray, bbox: BBox) -> np.ndarray:
+        x, y, w, h = bbox
+        roi = frame[y:y + h, x:x + w]
+        if roi.ndim == 3:
+            roi = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(roi, (self.size, self.size), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def _moved(self, bbox: BBox) -> bool:
+        x0, y0, w0, h0 = self._bbox
+        x, y, w, h = bbox
+        scale = float(max(w0, h0, 1))
+        dx = abs((x + w / 2) - (x0 + w0 / 2)) / scale
+        dy = abs((y + h / 2) - (y0 + h0 / 2)) / scale
+        dsize = abs(w - w0) / scale
+        return max(dx, dy, dsize) > self.max_shift
+
+    def reuse(self, frame: np.ndarray, bbox: Optional[BBox]) -> Optional[Tuple[str, float]]:
+        """Return the last (label, probability) if `frame` is close enough to the keyframe, else None."""
+        if bbox is None or self._thumb is None or bbox[2] <= 0 or bbox[3] <= 0:
+            return None
+        if self._skipped >= self.max_skip or time.perf_counter() - self._at > self.max_age_s:
+            return None
+        if self._moved(bbox):
+            return None
+        diff = float(np.mean(np.abs(self._thumbnail(frame, bbox) - self._thumb))) / 255.0
+        if diff > self.threshold:
+            return None
+        self._skipped += 1
+        return self._result
+
+    def update(self, frame: np.ndarray, prediction: Prediction) -> None:
+        """Make `frame` the new keyframe with its fresh prediction."""
+        label, prob, bbox = prediction
+        if bbox is None or bbox[2] <= 0 or bbox[3] <= 0:
+            self._thumb = None
+            return
+        self._thumb = self._thumbnail(frame, bbox)
+        self._bbox = bbox
+        self._result = (label, prob)
+        self._at = time.perf_counter()
+        self._skipped = 0
+
+
+class StreamSession:
+    """Per-client realtime analysis session.
+
+    Frames are pushed as encoded image bytes. A worker thread always decodes and
+    classifies the newest pending frame; frames that arrive while inference is
+    running replace each other and are dropped unprocessed. The last face bbox is
+    kept so detection on the next frame can search around it.
+
+    Frames are decoded with `decoder` (full-size color by default); bboxes are
+    tracked in decoded pixels and reported in uploaded-image pixels.
+
+    With a `gate` (KeyframeGate), the face is located first and the classifier
+    only runs when the face changed since the last classified frame; otherwise
+    the previous label is returned with the new bbox and `info['reused']` set.
+
+    `on_result(frame_id, prediction, info)` and `on_error(frame_id, message)` are
+    called from the worker thread.
+    """
+
+    def __init__(
+        self,
+        engine: BatchingEngine,
+        on_result: Callable[[int, Prediction, Dict[str, Any]], None],
+        on_error: Callable[[Optional[int], str], None],
+        gate: Optional[KeyframeGate] = None,
+        decoder: Optional[DecodePlanner] = None,
+    ):
+        self.engine = engine
+        self.gate = gate
+        self.decoder = decoder or DecodePlanner()
+        self.on_result = on_result
+        self.on_error = on_error
+        self.last_bbox: Optional[BBox] = None
+        self.frames_received = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        self.frames_reused = 0
+        self._ids = itertools.count(1)
+        self._slot = LatestFrameSlot()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name='moodcam-stream', daemon=True)
+        self._worker.start()
+
+    def push(self, image_bytes: bytes, frame_id: Optional[int] = None) -> int:
+        """Queue an encoded frame, replacing any frame that has not started processing."""
+        if frame_id is None:
+            frame_id = next(self._ids)
+        self.frames_received += 1
+        if self._slot.put((frame_id, image_bytes, time.perf_counter())):
+            self.frames_dropped += 1
+        return frame_id
+
+    def close(self) -> None:
+        self._closed = True
+        self._slot.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'received': self.frames_received,
+            'processed': self.frames_processed,
+            'dropped': self.frames_dropped,
+            'reused': self.frames_reused,
+        }
+
+    def _decode(self, image_bytes: bytes) -> Tuple[Optional[np.ndarray], float]:
+        return self.decoder.decode(image_bytes)
+
+    def _classify(self, frame: np.ndarray) -> Tuple[Prediction, bool]:
+        if self.gate is None:
+            return self.engine.predict(frame, self.last_bbox), False
+        bbox = model_ml._detect_face_bbox(frame, self.last_bbox)
+        cached = self.gate.reuse(frame, bbox)
+        if cached is not None:
+            self.frames_reused += 1
+            return (cached[0], cached[1], bbox), True
+        # The face was just located; the engine classifies it without detecting again
+        prediction = self.engine.predict(frame, bbox, detect=False)
+        self.gate.update(frame, prediction)
+        return prediction, False
+
+    def _run(self) -> None:
+        while not self._closed:
+            item: Optional[Tuple[int, bytes, float]] = self._slot.take()
+            if item is None:
+                continue
+            frame_id, image_bytes, received_at = item
+            try:
+                frame, scale = self._decode(image_bytes)
+                if frame is None:
+                    self.on_error(frame_id, 'Failed to decode image')
+                    continue
+                prediction, reused = self._classify(frame)
+            except Exception as e:
+                logger.exception("Stream prediction error: %s", e)
+                self.on_error(frame_id, f'Error during model prediction: {str(e)}')
+                continue
+            self.last_bbox = prediction[2]
+            self.frames_processed += 1
+            info = {
+                'latency_ms': (time.perf_counter() - received_at) * 1000.0,
+                'dropped': self.frames_dropped,
+                'reused': reused,
+            }
+            label, prob, bbox = prediction
+            try:
+                self.on_result(frame_id, (label, prob, scale_bbox(bbox, scale)), info)
+            except Exception as e:
+                # The client went away; stop processing for this session
+                logger.info("Stream session closed while sending: %s", e)
+                self.close()
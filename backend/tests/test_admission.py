@@ -0,0 +1,59 @@
+import asyncio
+import threading
+
+import pytest
+
+from admission import AdmissionController, Overloaded
+
+
+def _admits_right_away(controller):
+    """True if a call gets a slot without waiting, i.e. no permit has leaked."""
+    async def check():
+        return await asyncio.wait_for(controller.run(lambda: True), timeout=1.0)
+    return check()
+
+
+def test_deadline_rejects_a_queued_call_and_keeps_the_slot_count():
+    controller = AdmissionController(max_concurrency=1, max_queue=4, deadline_s=0.05)
+    release = threading.Event()
+
+    async def scenario():
+        busy = asyncio.ensure_future(controller.run(release.wait, 5.0))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded) as info:
+            await controller.run(lambda: None)
+        release.set()
+        await busy
+        return info.value, await _admits_right_away(controller)
+
+    rejected, admitted = asyncio.run(scenario())
+
+    assert rejected.status == 503
+    assert admitted is True
+    assert controller.stats()['waiting'] == 0 and controller.stats()['running'] == 0
+    controller.shutdown()
+
+
+@pytest.mark.parametrize('steps', [0, 1])
+def test_cancelled_while_the_slot_is_granted_returns_it(steps):
+    controller = AdmissionController(max_concurrency=1, max_queue=4, deadline_s=1.0)
+
+    async def scenario():
+        await controller.run(lambda: None)
+        semaphore = controller._semaphore
+        await semaphore.acquire()
+        queued = asyncio.ensure_future(controller.run(lambda: None))
+        await asyncio.sleep(0.01)
+        # Free the slot and cancel the queued call before (steps=0) or after (steps=1) it is granted
+        semaphore.release()
+        for _ in range(steps):
+            await asyncio.sleep(0)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        return await _admits_right_away(controller)
+
+    assert asyncio.run(scenario()) is True
+    assert controller.stats()['waiting'] == 0 and controller.stats()['running'] == 0
+    assert controller.admitted == 2
+    controller.shutdown()
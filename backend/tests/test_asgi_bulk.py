@@ -0,0 +1,84 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+pytest.importorskip('cv2')
+pytest.importorskip('starlette')
+pytest.importorskip('httpx')
+pytest.importorskip('multipart')
+
+from starlette.testclient import TestClient  # noqa: E402
+
+import asgi  # noqa: E402
+import metrics  # noqa: E402
+import service  # noqa: E402
+
+
+def _in_flight():
+    return metrics.IN_FLIGHT._values.get(('predict_bulk',), 0.0)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    seen_in_flight = []
+
+    def predict(data, resident, should_run=None):
+        seen_in_flight.append(_in_flight())
+        return 'happy', 0.9, None
+
+    monkeypatch.setattr(service.registry, 'acquire', lambda name=None: object())
+    monkeypatch.setattr(service.registry, 'release', lambda resident: None)
+    monkeypatch.setattr(service, 'predict_image_bytes', predict)
+    with TestClient(asgi.app) as c:
+        c.seen_in_flight = seen_in_flight
+        yield c
+
+
+def _lines(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_does_not_import_flask():
+    code = "import sys, asgi; assert 'flask' not in sys.modules and 'link' not in sys.modules"
+    subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(asgi.__file__), check=True)
+
+
+def test_multipart_bulk(client):
+    files = [('files', ('a.jpg', b'first', 'image/jpeg')), ('files', ('b.jpg', b'second', 'image/jpeg'))]
+    response = client.post('/predict/bulk', files=files)
+
+    assert response.status_code == 200
+    lines = _lines(response)
+    assert sorted(r['name'] for r in lines[:-1]) == ['a.jpg', 'b.jpg']
+    assert lines[-1] == {'done': True, 'count': 2, 'errors': 0}
+
+
+def test_zip_body_bulk(client):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as archive:
+        archive.writestr('x.jpg', b'1')
+        archive.writestr('notes.txt', b'skipped')
+    response = client.post('/predict/bulk', content=buf.getvalue(), headers={'content-type': 'application/zip'})
+
+    lines = _lines(response)
+    assert [r['name'] for r in lines[:-1]] == ['x.jpg']
+    assert lines[-1]['count'] == 1
+
+
+def test_non_zip_body_is_rejected(client):
+    response = client.post('/predict/bulk', content=b'nope', headers={'content-type': 'application/octet-stream'})
+
+    assert response.status_code == 400
+
+
+def test_streamed_request_counts_as_in_flight_until_the_body_ends(client):
+    before = _in_flight()
+    client.post('/predict/bulk', files=[('files', ('a.jpg', b'first', 'image/jpeg'))])
+
+    assert client.seen_in_flight == [before + 1]
+    assert _in_flight() == before
@@ -0,0 +1,52 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+
+import model as model_ml  # noqa: E402
+from batching import BatchingEngine  # noqa: E402
+from coalescing import Superseded  # noqa: E402
+
+FOUND = (1, 1, 4, 4)
+
+
+@pytest.fixture
+def detections(monkeypatch):
+    calls = []
+
+    def detect(frame, prev=None):
+        calls.append(prev)
+        return FOUND
+
+    monkeypatch.setattr(model_ml, '_detect_face_bbox', detect)
+    monkeypatch.setattr(model_ml, '_classify_rois', lambda kind, model, rois: [('happy', 0.9)] * len(rois))
+    return calls
+
+
+@pytest.fixture
+def engine():
+    engine = BatchingEngine({'kind': 'keras', 'model': None}, max_batch_size=4, max_wait_ms=1)
+    yield engine
+    engine.close()
+
+
+def _frame():
+    return np.zeros((10, 10, 3), np.uint8)
+
+
+def test_detects_the_face_by_default(engine, detections):
+    assert engine.predict(_frame(), (2, 2, 3, 3)) == ('happy', 0.9, FOUND)
+    assert detections == [(2, 2, 3, 3)]
+
+
+def test_detect_false_uses_the_given_face(engine, detections):
+    assert engine.predict(_frame(), (2, 2, 3, 3), detect=False) == ('happy', 0.9, (2, 2, 3, 3))
+    assert engine.predict(_frame(), None, detect=False) == ('happy', 0.9, None)
+    assert detections == []
+
+
+def test_superseded_frames_are_skipped(engine, detections):
+    with pytest.raises(Superseded):
+        engine.predict(_frame(), should_run=lambda: False)
+    assert detections == []
+    assert engine.predict(_frame(), should_run=lambda: True) == ('happy', 0.9, FOUND)
@@ -0,0 +1,115 @@
+import io
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import bulk
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        yield pool
+
+
+def _items(n):
+    return [(f'img{i}.jpg', f'data{i}'.encode()) for i in range(n)]
+
+
+def _ok(data):
+    return {'label': data.decode()}
+
+
+def test_one_line_per_image_then_done(executor):
+    lines = list(bulk.stream_results(_items(5), _ok, executor, window=2, max_items=100))
+
+    results, done = lines[:-1], lines[-1]
+    assert sorted(r['index'] for r in results) == list(range(5))
+    assert all(r['label'] == f"data{r['index']}" and r['name'] == f"img{r['index']}.jpg" for r in results)
+    assert done == {'done': True, 'count': 5, 'errors': 0}
+
+
+def test_window_bounds_images_in_flight(executor):
+    lock = threading.Lock()
+    active = peak = 0
+    read = []
+
+    def source():
+        for item in _items(12):
+            read.append(item[0])
+            yield item
+
+    def handle(data):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.01)
+        with lock:
+            active -= 1
+        return {}
+
+    consumed = 0
+    for line in bulk.stream_results(source(), handle, executor, window=3, max_items=100):
+        if 'index' in line:
+            consumed += 1
+            # Never read further ahead of the consumer than the window
+            assert len(read) <= consumed + 3
+    assert peak <= 3
+    assert consumed == 12
+
+
+def test_unreadable_items_and_failures_become_error_lines(executor):
+    def handle(data):
+        if data == b'bad':
+            raise ValueError('cannot decode')
+        return {'label': 'ok'}
+
+    items = [('a.jpg', b'good'), ('b.jpg', ValueError('Image too large')), ('c.jpg', b'bad')]
+    lines = list(bulk.stream_results(items, handle, executor, window=2, max_items=100))
+
+    by_name = {line['name']: line for line in lines[:-1]}
+    assert by_name['a.jpg']['label'] == 'ok'
+    assert by_name['b.jpg'] == {'index': 1, 'name': 'b.jpg', 'error': 'Image too large'}
+    assert by_name['c.jpg']['error'] == 'cannot decode'
+    assert lines[-1] == {'done': True, 'count': 3, 'errors': 2}
+
+
+def test_uploads_past_max_items_are_truncated(executor):
+    lines = list(bulk.stream_results(_items(5), _ok, executor, window=2, max_items=3))
+
+    assert len(lines) == 4
+    assert lines[-1] == {'done': True, 'count': 3, 'errors': 0, 'truncated': True, 'max_images': 3}
+
+
+def test_iter_zip_skips_non_images_and_oversized_entries():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as archive:
+        archive.writestr('a.jpg', b'small')
+        archive.writestr('big.png', b'x' * 100)
+        archive.writestr('readme.txt', b'text')
+        archive.writestr('__MACOSX/._a.jpg', b'meta')
+    buf.seek(0)
+
+    items = dict(bulk.iter_zip(bulk.open_zip(buf), max_image_bytes=10))
+
+    assert set(items) == {'a.jpg', 'big.png'}
+    assert items['a.jpg'] == b'small'
+    assert isinstance(items['big.png'], ValueError)
+
+
+def test_open_zip_rejects_non_archives():
+    with pytest.raises(bulk.BulkInputError):
+        bulk.open_zip(io.BytesIO(b'not a zip'))
+
+
+def test_spooled_files_outlive_the_originals():
+    original = io.BytesIO(b'image')
+    files = bulk.spool_files([('a.jpg', 'image/jpeg', original)], max_memory=1024)
+    original.close()
+
+    assert list(bulk.iter_files(files, max_image_bytes=100)) == [('a.jpg', b'image')]
+    assert files[0][2].closed
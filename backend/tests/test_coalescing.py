@@ -0,0 +1,36 @@
+from coalescing import ClientCoalescer
+
+
+def test_newer_frame_supersedes_older_one():
+    coalescer = ClientCoalescer()
+    with coalescer.frame('client') as first:
+        assert first()
+        with coalescer.frame('client') as second:
+            assert not first()
+            assert second()
+        assert not first()
+    assert coalescer.active_clients() == 0
+
+
+def test_clients_do_not_supersede_each_other():
+    coalescer = ClientCoalescer()
+    with coalescer.frame('a') as a, coalescer.frame('b') as b:
+        assert a() and b()
+        assert coalescer.active_clients() == 2
+
+
+def test_older_frame_finishing_keeps_the_newer_one_tracked():
+    coalescer = ClientCoalescer()
+    first = coalescer.frame('client')
+    first.__enter__()
+    with coalescer.frame('client') as second:
+        first.__exit__(None, None, None)
+        assert second()
+        assert coalescer.active_clients() == 1
+
+
+def test_frames_without_client_id_are_never_coalesced():
+    coalescer = ClientCoalescer()
+    with coalescer.frame(None) as should_run:
+        assert should_run is None
+    assert coalescer.active_clients() == 0
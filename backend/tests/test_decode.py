@@ -0,0 +1,55 @@
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+np = pytest.importorskip('numpy')
+
+from decode import DecodePlanner, jpeg_size, roi_to_frame, scale_bbox  # noqa: E402
+
+
+def _encode(ext, width, height, channels=3):
+    shape = (height, width, channels) if channels > 1 else (height, width)
+    image = np.random.default_rng(0).integers(0, 256, shape, dtype=np.uint8)
+    ok, buf = cv2.imencode(ext, image)
+    assert ok
+    return buf.tobytes()
+
+
+@pytest.mark.parametrize('width,height,channels', [(64, 48, 3), (33, 97, 3), (640, 480, 1)])
+def test_jpeg_size_reads_the_header(width, height, channels):
+    assert jpeg_size(_encode('.jpg', width, height, channels)) == (width, height)
+
+
+def test_jpeg_size_accepts_buffers():
+    data = _encode('.jpg', 20, 10)
+    assert jpeg_size(memoryview(data)) == (20, 10)
+    assert jpeg_size(bytearray(data)) == (20, 10)
+
+
+def test_jpeg_size_rejects_other_formats():
+    assert jpeg_size(_encode('.png', 20, 10)) is None
+    assert jpeg_size(b'') is None
+    assert jpeg_size(b'\xff\xd8') is None
+
+
+def test_reduced_decode_scale_maps_back_to_upload_pixels():
+    frame, scale = DecodePlanner(min_side=120).decode(_encode('.jpg', 640, 480))
+
+    assert scale > 1.0
+    assert (frame.shape[1] * scale, frame.shape[0] * scale) == (640, 480)
+    assert scale_bbox((10, 20, 30, 40), scale) == (int(10 * scale), int(20 * scale), int(30 * scale), int(40 * scale))
+
+
+@pytest.mark.parametrize('offset,scale', [((0, 0), 1.0), ((120, 80), 1.0), ((120, 80), 2.0), ((37, 5), 1.5)])
+def test_roi_to_frame_round_trips_a_client_crop(offset, scale):
+    frame_bbox = (200, 140, 90, 120)
+    ox, oy = offset
+    # Where the client-side crop (cut at offset, shrunk by scale) sees the face
+    roi_bbox = tuple(int(round(v)) for v in ((200 - ox) / scale, (140 - oy) / scale, 90 / scale, 120 / scale))
+
+    mapped = roi_to_frame(roi_bbox, offset, scale)
+
+    assert all(abs(a - b) <= scale for a, b in zip(mapped, frame_bbox))
+
+
+def test_roi_to_frame_without_face():
+    assert roi_to_frame(None, (10, 10), 2.0) is None
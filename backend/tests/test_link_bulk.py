@@ -0,0 +1,48 @@
+import io
+import json
+
+import pytest
+
+pytest.importorskip('cv2')
+pytest.importorskip('flask')
+pytest.importorskip('flask_sock')
+
+import link  # noqa: E402
+import service  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    resident = object()
+    released = []
+    monkeypatch.setattr(service.registry, 'acquire', lambda name=None: resident)
+    monkeypatch.setattr(service.registry, 'release', released.append)
+    monkeypatch.setattr(service, 'predict_image_bytes', lambda data, res, should_run=None: ('happy', 0.9, None))
+    with link.app.test_client() as c:
+        c.released = released
+        yield c
+
+
+def _lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_multipart_bulk_streams_one_line_per_file(client):
+    data = {'files': [(io.BytesIO(b'first'), 'a.jpg', 'image/jpeg'), (io.BytesIO(b'second'), 'b.jpg', 'image/jpeg')]}
+    response = client.post('/predict/bulk', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    lines = _lines(response)
+    results, done = lines[:-1], lines[-1]
+    assert sorted(r['name'] for r in results) == ['a.jpg', 'b.jpg']
+    assert all(r['label'] == 'happy' for r in results)
+    assert done == {'done': True, 'count': 2, 'errors': 0}
+    response.close()
+    assert len(client.released) == 1
+
+
+def test_multipart_bulk_without_files_is_rejected(client):
+    response = client.post('/predict/bulk', data={'note': 'x'}, content_type='multipart/form-data')
+
+    assert response.status_code == 400
+    assert client.released
@@ -0,0 +1,38 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+onnx = pytest.importorskip('onnx')
+pytest.importorskip('onnxruntime')
+
+from onnx import TensorProto, helper  # noqa: E402
+
+from lite_models import OnnxModel  # noqa: E402
+
+
+def _save_model(path, shape):
+    """Graph averaging its NHWC input over H and W, with the given (possibly symbolic) input shape."""
+    node = helper.make_node('ReduceMean', ['x'], ['y'], axes=[1, 2], keepdims=0)
+    graph = helper.make_graph(
+        [node], 'mean',
+        [helper.make_tensor_value_info('x', TensorProto.FLOAT, shape)],
+        [helper.make_tensor_value_info('y', TensorProto.FLOAT, [shape[0], shape[3]])],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 7
+    onnx.save(model, str(path))
+    return str(path)
+
+
+def test_fixed_input_size_with_dynamic_batch(tmp_path):
+    model = OnnxModel(_save_model(tmp_path / 'fixed.onnx', ['N', 48, 48, 1]))
+
+    assert model.input_shape == (None, 48, 48, 1)
+    out = model.predict_on_batch(np.ones((3, 48, 48, 1), np.float32))
+    np.testing.assert_allclose(out, np.ones((3, 1)))
+
+
+def test_dynamic_spatial_dims_are_rejected_at_load(tmp_path):
+    path = _save_model(tmp_path / 'dynamic.onnx', ['N', 'H', 'W', 1])
+
+    with pytest.raises(ValueError, match='fixed input size'):
+        OnnxModel(path)
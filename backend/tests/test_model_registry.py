@@ -0,0 +1,67 @@
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+
+import model as model_ml  # noqa: E402
+from model_registry import ModelRegistry  # noqa: E402
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(model_ml, 'load_model', lambda path: {'kind': 'keras', 'model': None, 'path': path, 'id': path})
+    registry = ModelRegistry(memory_budget_bytes=100, max_wait_ms=1)
+    yield registry
+    for name in registry.names():
+        registry._models[name].engine.close()
+
+
+@pytest.fixture
+def load(registry, tmp_path):
+    def load(name, size, **kwargs):
+        path = tmp_path / name
+        path.write_bytes(b'\0' * size)
+        return registry.load(name, str(path), warm=False, **kwargs)
+    return load
+
+
+def test_evicts_least_recently_used_but_not_the_default(registry, load):
+    load('base', 40)
+    load('a', 30)
+    load('b', 30)
+
+    load('c', 30)
+
+    assert set(registry.names()) == {'base', 'b', 'c'}
+    assert registry.evictions == 1
+
+
+def test_evicts_others_to_make_room_for_the_model_just_loaded(registry, load):
+    load('base', 40)
+    load('a', 10)
+
+    resident = load('big', 60)
+
+    assert set(registry.names()) == {'base', 'big'}
+    with registry.lease('big') as leased:
+        assert leased is resident
+
+
+def test_rejects_a_model_that_cannot_fit_beside_the_default(registry, load):
+    load('base', 40)
+    load('a', 10)
+
+    with pytest.raises(ValueError, match='beside the default model base'):
+        load('huge', 70)
+
+    assert set(registry.names()) == {'base', 'a'}
+    assert registry.evictions == 0
+
+
+def test_new_default_only_has_to_fit_by_itself(registry, load):
+    load('base', 40)
+
+    load('v2', 70, make_default=True)
+
+    assert registry.default_name == 'v2'
+    assert registry.names() == ['v2']
@@ -0,0 +1,64 @@
+import prediction_cache
+from prediction_cache import PredictionCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_hit_for_same_bytes_and_model():
+    cache = PredictionCache(max_entries=4, ttl_seconds=60)
+    cache.put(b'image', 'm1', ('happy', 0.9, None))
+
+    assert cache.get(b'image', 'm1') == ('happy', 0.9, None)
+    assert cache.get(b'image', 'm2') is None
+    assert cache.get(b'other', 'm1') is None
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(prediction_cache, 'time', clock)
+    cache = PredictionCache(max_entries=4, ttl_seconds=10)
+    cache.put(b'image', 'm1', 'result')
+
+    clock.now += 9
+    assert cache.get(b'image', 'm1') == 'result'
+    clock.now += 2
+    assert cache.get(b'image', 'm1') is None
+    assert cache.stats()['expirations'] == 1
+    assert cache.stats()['entries'] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PredictionCache(max_entries=2, ttl_seconds=60)
+    cache.put(b'a', 'm', 'A')
+    cache.put(b'b', 'm', 'B')
+    cache.get(b'a', 'm')
+    cache.put(b'c', 'm', 'C')
+
+    assert cache.get(b'a', 'm') == 'A'
+    assert cache.get(b'b', 'm') is None
+    assert cache.get(b'c', 'm') == 'C'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_invalidate_drops_only_that_model():
+    cache = PredictionCache(max_entries=8, ttl_seconds=60)
+    cache.put(b'a', 'm1', 'A1')
+    cache.put(b'a', 'm2', 'A2')
+    cache.invalidate('m1')
+
+    assert cache.get(b'a', 'm1') is None
+    assert cache.get(b'a', 'm2') == 'A2'
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_zero_entries_disables_caching():
+    cache = PredictionCache(max_entries=0)
+    cache.put(b'a', 'm', 'A')
+
+    assert cache.get(b'a', 'm') is None
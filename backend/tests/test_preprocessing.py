@@ -0,0 +1,51 @@
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+np = pytest.importorskip('numpy')
+
+import model as model_ml  # noqa: E402
+from preprocessing import BatchPreprocessor  # noqa: E402
+
+
+class FakeKerasModel:
+    def __init__(self, height, width, channels):
+        self.input_shape = (None, height, width, channels)
+
+
+def _crops():
+    rng = np.random.default_rng(1)
+    return [rng.integers(0, 256, shape, dtype=np.uint8) for shape in [(120, 100, 3), (48, 48, 3), (30, 70, 3)]]
+
+
+def test_matches_legacy_rgb_preprocessing():
+    crops = _crops()
+    legacy = np.concatenate([model_ml._preprocess_for_keras(c, FakeKerasModel(48, 48, 3)) for c in crops])
+
+    batch = BatchPreprocessor(48, 48, 3)(crops)
+
+    assert batch.shape == legacy.shape
+    np.testing.assert_allclose(batch, legacy, atol=1e-6)
+
+
+def test_matches_legacy_grayscale_preprocessing():
+    crops = _crops() + [cv2.cvtColor(_crops()[0], cv2.COLOR_BGR2GRAY)]
+    legacy = np.concatenate([model_ml._preprocess_for_keras(c, FakeKerasModel(48, 48, 1)) for c in crops])
+
+    batch = BatchPreprocessor(48, 48, 1)(crops)
+
+    assert batch.shape == legacy.shape
+    np.testing.assert_allclose(batch, legacy, atol=1e-6)
+
+
+def test_nchw_is_the_transposed_nhwc_batch():
+    crops = _crops()
+    nhwc = BatchPreprocessor(32, 32, 3, 'NHWC')(crops).copy()
+    nchw = BatchPreprocessor(32, 32, 3, 'NCHW')(crops)
+
+    np.testing.assert_array_equal(nchw, nhwc.transpose(0, 3, 1, 2))
+
+
+def test_grows_past_initial_capacity():
+    pre = BatchPreprocessor(16, 16, 3, capacity=1)
+
+    assert pre(_crops()).shape == (3, 16, 16, 3)
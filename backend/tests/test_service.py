@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+
+import metrics  # noqa: E402
+import service  # noqa: E402
+
+
+def _counts():
+    return metrics.PREDICTIONS._values.get((), 0.0), metrics.FACES_FOUND._values.get((), 0.0)
+
+
+def test_faces_response_records_one_prediction_per_request():
+    before = _counts()
+
+    body = service.faces_response([('happy', 0.9, (1, 2, 3, 4)), ('sad', 0.6, (5, 6, 7, 8))])
+
+    assert body == {
+        'faces': [
+            {'label': 'happy', 'probability': 0.9, 'face_found': True, 'bbox': [1, 2, 3, 4]},
+            {'label': 'sad', 'probability': 0.6, 'face_found': True, 'bbox': [5, 6, 7, 8]},
+        ],
+        'count': 2,
+    }
+    assert _counts() == (before[0] + 1, before[1] + 1)
+
+
+def test_faces_response_without_faces():
+    before = _counts()
+
+    assert service.faces_response([]) == {'faces': [], 'count': 0}
+    assert _counts() == (before[0] + 1, before[1])
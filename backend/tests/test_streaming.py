@@ -0,0 +1,99 @@
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+np = pytest.importorskip('numpy')
+
+import streaming  # noqa: E402
+from streaming import KeyframeGate  # noqa: E402
+
+BBOX = (20, 20, 40, 40)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def perf_counter(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(streaming, 'time', fake)
+    return fake
+
+
+def _frame(seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (100, 100, 3), dtype=np.uint8)
+
+
+def test_unchanged_face_reuses_the_keyframe_result(clock):
+    gate = KeyframeGate(threshold=0.04, max_skip=10, max_age_s=0.5)
+    frame = _frame()
+    assert gate.reuse(frame, BBOX) is None
+    gate.update(frame, ('happy', 0.8, BBOX))
+
+    assert gate.reuse(frame, BBOX) == ('happy', 0.8)
+
+
+def test_changed_face_or_no_face_is_classified(clock):
+    gate = KeyframeGate(threshold=0.04)
+    gate.update(_frame(0), ('happy', 0.8, BBOX))
+
+    assert gate.reuse(_frame(1), BBOX) is None
+    assert gate.reuse(_frame(0), None) is None
+    assert gate.reuse(_frame(0), (40, 40, 40, 40)) is None
+
+
+def test_reuse_stops_after_max_skip(clock):
+    gate = KeyframeGate(max_skip=3, max_age_s=10)
+    frame = _frame()
+    gate.update(frame, ('sad', 0.6, BBOX))
+
+    assert [gate.reuse(frame, BBOX) is not None for _ in range(4)] == [True, True, True, False]
+    gate.update(frame, ('sad', 0.7, BBOX))
+    assert gate.reuse(frame, BBOX) == ('sad', 0.7)
+
+
+def test_reuse_stops_when_keyframe_is_too_old(clock):
+    gate = KeyframeGate(max_skip=100, max_age_s=0.5)
+    frame = _frame()
+    gate.update(frame, ('sad', 0.6, BBOX))
+
+    clock.now += 0.4
+    assert gate.reuse(frame, BBOX) is not None
+    clock.now += 0.2
+    assert gate.reuse(frame, BBOX) is None
+
+
+def test_prediction_without_face_is_not_a_keyframe(clock):
+    gate = KeyframeGate()
+    frame = _frame()
+    gate.update(frame, ('neutral', 0.5, None))
+
+    assert gate.reuse(frame, BBOX) is None
+
+
+class RecordingEngine:
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, frame, prev_bbox=None, timeout=None, should_run=None, detect=True):
+        self.calls.append((prev_bbox, detect))
+        return 'happy', 0.9, prev_bbox
+
+
+def test_keyframe_is_classified_without_detecting_twice(monkeypatch):
+    detections = []
+    monkeypatch.setattr(streaming.model_ml, '_detect_face_bbox', lambda frame, prev=None: detections.append(prev) or BBOX)
+    engine = RecordingEngine()
+    session = streaming.StreamSession(engine, lambda *a: None, lambda *a: None, gate=KeyframeGate())
+    try:
+        prediction, reused = session._classify(_frame())
+    finally:
+        session.close()
+
+    assert (prediction, reused) == (('happy', 0.9, BBOX), False)
+    assert len(detections) == 1
+    assert engine.calls == [(BBOX, False)]
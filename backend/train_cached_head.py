@@ -0,0 +1,194 @@
+"""Phase 1 of model_training.py on cached MobileNetV2 embeddings.
+
+While the backbone is frozen, every epoch of model_training.py pushes every
+224x224 image through MobileNetV2 only to train the small head on top. Here
+the backbone runs once per image (and once per pre-augmented view), its
+pooled features are stored as float16 memmaps, and the Dropout/Dense head is
+trained on those. GlobalAveragePooling2D has no weights, so caching pooled
+features instead of the 7x7x1280 maps gives the same head at 1/49 the disk.
+
+The trained head is dropped back into the exact Sequential model from
+model_training.py and saved to best_model.keras, which phase 2 (fine-tuning)
+picks up as usual.
+
+Usage (from backend/, after `python packed_dataset.py train`):
+    python train_cached_head.py --views 4 --epochs 50
+"""
+import argparse
+import hashlib
+import json
+import os
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+from packed_dataset import BASE_DIR, PackedDataset, make_tf_dataset, open_packed, split_indices
+
+IMG_SIZE = (224, 224)
+FEATURE_DIM = 1280
+
+
+def build_augmentation(tf, strength: float = 0.2) -> Any:
+    # Same layers as model_training.py, which uses strength 0.2
+    return tf.keras.Sequential([
+        tf.keras.layers.RandomFlip("horizontal"),
+        tf.keras.layers.RandomRotation(strength),
+        tf.keras.layers.RandomZoom(strength),
+        tf.keras.layers.RandomContrast(strength),
+        tf.keras.layers.RandomBrightness(strength)
+    ], name="data_augmentation")
+
+
+def _cache_key(packed: PackedDataset, indices: np.ndarray, views: int) -> str:
+    h = hashlib.sha1()
+    h.update(f"{packed.path}:{len(packed)}:{views}:{IMG_SIZE}".encode())
+    h.update(indices.tobytes())
+    return h.hexdigest()
+
+
+def compute_embeddings(tf, packed: PackedDataset, indices: np.ndarray, views: int, out_path: str, batch_size: int, seed: int) -> np.memmap:
+    """Write (views, len(indices), FEATURE_DIM) float16 features; view 0 is un-augmented."""
+    base_model = tf.keras.applications.MobileNetV2(input_shape=IMG_SIZE + (3,), include_top=False, weights="imagenet")
+    base_model.trainable = False
+    extractor = tf.keras.Sequential([
+        tf.keras.layers.Rescaling(1./127.5, offset=-1),
+        base_model,
+        tf.keras.layers.GlobalAveragePooling2D(),
+    ])
+    augmentation = build_augmentation(tf)
+    tf.random.set_seed(seed)
+
+    @tf.function(reduce_retracing=True)
+    def embed(images, augment):
+        if augment:
+            images = augmentation(images, training=True)
+        return extractor(images, training=False)
+
+    feats = np.lib.format.open_memmap(out_path + '.tmp', mode='w+', dtype=np.float16, shape=(views, len(indices), FEATURE_DIM))
+    for view in range(views):
+        ds = make_tf_dataset(packed, indices, batch_size=batch_size, shuffle=False, image_size=IMG_SIZE, rgb=True)
+        pos = 0
+        for images, _ in ds:
+            out = embed(images, view > 0).numpy()
+            feats[view, pos:pos + len(out)] = out
+            pos += len(out)
+        print(f"  view {view + 1}/{views}: {pos} embeddings")
+    feats.flush()
+    del feats
+    os.replace(out_path + '.tmp', out_path)
+    return np.load(out_path, mmap_mode='r')
+
+
+def load_or_compute(tf, packed: PackedDataset, indices: np.ndarray, views: int, cache_dir: str, name: str, batch_size: int, seed: int) -> np.memmap:
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f'{name}.npy')
+    meta_path = os.path.join(cache_dir, f'{name}.json')
+    key = _cache_key(packed, indices, views)
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            if json.load(f).get('key') == key:
+                print(f"Using cached {name} embeddings from {path}")
+                return np.load(path, mmap_mode='r')
+    print(f"Computing {name} embeddings ({views} view(s) x {len(indices)} images)")
+    feats = compute_embeddings(tf, packed, indices, views, path, batch_size, seed)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump({'key': key, 'views': views, 'count': int(len(indices))}, f)
+    return feats
+
+
+def make_batches(tf, feats: np.memmap, labels: np.ndarray, batch_size: int, shuffle: bool, seed: int):
+    """Keras Sequence drawing one random cached view per example every epoch."""
+
+    class _EmbeddingBatches(tf.keras.utils.Sequence):
+        def __init__(self):
+            super().__init__()
+            self.rng = np.random.default_rng(seed)
+            self.on_epoch_end()
+
+        def __len__(self) -> int:
+            return int(np.ceil(len(labels) / batch_size))
+
+        def on_epoch_end(self) -> None:
+            self.order = self.rng.permutation(len(labels)) if shuffle else np.arange(len(labels))
+            self.views = self.rng.integers(0, feats.shape[0], size=len(labels)) if shuffle else np.zeros(len(labels), dtype=np.int64)
+
+        def __getitem__(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+            idx = self.order[i * batch_size:(i + 1) * batch_size]
+            x = feats[self.views[idx], idx].astype(np.float32)
+            return x, labels[idx]
+
+    return _EmbeddingBatches()
+
+
+def class_weights(labels: np.ndarray, num_classes: int) -> Dict[int, float]:
+    # Same formula as model_training.py
+    counts = np.bincount(labels, minlength=num_classes)
+    total = counts.sum()
+    return {i: float(total / (num_classes * c)) for i, c in enumerate(counts) if c > 0}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--packed', default=os.path.join(BASE_DIR, 'data', 'packed', 'train'))
+    parser.add_argument('--cache-dir', default=os.path.join(BASE_DIR, 'data', 'embeddings'))
+    parser.add_argument('--views', type=int, default=4, help='Cached views per training image (1 = no augmentation)')
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--embed-batch-size', type=int, default=128)
+    parser.add_argument('--learning-rate', type=float, default=0.0001)
+    parser.add_argument('--dropout', type=float, default=0.4)
+    parser.add_argument('--seed', type=int, default=123)
+    parser.add_argument('--output', default='best_model.keras')
+    args = parser.parse_args()
+
+    import tensorflow as tf
+
+    packed = open_packed(args.packed)
+    num_classes = len(packed.class_names)
+    train_idx, val_idx = split_indices(len(packed), validation_split=0.2, seed=args.seed)
+    train_feats = load_or_compute(tf, packed, train_idx, max(1, args.views), args.cache_dir, 'train', args.embed_batch_size, args.seed)
+    val_feats = load_or_compute(tf, packed, val_idx, 1, args.cache_dir, 'val', args.embed_batch_size, args.seed)
+    train_labels = packed.labels[train_idx]
+    val_labels = packed.labels[val_idx]
+
+    head = tf.keras.Sequential([
+        tf.keras.layers.InputLayer(input_shape=(FEATURE_DIM,)),
+        tf.keras.layers.Dropout(args.dropout),
+        tf.keras.layers.Dense(num_classes),
+    ])
+    head.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=args.learning_rate),
+                 loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True),
+                 metrics=['accuracy'])
+    head.fit(
+        make_batches(tf, train_feats, train_labels, args.batch_size, True, args.seed),
+        validation_data=make_batches(tf, val_feats, val_labels, args.batch_size, False, args.seed),
+        epochs=args.epochs,
+        class_weight=class_weights(train_labels, num_classes),
+        callbacks=[
+            tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=5, verbose=1, restore_best_weights=True),
+            tf.keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.2, patience=2, verbose=1, min_lr=1e-7),
+        ],
+    )
+
+    # Rebuild the model_training.py architecture and drop in the trained head
+    base_model = tf.keras.applications.MobileNetV2(input_shape=IMG_SIZE + (3,), include_top=False, weights="imagenet")
+    base_model.trainable = False
+    model = tf.keras.Sequential([
+        tf.keras.layers.InputLayer(input_shape=IMG_SIZE + (3,)),
+        build_augmentation(tf),
+        tf.keras.layers.Rescaling(1./127.5, offset=-1),
+        base_model,
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dropout(args.dropout),
+        tf.keras.layers.Dense(num_classes, )
+    ])
+    model.layers[-1].set_weights(head.layers[-1].get_weights())
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=args.learning_rate),
+                  loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True),
+                  metrics=['accuracy'])
+    model.save(args.output)
+    print(f"Saved {args.output}; run the fine-tuning phase of model_training.py next")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""Hyperparameter sweep / k-fold runner for the model_training.py recipe.
+
+Trains every combination of learning rate, fine_tune_at, dropout and
+augmentation strength (optionally on k folds) in a pool of worker processes.
+Each trial is the two phases of model_training.py: the head on a frozen
+MobileNetV2, then fine-tuning from `fine_tune_at` at a tenth of the rate.
+
+All workers read the same packed uint8 memmap (packed_dataset.py), so the
+decoded dataset exists once in the page cache however many trials run. The
+cores are split between workers: each one gets cores // workers intra-op
+threads (and one inter-op thread) before TensorFlow starts.
+
+Trials report validation accuracy after every epoch. Once `--grace-epochs`
+have passed, a trial whose best accuracy is below the median of the other
+trials at the same epoch is stopped (median stopping rule) and marked pruned.
+
+Results go to <out>/summary.csv and summary.json, each trial's best
+checkpoint to <out>/<trial>.keras, and the best one overall is copied to
+<out>/best.keras.
+
+Usage (from backend/, after `python packed_dataset.py train`):
+    python train_sweep.py --learning-rates 1e-4,3e-4 --fine-tune-at 60,80,100 \\
+        --dropouts 0.3,0.4 --aug-strengths 0.1,0.2 --workers 4
+    python train_sweep.py --folds 5 --workers 5
+"""
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing as mp
+import os
+import shutil
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from packed_dataset import BASE_DIR, make_tf_dataset, open_packed, split_indices
+from train_cached_head import IMG_SIZE, build_augmentation, class_weights
+
+
+def _floats(value: str) -> List[float]:
+    return [float(v) for v in value.split(',') if v.strip()]
+
+
+def fold_indices(n: int, folds: int, fold: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Train/validation indices for one of `folds` deterministic folds of range(n)."""
+    parts = np.array_split(np.random.default_rng(seed).permutation(n), folds)
+    val = parts[fold]
+    train = np.concatenate([p for i, p in enumerate(parts) if i != fold])
+    return np.sort(train), np.sort(val)
+
+
+def _init_worker(threads: int) -> None:
+    # Must run before TensorFlow is imported in this process
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _should_stop(history: Any, trial: str, epoch: int, best: float, grace: int, min_peers: int) -> bool:
+    """Median stopping rule: is `best` below the median of other trials' best at this epoch?"""
+    if epoch < grace:
+        return False
+    peers = []
+    for other, accs in history.items():
+        if other != trial and len(accs) > epoch:
+            peers.append(max(accs[:epoch + 1]))
+    return len(peers) >= min_peers and best < statistics.median(peers)
+
+
+def run_trial(trial: str, config: Dict[str, Any], args: Dict[str, Any], history: Any) -> Dict[str, Any]:
+    import tensorflow as tf
+
+    t0 = time.perf_counter()
+    packed = open_packed(args['packed'])
+    num_classes = len(packed.class_names)
+    if args['folds'] > 1:
+        train_idx, val_idx = fold_indices(len(packed), args['folds'], config['fold'], args['seed'])
+    else:
+        train_idx, val_idx = split_indices(len(packed), validation_split=0.2, seed=args['seed'])
+    train_ds = make_tf_dataset(packed, train_idx, args['batch_size'], shuffle=True, seed=args['seed'], image_size=IMG_SIZE, rgb=True)
+    val_ds = make_tf_dataset(packed, val_idx, args['batch_size'], shuffle=False, image_size=IMG_SIZE, rgb=True)
+    weights = class_weights(packed.labels[train_idx], num_classes)
+
+    base_model = tf.keras.applications.MobileNetV2(input_shape=IMG_SIZE + (3,), include_top=False, weights="imagenet")
+    base_model.trainable = False
+    model = tf.keras.Sequential([
+        tf.keras.layers.InputLayer(input_shape=IMG_SIZE + (3,)),
+        build_augmentation(tf, config['aug_strength']),
+        tf.keras.layers.Rescaling(1./127.5, offset=-1),
+        base_model,
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dropout(config['dropout']),
+        tf.keras.layers.Dense(num_classes)
+    ])
+    checkpoint = os.path.join(args['out'], f'{trial}.keras')
+    state = {'epoch': -1, 'best': 0.0, 'pruned': False}
+    history[trial] = []
+
+    class _MedianStopping(tf.keras.callbacks.Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            acc = float((logs or {}).get('val_accuracy', 0.0))
+            state['epoch'] += 1
+            state['best'] = max(state['best'], acc)
+            history[trial] = history[trial] + [acc]
+            if _should_stop(history, trial, state['epoch'], state['best'], args['grace_epochs'], args['min_peers']):
+                state['pruned'] = True
+                self.model.stop_training = True
+
+    def fit(learning_rate: float, epochs: int) -> None:
+        model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+                      loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True),
+                      metrics=['accuracy'])
+        model.fit(
+            train_ds, validation_data=val_ds, epochs=epochs, class_weight=weights, verbose=0,
+            callbacks=[
+                tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=5, restore_best_weights=True),
+                tf.keras.callbacks.ModelCheckpoint(checkpoint, monitor='val_accuracy', mode='max', save_best_only=True,
+                                                   initial_value_threshold=state['best'] or None),
+                tf.keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.2, patience=2, min_lr=1e-7),
+                _MedianStopping(),
+            ],
+        )
+
+    fit(config['learning_rate'], args['head_epochs'])
+    if not state['pruned'] and args['fine_tune_epochs'] > 0:
+        base_model.trainable = True
+        for layer in base_model.layers[:config['fine_tune_at']]:
+            layer.trainable = False
+        fit(config['learning_rate'] / 10, args['fine_tune_epochs'])
+
+    return dict(
+        config, trial=trial, status='pruned' if state['pruned'] else 'completed',
+        epochs=state['epoch'] + 1, best_val_accuracy=state['best'],
+        checkpoint=checkpoint if os.path.exists(checkpoint) else None,
+        seconds=time.perf_counter() - t0,
+    )
+
+
+def write_summary(results: List[Dict[str, Any]], out: str) -> None:
+    results.sort(key=lambda r: r.get('best_val_accuracy', -1.0), reverse=True)
+    fields = ['trial', 'status', 'learning_rate', 'fine_tune_at', 'dropout', 'aug_strength', 'fold',
+              'epochs', 'best_val_accuracy', 'seconds', 'checkpoint']
+    with open(os.path.join(out, 'summary.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+    with open(os.path.join(out, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print('\n| trial | status | lr | fine_tune_at | dropout | aug | fold | epochs | val acc | minutes |')
+    print('|---|---|---:|---:|---:|---:|---:|---:|---:|---:|')
+    for r in results:
+        print(f"| {r['trial']} | {r['status']} | {r['learning_rate']:g} | {r['fine_tune_at']} | {r['dropout']:g} | "
+              f"{r['aug_strength']:g} | {r['fold']} | {r.get('epochs', 0)} | {r.get('best_val_accuracy', 0.0):.4f} | "
+              f"{r.get('seconds', 0.0) / 60:.1f} |")
+
+    # Mean over folds per configuration
+    by_config: Dict[Tuple, List[float]] = {}
+    for r in results:
+        if r['status'] != 'failed':
+            key = (r['learning_rate'], r['fine_tune_at'], r['dropout'], r['aug_strength'])
+            by_config.setdefault(key, []).append(r['best_val_accuracy'])
+    if any(len(v) > 1 for v in by_config.values()):
+        print('\nMean validation accuracy per configuration:')
+        for key, accs in sorted(by_config.items(), key=lambda kv: -np.mean(kv[1])):
+            print(f"  lr={key[0]:g} fine_tune_at={key[1]} dropout={key[2]:g} aug={key[3]:g}: "
+                  f"{np.mean(accs):.4f} +/- {np.std(accs):.4f} over {len(accs)} fold(s)")
+
+    best = next((r for r in results if r.get('checkpoint')), None)
+    if best is not None:
+        shutil.copyfile(best['checkpoint'], os.path.join(out, 'best.keras'))
+        print(f"\nBest trial {best['trial']} ({best['best_val_accuracy']:.4f}) copied to {os.path.join(out, 'best.keras')}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--packed', default=os.path.join(BASE_DIR, 'data', 'packed', 'train'))
+    parser.add_argument('--out', default=os.path.join(BASE_DIR, 'sweeps', time.strftime('%Y%m%d-%H%M%S')))
+    parser.add_argument('--learning-rates', default='0.0001')
+    parser.add_argument('--fine-tune-at', default='80')
+    parser.add_argument('--dropouts', default='0.4')
+    parser.add_argument('--aug-strengths', default='0.2')
+    parser.add_argument('--folds', type=int, default=1, help='k-fold cross-validation (1 = fixed 80/20 split)')
+    parser.add_argument('--head-epochs', type=int, default=20)
+    parser.add_argument('--fine-tune-epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=None, help='Concurrent trials (default: cores // 4)')
+    parser.add_argument('--grace-epochs', type=int, default=3, help='Epochs before a trial can be pruned')
+    parser.add_argument('--min-peers', type=int, default=2, help='Other trials needed at an epoch to prune')
+    parser.add_argument('--seed', type=int, default=123)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    workers = args.workers or max(1, cores // 4)
+    threads = max(1, cores // workers)
+    os.makedirs(args.out, exist_ok=True)
+
+    grid = itertools.product(
+        _floats(args.learning_rates), [int(v) for v in args.fine_tune_at.split(',') if v.strip()],
+        _floats(args.dropouts), _floats(args.aug_strengths), range(args.folds),
+    )
+    configs = [
+        {'learning_rate': lr, 'fine_tune_at': fta, 'dropout': do, 'aug_strength': aug, 'fold': fold}
+        for lr, fta, do, aug, fold in grid
+    ]
+    shared = {k: v for k, v in vars(args).items() if k != 'workers'}
+    print(f"{len(configs)} trials on {workers} workers x {threads} threads; results in {args.out}")
+
+    # spawn: TensorFlow is not fork-safe, and each worker must set its thread pools first
+    ctx = mp.get_context('spawn')
+    results: List[Dict[str, Any]] = []
+    with ctx.Manager() as manager:
+        history = manager.dict()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=(threads,)) as pool:
+            futures = {
+                pool.submit(run_trial, f'trial{i:03d}', config, shared, history): (f'trial{i:03d}', config)
+                for i, config in enumerate(configs)
+            }
+            for fut in as_completed(futures):
+                trial, config = futures[fut]
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    print(f"{trial} failed: {e}")
+                    result = dict(config, trial=trial, status='failed', best_val_accuracy=-1.0)
+                else:
+                    print(f"{trial} {result['status']}: val acc {result['best_val_accuracy']:.4f} "
+                          f"after {result['epochs']} epochs ({result['seconds'] / 60:.1f} min)")
+                results.append(result)
+    write_summary(results, args.out)
+
+
+if __name__ == '__main__':
+    main()
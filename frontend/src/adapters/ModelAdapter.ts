@@ -23,4 +23,9 @@ export interface ModelAdapter {
   onDetection(cb: (d: Detection) => void): void;
   onStatus(cb: (s: ModelStatus) => void): void;
   processImage?(base64Image: string): Promise<Detection | null>;
+  // Classifies many files in one request; onResult fires per file as results arrive
+  processImages?(
+    files: File[],
+    onResult: (index: number, detection: Detection | null) => void
+  ): Promise<void>;
 }
@@ -1,5 +1,71 @@
 import type { Detection, Emotion, ModelAdapter, ModelStatus } from './ModelAdapter'
 
+// What the backend model needs (GET /capabilities, also included in /healthz)
+export interface Capabilities {
+  target_fps: number
+  capture: { short_side: number }
+  roi: { margin: number; face_side: number }
+}
+
+export type Box = { x: number; y: number; w: number; h: number }
+
+// Full frames sent between face crops, to pick up new faces and correct drift
+const ROI_REFRESH_FRAMES = 30
+
+// Region of the video to send around `face` (video pixels) and the size to shrink it to.
+// The server maps bboxes found in the crop back with roi_offset + bbox * roi_scale.
+export function planFaceCrop(
+  face: Box,
+  roi: Capabilities['roi'],
+  videoWidth: number,
+  videoHeight: number
+): { x0: number; y0: number; w: number; h: number; width: number; height: number; offset: [number, number]; scale: number } | null {
+  const x0 = Math.max(0, Math.floor(face.x - roi.margin * face.w))
+  const y0 = Math.max(0, Math.floor(face.y - roi.margin * face.h))
+  const x1 = Math.min(videoWidth, Math.ceil(face.x + face.w * (1 + roi.margin)))
+  const y1 = Math.min(videoHeight, Math.ceil(face.y + face.h * (1 + roi.margin)))
+  if (x1 <= x0 || y1 <= y0) return null
+  const shrink = Math.max(1, face.w / roi.face_side)
+  const width = Math.max(1, Math.round((x1 - x0) / shrink))
+  const height = Math.max(1, Math.round((y1 - y0) / shrink))
+  return { x0, y0, w: x1 - x0, h: y1 - y0, width, height, offset: [x0, y0], scale: (x1 - x0) / width }
+}
+
+// Call `onValue` with every JSON value of a newline-delimited JSON body, however it is chunked
+export async function readNdjson(body: ReadableStream<Uint8Array>, onValue: (value: any) => void): Promise<void> {
+  const reader = body.getReader()
+  const decoder = new TextDecoder()
+  let buffered = ''
+  const handleLine = (line: string) => {
+    if (line.trim()) onValue(JSON.parse(line))
+  }
+  for (;;) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffered += decoder.decode(value, { stream: true })
+    const lines = buffered.split('\n')
+    buffered = lines.pop() ?? ''
+    lines.forEach(handleLine)
+  }
+  handleLine(buffered + decoder.decode())
+}
+
+// Convert backend response to frontend Detection format; the bbox is
+// normalized by the size of the frame its pixel coordinates refer to
+export function toDetection(result: any, width?: number, height?: number): Detection {
+  return {
+    emotion: result.label as Emotion,
+    confidence: result.probability,
+    bbox: result.face_found && result.bbox && width && height ? {
+      x: result.bbox[0] / width,
+      y: result.bbox[1] / height,
+      w: result.bbox[2] / width,
+      h: result.bbox[3] / height
+    } : undefined,
+    timestamp: Date.now()
+  }
+}
+
 export default class RealModelAdapter implements ModelAdapter {
   private baseUrl: string
   private clientId: string
@@ -10,6 +76,17 @@ export default class RealModelAdapter implements ModelAdapter {
   private stream: MediaStream | null = null
   private videoElement: HTMLVideoElement | null = null
   private animationFrame: number | null = null
+  private socket: WebSocket | null = null
+  private framesSent = 0
+  private lastResultId = 0
+  private maxFramesInFlight = 2
+  private capabilities: Capabilities | null = null
+  private lastSentAt = 0
+  // Size of the frames sent on the socket, which stream bboxes are relative to
+  private streamFrameSize = { width: 1, height: 1 }
+  // Last face box in video pixels, and face crops sent since the last full frame
+  private lastFace: Box | null = null
+  private roiFrames = 0
 
   constructor(baseUrl: string = 'http://localhost:8000') {
     this.baseUrl = baseUrl
@@ -36,6 +113,7 @@ export default class RealModelAdapter implements ModelAdapter {
       
       const health = await response.json()
       console.log('Backend health check:', health)
+      this.capabilities = health.capabilities ?? null
       
       this.isLoaded = true
       this.notifyStatus('ready')
@@ -60,6 +138,9 @@ export default class RealModelAdapter implements ModelAdapter {
     this.videoElement = document.createElement('video')
     this.videoElement.srcObject = stream
     this.videoElement.play()
+
+    // Prefer a persistent streaming session; fall back to per-frame HTTP
+    this.openStream()
     
     // Start processing loop
     this.processFrame()
@@ -68,6 +149,11 @@ export default class RealModelAdapter implements ModelAdapter {
   stop(): void {
     this.isRunning = false
     this.stream = null
+
+    if (this.socket) {
+      this.socket.close()
+      this.socket = null
+    }
     
     if (this.animationFrame) {
       cancelAnimationFrame(this.animationFrame)
@@ -82,25 +168,138 @@ export default class RealModelAdapter implements ModelAdapter {
     this.notifyStatus('ready')
   }
 
-  private async processFrame(): Promise<void> {
-    if (!this.isRunning || !this.videoElement) return
-
+  private openStream(): void {
     try {
-      // Capture frame from video
+      const socket = new WebSocket(`${this.baseUrl.replace(/^http/, 'ws')}/ws/stream`)
+      socket.binaryType = 'arraybuffer'
+      this.framesSent = 0
+      this.lastResultId = 0
+      socket.onmessage = (event) => {
+        const result = JSON.parse(event.data as string)
+        if (typeof result.frame_id === 'number') {
+          this.lastResultId = Math.max(this.lastResultId, result.frame_id)
+        }
+        if (result.error) {
+          console.error('Stream error:', result.error)
+          return
+        }
+        this.notifyDetection(toDetection(result, this.streamFrameSize.width, this.streamFrameSize.height))
+      }
+      socket.onclose = () => {
+        if (this.socket === socket) this.socket = null
+      }
+      socket.onerror = () => socket.close()
+      this.socket = socket
+    } catch (error) {
+      console.error('Streaming unavailable, using HTTP:', error)
+      this.socket = null
+    }
+  }
+
+  private async sendStreamFrame(canvas: HTMLCanvasElement): Promise<void> {
+    // The server drops stale frames, so a small window keeps latency low
+    if (this.framesSent - this.lastResultId >= this.maxFramesInFlight) return
+    const blob = await new Promise<Blob | null>(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.8))
+    if (!blob || !this.socket || this.socket.readyState !== WebSocket.OPEN) return
+    this.socket.send(await blob.arrayBuffer())
+    this.streamFrameSize = { width: canvas.width, height: canvas.height }
+    this.framesSent++
+  }
+
+  // Scale that brings the frame down to what the server would shrink it to anyway
+  private captureScale(video: HTMLVideoElement): number {
+    const shortSide = this.capabilities?.capture.short_side
+    if (!shortSide) return 1
+    return Math.min(1, shortSide / Math.min(video.videoWidth, video.videoHeight))
+  }
+
+  // Crop around the last face, shrunk so the face is about the size the model uses
+  private cropFace(video: HTMLVideoElement, face: Box): { canvas: HTMLCanvasElement; offset: [number, number]; scale: number } | null {
+    const roi = this.capabilities?.roi
+    if (!roi) return null
+    const plan = planFaceCrop(face, roi, video.videoWidth, video.videoHeight)
+    if (!plan) return null
+    const canvas = document.createElement('canvas')
+    canvas.width = plan.width
+    canvas.height = plan.height
+    const ctx = canvas.getContext('2d')
+    if (!ctx) return null
+    ctx.drawImage(video, plan.x0, plan.y0, plan.w, plan.h, 0, 0, canvas.width, canvas.height)
+    return { canvas, offset: plan.offset, scale: plan.scale }
+  }
+
+  // One HTTP frame: a face crop while a face is tracked, else the whole (capture-sized) frame
+  private async predictFrame(video: HTMLVideoElement): Promise<Detection | null> {
+    const crop = this.lastFace && this.roiFrames < ROI_REFRESH_FRAMES ? this.cropFace(video, this.lastFace) : null
+    let body: Record<string, unknown>
+    let width = video.videoWidth
+    let height = video.videoHeight
+    if (crop) {
+      // The server maps the bbox back to video pixels using the offset and scale
+      body = {
+        image_base64: crop.canvas.toDataURL('image/jpeg', 0.8).split(',')[1],
+        roi_offset: crop.offset,
+        roi_scale: crop.scale
+      }
+      this.roiFrames++
+    } else {
+      const scale = this.captureScale(video)
       const canvas = document.createElement('canvas')
+      canvas.width = Math.round(video.videoWidth * scale)
+      canvas.height = Math.round(video.videoHeight * scale)
       const ctx = canvas.getContext('2d')
-      if (!ctx) return
+      if (!ctx) return null
+      ctx.drawImage(video, 0, 0, canvas.width, canvas.height)
+      body = { image_base64: canvas.toDataURL('image/jpeg', 0.8).split(',')[1] }
+      width = canvas.width
+      height = canvas.height
+      this.roiFrames = 0
+    }
 
-      canvas.width = this.videoElement.videoWidth
-      canvas.height = this.videoElement.videoHeight
-      ctx.drawImage(this.videoElement, 0, 0)
+    const result = await this.requestPrediction(body)
+    if (!result) return null
+    const detection = toDetection(result, width, height)
+    this.lastFace = detection.bbox ? {
+      x: detection.bbox.x * video.videoWidth,
+      y: detection.bbox.y * video.videoHeight,
+      w: detection.bbox.w * video.videoWidth,
+      h: detection.bbox.h * video.videoHeight
+    } : null
+    return detection
+  }
+
+  private async processFrame(): Promise<void> {
+    if (!this.isRunning || !this.videoElement) return
 
-      // Convert to base64
-      const imageData = canvas.toDataURL('image/jpeg', 0.8)
-      const base64Data = imageData.split(',')[1]
+    // No point sending faster than the server's advertised frame rate
+    const fps = this.capabilities?.target_fps
+    const now = performance.now()
+    if (fps && now - this.lastSentAt < 1000 / fps) {
+      this.animationFrame = requestAnimationFrame(() => this.processFrame())
+      return
+    }
+    this.lastSentAt = now
+
+    try {
+      if (this.socket && this.socket.readyState !== WebSocket.CLOSED) {
+        if (this.socket.readyState === WebSocket.OPEN) {
+          // Capture at the size the server would decode to anyway
+          const video = this.videoElement
+          const scale = this.captureScale(video)
+          const canvas = document.createElement('canvas')
+          const ctx = canvas.getContext('2d')
+          if (!ctx) return
+          canvas.width = Math.round(video.videoWidth * scale)
+          canvas.height = Math.round(video.videoHeight * scale)
+          ctx.drawImage(video, 0, 0, canvas.width, canvas.height)
+          await this.sendStreamFrame(canvas)
+        }
+        this.animationFrame = requestAnimationFrame(() => this.processFrame())
+        return
+      }
 
       // Send to backend
-      const detection = await this.predictImage(base64Data)
+      const detection = await this.predictFrame(this.videoElement)
       if (detection) {
         this.notifyDetection(detection)
       }
@@ -112,48 +311,66 @@ export default class RealModelAdapter implements ModelAdapter {
     this.animationFrame = requestAnimationFrame(() => this.processFrame())
   }
 
-  async processImage(base64Image: string): Promise<Detection | null> {
-    try {
-      const response = await fetch(`${this.baseUrl}/predict/base64`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-Client-Id': this.clientId
-        },
-        body: JSON.stringify({
-          image_base64: base64Image,
-          client_id: this.clientId
-        })
-      })
+  // POST /predict/base64; null when the frame was superseded by a newer one
+  private async requestPrediction(body: Record<string, unknown>): Promise<any | null> {
+    const response = await fetch(`${this.baseUrl}/predict/base64`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'X-Client-Id': this.clientId
+      },
+      body: JSON.stringify({ ...body, client_id: this.clientId })
+    })
 
-      if (!response.ok) {
-        throw new Error(`Prediction failed: ${response.status}`)
-      }
+    if (!response.ok) {
+      throw new Error(`Prediction failed: ${response.status}`)
+    }
 
-      const result = await response.json()
-      
-      // Convert backend response to frontend Detection format
-      const detection: Detection = {
-        emotion: result.label as Emotion,
-        confidence: result.probability,
-        bbox: result.face_found && result.bbox ? {
-          x: result.bbox[0] / this.videoElement!.videoWidth,
-          y: result.bbox[1] / this.videoElement!.videoHeight,
-          w: result.bbox[2] / this.videoElement!.videoWidth,
-          h: result.bbox[3] / this.videoElement!.videoHeight
-        } : undefined,
-        timestamp: Date.now()
-      }
+    const result = await response.json()
+    // A newer frame from this client replaced this one before it was classified
+    if (result.superseded) return null
+    return result
+  }
 
-      return detection
+  async processImage(base64Image: string): Promise<Detection | null> {
+    try {
+      const result = await this.requestPrediction({ image_base64: base64Image })
+      return result ? toDetection(result) : null
     } catch (error) {
       console.error('Image processing error:', error)
       return null
     }
   }
 
-  private async predictImage(base64Image: string): Promise<Detection | null> {
-    return this.processImage(base64Image)
+  async processImages(
+    files: File[],
+    onResult: (index: number, detection: Detection | null) => void
+  ): Promise<void> {
+    const form = new FormData()
+    files.forEach(file => form.append('image', file, file.name))
+    const response = await fetch(`${this.baseUrl}/predict/bulk`, {
+      method: 'POST',
+      headers: { 'X-Client-Id': this.clientId },
+      body: form
+    })
+    if (!response.ok || !response.body) {
+      throw new Error(`Bulk prediction failed: ${response.status}`)
+    }
+
+    // Newline-delimited JSON, one line per image in completion order, then a done line
+    await readNdjson(response.body, result => {
+      if (typeof result.index !== 'number') return
+      if (result.error) {
+        console.error(`Bulk prediction error for ${result.name}:`, result.error)
+        onResult(result.index, null)
+        return
+      }
+      onResult(result.index, {
+        emotion: result.label as Emotion,
+        confidence: result.probability,
+        timestamp: Date.now()
+      })
+    })
   }
 
   private notifyStatus(status: ModelStatus): void {
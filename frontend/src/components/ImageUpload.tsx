@@ -44,6 +44,32 @@ export default function ImageUpload({ adapter, onDetection }: ImageUploadProps)
     }
   };
 
+  const handleFilesSelect = async (files: File[]) => {
+    const images = files.filter(file => file.type.startsWith('image/'));
+    if (images.length <= 1 || !adapter?.processImages) {
+      if (files.length > 0) handleFileSelect(images[0] ?? files[0]);
+      return;
+    }
+
+    setIsProcessing(true);
+    if (previewUrl) URL.revokeObjectURL(previewUrl);
+    setPreviewUrl(URL.createObjectURL(images[0]));
+
+    try {
+      // One request for the whole selection; detections arrive as each image finishes
+      await adapter.processImages(images, (_index, detection) => {
+        if (detection) {
+          onDetection(detection);
+        }
+      });
+    } catch (error) {
+      console.error('Error processing images:', error);
+      alert('Error processing images. Please try again.');
+    } finally {
+      setIsProcessing(false);
+    }
+  };
+
   const fileToBase64 = (file: File): Promise<string> => {
     return new Promise((resolve, reject) => {
       const reader = new FileReader();
@@ -69,14 +95,14 @@ export default function ImageUpload({ adapter, onDetection }: ImageUploadProps)
     
     const files = Array.from(e.dataTransfer.files);
     if (files.length > 0) {
-      handleFileSelect(files[0]);
+      handleFilesSelect(files);
     }
   };
 
   const handleFileInputChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     const files = e.target.files;
     if (files && files.length > 0) {
-      handleFileSelect(files[0]);
+      handleFilesSelect(Array.from(files));
     }
   };
 
@@ -171,6 +197,7 @@ export default function ImageUpload({ adapter, onDetection }: ImageUploadProps)
         ref={fileInputRef}
         type="file"
         accept="image/*"
+        multiple
         onChange={handleFileInputChange}
         className="hidden"
       />
@@ -0,0 +1,88 @@
+import { afterEach, expect, it, vi } from 'vitest'
+import RealModelAdapter, { planFaceCrop, readNdjson, toDetection } from '../src/adapters/RealModelAdapter'
+
+
+// A response body delivered in the given chunks, split wherever the test says
+function chunkedBody(chunks: (string | Uint8Array)[]): ReadableStream<Uint8Array> {
+  const encoder = new TextEncoder()
+  return new ReadableStream({
+    start(controller) {
+      chunks.forEach(chunk => controller.enqueue(typeof chunk === 'string' ? encoder.encode(chunk) : chunk))
+      controller.close()
+    }
+  })
+}
+
+afterEach(() => {
+  vi.unstubAllGlobals()
+  vi.restoreAllMocks()
+})
+
+it('parses NDJSON lines split across chunks', async () => {
+  const values: any[] = []
+  await readNdjson(chunkedBody([
+    '{"index":0,"label":"hap',
+    'py"}\n{"index":1,',
+    '"label":"sad"}\n',
+    '{"done":true,"count":2}'
+  ]), value => values.push(value))
+  expect(values).toEqual([
+    { index: 0, label: 'happy' },
+    { index: 1, label: 'sad' },
+    { done: true, count: 2 }
+  ])
+})
+
+it('keeps multibyte characters split across chunks intact', async () => {
+  const bytes = new TextEncoder().encode('{"name":"café.jpg"}\n')
+  const cut = bytes.indexOf(0xc3) + 1
+  const values: any[] = []
+  await readNdjson(chunkedBody([bytes.slice(0, cut), bytes.slice(cut)]), value => values.push(value))
+  expect(values).toEqual([{ name: 'café.jpg' }])
+})
+
+it('reports bulk results by upload index, errors as null', async () => {
+  const body = chunkedBody([
+    '{"index":1,"name":"b.jpg","label":"sad","probability":0.7}\n{"index":0,"na',
+    'me":"a.jpg","error":"Failed to decode image"}\n{"done":true,"count":2,"errors":1}\n'
+  ])
+  vi.stubGlobal('fetch', vi.fn(async () => new Response(body)))
+  vi.spyOn(console, 'error').mockImplementation(() => {})
+  const adapter = new RealModelAdapter('http://backend')
+  const results: [number, any][] = []
+
+  await adapter.processImages([new File(['a'], 'a.jpg'), new File(['b'], 'b.jpg')], (i, d) => results.push([i, d]))
+
+  expect(results.map(([i, d]) => [i, d?.emotion ?? null])).toEqual([[1, 'sad'], [0, null]])
+  expect(results[0][1].confidence).toBe(0.7)
+})
+
+it('maps a bbox found in the face crop back to the video face', () => {
+  const face = { x: 200, y: 100, w: 80, h: 80 }
+  const plan = planFaceCrop(face, { margin: 0.25, face_side: 48 }, 640, 480)!
+  expect(plan.offset).toEqual([180, 80])
+  expect([plan.width, plan.height]).toEqual([72, 72])
+
+  // Where the face appears in the uploaded (shrunk) crop, and the server's roi_to_frame
+  const inCrop = [(face.x - 180) / plan.scale, (face.y - 80) / plan.scale, face.w / plan.scale, face.h / plan.scale]
+  const [ox, oy] = plan.offset
+  const bbox = [ox + inCrop[0] * plan.scale, oy + inCrop[1] * plan.scale, inCrop[2] * plan.scale, inCrop[3] * plan.scale]
+  expect(bbox.map(Math.round)).toEqual([200, 100, 80, 80])
+
+  // The response is normalized by the video size, not the crop size
+  const detection = toDetection({ label: 'happy', probability: 0.9, face_found: true, bbox }, 640, 480)
+  expect(detection.bbox!.x).toBeCloseTo(200 / 640)
+  expect(detection.bbox!.w).toBeCloseTo(80 / 640)
+})
+
+it('clamps the crop to the video edges', () => {
+  const plan = planFaceCrop({ x: 5, y: 5, w: 40, h: 40 }, { margin: 0.25, face_side: 48 }, 50, 50)!
+  expect(plan.offset).toEqual([0, 0])
+  expect([plan.w, plan.h]).toEqual([50, 50])
+  // Faces smaller than face_side are sent at full resolution
+  expect(plan.scale).toBe(1)
+})
+
+it('omits the bbox when no face was found', () => {
+  expect(toDetection({ label: 'neutral', probability: 0.5, face_found: false }, 640, 480).bbox).toBeUndefined()
+})